@@ -0,0 +1,7 @@
+"""
+This package contains the benchmark and load-test harness, which seeds a
+synthetic pq table, measures the latency and throughput of the API and CLI
+against it and writes a JSON report comparable across commits.
+
+Run it with `python -m benchmarks --help`.
+"""
@@ -0,0 +1,472 @@
+"""Entrypoint script for running benchmarks, with `python -m benchmarks`"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import requests
+
+from pq_dashboard.config import settings
+
+
+def parse_levels(value: str) -> List[int]:
+    try:
+        levels = [int(level) for level in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid concurrency levels: {value!r}")
+
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError(f"invalid concurrency levels: {value!r}")
+
+    return levels
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "python -m benchmarks",
+        description="Benchmark the pq-dashboard API and CLI against a synthetic queue table",
+    )
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    seed_arguments = argparse.ArgumentParser(add_help=False)
+    seed_arguments.add_argument(
+        "--table",
+        default="pq_dashboard_benchmark",
+        help="Queue table to seed and benchmark against (default: pq_dashboard_benchmark)",
+    )
+    seed_arguments.add_argument(
+        "--rows", type=int, default=100000, help="Items to seed (default: 100000)"
+    )
+    seed_arguments.add_argument(
+        "--queues",
+        type=int,
+        default=50,
+        help="Queues to spread items over (default: 50)",
+    )
+    seed_arguments.add_argument(
+        "--processed-ratio",
+        type=float,
+        default=0.5,
+        help="Share of processed items (default: 0.5)",
+    )
+    seed_arguments.add_argument(
+        "--pickle-ratio",
+        type=float,
+        default=0.3,
+        help="Share of pickled payloads (default: 0.3)",
+    )
+    seed_arguments.add_argument(
+        "--seed", type=int, default=0, help="Random seed (default: 0)"
+    )
+
+    subparsers.add_parser(
+        "seed", parents=[seed_arguments], help="(Re)create and seed the benchmark table"
+    )
+
+    run_subparser = subparsers.add_parser(
+        "run", parents=[seed_arguments], help="Seed the table, benchmark, and report"
+    )
+    run_subparser.add_argument(
+        "--reuse",
+        action="store_true",
+        help="Benchmark the existing table as is, instead of seeding it again",
+    )
+    run_subparser.add_argument(
+        "--url",
+        default=None,
+        help="Benchmark this running server, instead of starting one. It must use --table",
+    )
+    run_subparser.add_argument(
+        "--concurrency",
+        type=parse_levels,
+        default=[1, 8, 32],
+        help="Comma-separated concurrent API request levels (default: 1,8,32)",
+    )
+    run_subparser.add_argument(
+        "--requests",
+        type=int,
+        default=200,
+        help="Requests per API scenario and level (default: 200)",
+    )
+    run_subparser.add_argument(
+        "--cli-concurrency",
+        type=parse_levels,
+        default=[1, 4],
+        help="Comma-separated concurrent CLI command levels (default: 1,4)",
+    )
+    run_subparser.add_argument(
+        "--cli-calls",
+        type=int,
+        default=8,
+        help="Runs per CLI scenario and level (default: 8)",
+    )
+    run_subparser.add_argument(
+        "--warmup",
+        type=int,
+        default=5,
+        help="Unmeasured calls per scenario (default: 5)",
+    )
+    run_subparser.add_argument(
+        "--only", default=None, help="Only run scenarios whose name contains this"
+    )
+    run_subparser.add_argument(
+        "--no-cli", action="store_true", help="Only benchmark the API"
+    )
+    run_subparser.add_argument(
+        "--output",
+        "-o",
+        default="benchmark.json",
+        help="File to write the report to (default: benchmark.json)",
+    )
+
+    serialization_subparser = subparsers.add_parser(
+        "serialization",
+        help="Compare item page encoding paths, without a database",
+    )
+    serialization_subparser.add_argument(
+        "--page-sizes",
+        type=parse_levels,
+        default=[25, 100, 500],
+        help="Comma-separated items per page (default: 25,100,500)",
+    )
+    serialization_subparser.add_argument(
+        "--repeat",
+        type=int,
+        default=50,
+        help="Pages encoded per path and size (default: 50)",
+    )
+    serialization_subparser.add_argument(
+        "--output",
+        "-o",
+        default="benchmark.json",
+        help="File to write the report to (default: benchmark.json)",
+    )
+
+    pages_subparser = subparsers.add_parser(
+        "pages",
+        parents=[seed_arguments],
+        help="Compare item page queries: page then counts, or both in one statement",
+    )
+    pages_subparser.add_argument(
+        "--reuse",
+        action="store_true",
+        help="Benchmark the existing table as is, instead of seeding it again",
+    )
+    pages_subparser.add_argument(
+        "--limit", type=int, default=25, help="Items per page (default: 25)"
+    )
+    pages_subparser.add_argument(
+        "--repeat",
+        type=int,
+        default=10,
+        help="Pages fetched per query path and page (default: 10)",
+    )
+    pages_subparser.add_argument(
+        "--output",
+        "-o",
+        default="benchmark.json",
+        help="File to write the report to (default: benchmark.json)",
+    )
+
+    compare_subparser = subparsers.add_parser(
+        "compare", help="Compare two reports, failing on regressions"
+    )
+    compare_subparser.add_argument("base", help="Report to compare against")
+    compare_subparser.add_argument("head", help="Report being compared")
+    compare_subparser.add_argument(
+        "--metric",
+        choices=["mean", "p50", "p90", "p99", "max"],
+        default="p50",
+        help="Latency compared (default: p50)",
+    )
+    compare_subparser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown counted as a regression (default: 0.1)",
+    )
+
+    return parser
+
+
+def log(message: str = "", end: str = "\n"):
+    print(message, end=end, file=sys.stderr, flush=True)
+
+
+def seed(connection, flags) -> dict:
+    from benchmarks.seed import seed_table
+
+    log(f"Seeding {flags.rows} items into {flags.table}...")
+
+    def progress(done: int):
+        log(f"\r  Seeded {done} items", end="")
+
+    seeded = seed_table(
+        connection,
+        flags.table,
+        flags.rows,
+        queues=flags.queues,
+        processed_ratio=flags.processed_ratio,
+        pickle_ratio=flags.pickle_ratio,
+        seed=flags.seed,
+        progress=progress,
+    )
+    log(f"\n  Done in {seeded['duration']:.1f}s")
+
+    return seeded
+
+
+@contextmanager
+def serve(url: str = None) -> Iterator[str]:
+    """Start a dashboard server on a free port, unless given one's URL"""
+    if url is not None:
+        yield url.rstrip("/")
+        return
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "pq_dashboard.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "error",
+        ],
+        env={**os.environ, "PQ_DASH_QUEUE_TABLE": settings.QUEUE_TABLE},
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{url}/api/v1/health/check").ok:
+                    break
+            except requests.ConnectionError:
+                pass
+
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The dashboard server did not start")
+            time.sleep(0.1)
+
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def make_import_file(connection, queue_name: str) -> str:
+    """Export a queue to a temporary file, for the import scenario"""
+    from pq_dashboard.data.export import export_items
+
+    file = tempfile.NamedTemporaryFile(
+        "w", suffix=".ndjson", prefix="pq-dashboard-benchmark-", delete=False
+    )
+    with file:
+        for chunk in export_items(connection, queue_name=queue_name):
+            file.write(chunk)
+
+    return file.name
+
+
+def run(flags) -> dict:
+    from benchmarks.load import run_concurrently
+    from benchmarks.report import build_report, format_results, get_environment
+    from benchmarks.scenarios import get_cli_scenarios, get_http_scenarios, get_targets
+    from benchmarks.seed import get_table_rows
+    from pq_dashboard.connection import get_connection
+
+    connection = get_connection()
+    rows = get_table_rows(connection, flags.table)
+
+    if flags.reuse and rows:
+        log(f"Reusing the {rows} items in {flags.table}")
+        seeded = {"table": flags.table, "rows": rows, "reused": True}
+    else:
+        seeded = seed(connection, flags)
+        rows = flags.rows
+
+    with connection.cursor() as cursor:
+        environment = get_environment(cursor)
+        cursor.execute(
+            f"SELECT q_name FROM {flags.table} GROUP BY q_name ORDER BY COUNT(*) LIMIT 1"
+        )
+        small_queue = cursor.fetchone()[0]
+    connection.commit()
+
+    import_file = make_import_file(connection, small_queue)
+
+    # Enough processed items for every call consuming them, warmups included:
+    # one or ten per call
+    calls = (flags.requests + flags.warmup) * len(flags.concurrency)
+    consumed = (2 + 2 * 10) * calls
+    if not flags.no_cli:
+        consumed += 2 * 10 * flags.cli_calls * len(flags.cli_concurrency)
+
+    results = []
+
+    def measure(kind: str, scenario, levels: List[int], calls: int):
+        if flags.only and flags.only not in scenario.name:
+            return
+
+        if scenario.serial:
+            levels, calls, warmup = [1], 1, 0
+        else:
+            warmup = flags.warmup if kind == "http" else 0
+
+        for concurrency in levels:
+            log(f"  {scenario.name} x{concurrency}", end="")
+            result = run_concurrently(scenario.call, calls, concurrency, warmup)
+            log(
+                f": {result['throughput']:.1f} calls/s"
+                + (f", {result['errors']} errors" if result["errors"] else "")
+            )
+            results.append(
+                {
+                    "kind": kind,
+                    "name": scenario.name,
+                    "concurrency": concurrency,
+                    **result,
+                }
+            )
+
+    try:
+        with serve(flags.url) as url:
+            with connection.cursor() as cursor:
+                targets = get_targets(cursor, url, rows, consumed, import_file)
+            connection.commit()
+
+            log("Benchmarking the API...")
+            for scenario in get_http_scenarios(url, targets):
+                measure("http", scenario, flags.concurrency, flags.requests)
+
+        if not flags.no_cli:
+            log("Benchmarking the CLI...")
+            for scenario in get_cli_scenarios(targets):
+                measure("cli", scenario, flags.cli_concurrency, flags.cli_calls)
+    finally:
+        connection.close()
+        os.unlink(import_file)
+
+    options = {
+        key: value
+        for key, value in vars(flags).items()
+        if key not in ("subcommand", "output")
+    }
+    report = build_report(environment, seeded, options, results)
+
+    log()
+    log(format_results(results))
+
+    return report
+
+
+def pages(flags) -> dict:
+    from benchmarks.pages import run_pages
+    from benchmarks.report import build_report, format_results, get_environment
+    from benchmarks.seed import get_table_rows
+    from pq_dashboard.connection import get_connection
+
+    connection = get_connection()
+    try:
+        rows = get_table_rows(connection, flags.table)
+
+        if flags.reuse and rows:
+            log(f"Reusing the {rows} items in {flags.table}")
+            seeded = {"table": flags.table, "rows": rows, "reused": True}
+        else:
+            seeded = seed(connection, flags)
+
+        with connection.cursor() as cursor:
+            environment = get_environment(cursor)
+        connection.commit()
+
+        log("Benchmarking item page queries...")
+        results = run_pages(connection, flags.table, flags.limit, flags.repeat)
+    finally:
+        connection.close()
+
+    options = {"limit": flags.limit, "repeat": flags.repeat}
+    log(format_results(results))
+
+    return build_report(environment, seeded, options, results)
+
+
+def main():
+    flags = get_parser().parse_args()
+
+    if flags.subcommand == "compare":
+        from benchmarks.report import compare_reports, format_comparisons, read_report
+
+        comparisons, regressions = compare_reports(
+            read_report(flags.base),
+            read_report(flags.head),
+            metric=flags.metric,
+            threshold=flags.threshold,
+        )
+        print(format_comparisons(comparisons, flags.metric))
+
+        if regressions:
+            print()
+            print(f"{len(regressions)} regressions over {flags.threshold:.0%}")
+            sys.exit(1)
+        return
+
+    if flags.subcommand == "serialization":
+        from benchmarks.report import (
+            build_report,
+            format_results,
+            get_environment,
+            write_report,
+        )
+        from benchmarks.serialization import run_serialization
+
+        results = run_serialization(flags.page_sizes, flags.repeat)
+        options = {"page_sizes": flags.page_sizes, "repeat": flags.repeat}
+        write_report(
+            build_report(get_environment(), None, options, results), flags.output
+        )
+        log(format_results(results))
+        log(f"\nReport written to {flags.output}")
+        return
+
+    settings.QUEUE_TABLE = flags.table
+    os.environ["PQ_DASH_QUEUE_TABLE"] = flags.table
+
+    if flags.subcommand == "seed":
+        from pq_dashboard.connection import get_connection
+
+        connection = get_connection()
+        try:
+            seed(connection, flags)
+        finally:
+            connection.close()
+
+    elif flags.subcommand == "run":
+        from benchmarks.report import write_report
+
+        report = run(flags)
+        write_report(report, flags.output)
+        log(f"\nReport written to {flags.output}")
+
+    elif flags.subcommand == "pages":
+        from benchmarks.report import write_report
+
+        report = pages(flags)
+        write_report(report, flags.output)
+        log(f"\nReport written to {flags.output}")
+
+
+if __name__ == "__main__":
+    main()
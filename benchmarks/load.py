@@ -0,0 +1,83 @@
+"""This module contains helper methods for generating load and summarizing latencies"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+
+def get_quantile(latencies: List[float], quantile: float) -> Optional[float]:
+    """Nearest-rank quantile of sorted latencies"""
+    if not latencies:
+        return None
+
+    rank = max(math.ceil(quantile * len(latencies)) - 1, 0)
+    return latencies[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """Summarize the latencies, in seconds, of the calls of one run"""
+    latencies = sorted(latencies)
+    calls = len(latencies) + errors
+
+    return {
+        "calls": calls,
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": {
+            "min": latencies[0] if latencies else None,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": get_quantile(latencies, 0.5),
+            "p90": get_quantile(latencies, 0.9),
+            "p99": get_quantile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def run_concurrently(
+    call: Callable[[int], bool], calls: int, concurrency: int, warmup: int = 0
+) -> dict:
+    """Make `calls` calls from `concurrency` threads, and summarize them
+
+    Args:
+        call (Callable[[int], bool]): Makes the call with the given number,
+            returning whether it succeeded. Exceptions count as errors
+        calls (int): Number of calls to measure
+        concurrency (int): Number of calls in flight at any time
+        warmup (int, optional): Calls to make, unmeasured, beforehand
+    """
+
+    def attempt(number: int) -> Optional[float]:
+        started = time.perf_counter()
+        try:
+            succeeded = call(number)
+        except Exception:
+            succeeded = False
+
+        return time.perf_counter() - started if succeeded else None
+
+    for number in range(warmup):
+        attempt(-1 - number)
+
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def record(number: int):
+        nonlocal errors
+
+        latency = attempt(number)
+        with lock:
+            if latency is None:
+                errors += 1
+            else:
+                latencies.append(latency)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(record, range(calls)))
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, errors, elapsed)
@@ -0,0 +1,98 @@
+"""
+This module contains the item page query benchmark, comparing fetching a
+page and then counting its items with fetching both in one statement
+"""
+import time
+from typing import Callable, List, Tuple
+
+from benchmarks.load import summarize
+from pq_dashboard.data.items import get_item_counts, get_items, get_items_and_counts
+from pq_dashboard.data.search import SearchMode
+from pq_dashboard.schema.item import ItemState
+
+COUNT_FILTERS = ("queue_name", "search", "search_mode")
+
+
+def sequential_page(cursor, **page):
+    """The page, then its counts, the way item pages used to be fetched"""
+    get_items(cursor, **page)
+    get_item_counts(
+        cursor, **{key: value for key, value in page.items() if key in COUNT_FILTERS}
+    )
+
+
+def single_page(cursor, **page):
+    get_items_and_counts(cursor, **page)
+
+
+PATHS = [
+    ("sequential", sequential_page),
+    ("single statement", single_page),
+]
+
+
+def get_pages(cursor, table: str) -> List[Tuple[str, dict]]:
+    """Item pages worth comparing, as names and `get_items` arguments"""
+    cursor.execute(
+        f"SELECT q_name FROM {table} GROUP BY q_name ORDER BY COUNT(*) DESC LIMIT 1"
+    )
+    queue_name = cursor.fetchone()[0]
+
+    return [
+        ("first page", {}),
+        ("queue", {"queue_name": queue_name}),
+        ("processed", {"state": ItemState.processed}),
+        ("newest", {"order_by": "enqueuedAt_DESC"}),
+        ("deep page", {"offset": 10000}),
+        ("text search", {"search": "invoice", "search_mode": SearchMode.text}),
+        (
+            "containment search",
+            {"search": '{"kind": "invoice"}', "search_mode": SearchMode.contains},
+        ),
+    ]
+
+
+def measure(
+    cursor, paths: List[Tuple[str, Callable]], page: dict, repeat: int
+) -> List[dict]:
+    """Time each path fetching a page, alternating between paths so that
+    they see the same cache conditions"""
+    for _, fetch in paths:
+        fetch(cursor, **page)
+
+    latencies = {name: [] for name, _ in paths}
+    elapsed = {name: 0.0 for name, _ in paths}
+
+    for _ in range(repeat):
+        for name, fetch in paths:
+            started = time.perf_counter()
+            fetch(cursor, **page)
+            latency = time.perf_counter() - started
+
+            latencies[name].append(latency)
+            elapsed[name] += latency
+
+    return [summarize(latencies[name], 0, elapsed[name]) for name, _ in paths]
+
+
+def run_pages(connection, table: str, limit: int, repeat: int) -> List[dict]:
+    """Time fetching item pages of the table with each path"""
+    results = []
+
+    with connection.cursor() as cursor:
+        for page_name, page in get_pages(cursor, table):
+            page = {"limit": limit, **page}
+
+            for (name, _), result in zip(PATHS, measure(cursor, PATHS, page, repeat)):
+                results.append(
+                    {
+                        "kind": "pages",
+                        "name": f"{page_name} ({name})",
+                        "concurrency": 1,
+                        **result,
+                    }
+                )
+
+            connection.rollback()
+
+    return results
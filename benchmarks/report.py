@@ -0,0 +1,190 @@
+"""This module contains helper methods for writing and comparing benchmark reports"""
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Bumped whenever the structure of reports changes
+REPORT_VERSION = 1
+
+
+def get_version(module: str) -> Optional[str]:
+    try:
+        return __import__(module).__version__
+    except ImportError:
+        return None
+
+
+def get_commit() -> Optional[dict]:
+    """The checked out commit, and whether the tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return {"sha": commit, "dirty": bool(status.strip())}
+
+
+def get_environment(cursor=None) -> dict:
+    """Versions and settings the results depend on, Postgres' if given a cursor"""
+    from pq_dashboard.config import settings
+
+    postgres = None
+    if cursor is not None:
+        cursor.execute("SHOW server_version")
+        postgres = cursor.fetchone()[0]
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "orjson": get_version("orjson"),
+        "postgres": postgres,
+        "settings": {
+            key: value
+            for key, value in settings.dict().items()
+            if key.startswith(("POOL_", "DB_", "COUNT_", "PREVIEW_"))
+        },
+    }
+
+
+def build_report(
+    environment: dict, seed: dict, options: dict, results: List[dict]
+) -> dict:
+    return {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": get_commit(),
+        "environment": environment,
+        "seed": seed,
+        "options": options,
+        "results": results,
+    }
+
+
+def get_key(result: dict) -> Tuple[str, str, int]:
+    return result["kind"], result["name"], result["concurrency"]
+
+
+def format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def format_results(results: List[dict]) -> str:
+    """Format results as a plain text table, latencies in milliseconds"""
+    header = ["scenario", "conc", "calls", "errors", "req/s", "p50", "p90", "p99"]
+    rows = [
+        [
+            result["name"],
+            str(result["concurrency"]),
+            str(result["calls"]),
+            str(result["errors"]),
+            f"{result['throughput']:.1f}",
+            format_ms(result["latency"]["p50"]),
+            format_ms(result["latency"]["p90"]),
+            format_ms(result["latency"]["p99"]),
+        ]
+        for result in results
+    ]
+
+    return format_table(header, rows)
+
+
+def format_table(header: List[str], rows: List[List[str]]) -> str:
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+
+    def line(row: List[str]) -> str:
+        return "  ".join(
+            cell.ljust(width) if index == 0 else cell.rjust(width)
+            for index, (cell, width) in enumerate(zip(row, widths))
+        ).rstrip()
+
+    return "\n".join(
+        [line(header), line(["-" * width for width in widths])]
+        + [line(row) for row in rows]
+    )
+
+
+def compare_reports(
+    base: dict, head: dict, metric: str = "p50", threshold: float = 0.1
+) -> Tuple[List[dict], List[dict]]:
+    """Compare the results two reports have in common
+
+    Args:
+        base (dict): Report to compare against
+        head (dict): Report being compared
+        metric (str, optional): Latency metric compared. Defaults to p50
+        threshold (float, optional): Relative slowdown beyond which a
+            result is a regression. Defaults to 0.1 (10%)
+
+    Returns:
+        Tuple[List[dict], List[dict]]: Every comparison, and the regressions
+    """
+    base_results: Dict[tuple, dict] = {get_key(r): r for r in base["results"]}
+    comparisons = []
+
+    for result in head["results"]:
+        previous = base_results.get(get_key(result))
+        if previous is None:
+            continue
+
+        before = previous["latency"][metric]
+        after = result["latency"][metric]
+        change = (after - before) / before if before and after is not None else None
+
+        comparisons.append(
+            {
+                "kind": result["kind"],
+                "name": result["name"],
+                "concurrency": result["concurrency"],
+                "before": before,
+                "after": after,
+                "change": change,
+                "throughput_before": previous["throughput"],
+                "throughput_after": result["throughput"],
+                "regression": change is not None and change > threshold,
+            }
+        )
+
+    return comparisons, [c for c in comparisons if c["regression"]]
+
+
+def format_comparisons(comparisons: List[dict], metric: str) -> str:
+    header = ["scenario", "conc", f"{metric} before", f"{metric} after", "change", ""]
+    rows = [
+        [
+            comparison["name"],
+            str(comparison["concurrency"]),
+            format_ms(comparison["before"]),
+            format_ms(comparison["after"]),
+            "-" if comparison["change"] is None else f"{comparison['change']:+.1%}",
+            "REGRESSION" if comparison["regression"] else "",
+        ]
+        for comparison in comparisons
+    ]
+
+    return format_table(header, rows)
+
+
+def write_report(report: dict, path: str):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+
+def read_report(path: str) -> dict:
+    with open(path) as file:
+        report = json.load(file)
+
+    if report.get("version") != REPORT_VERSION:
+        raise ValueError(f"{path} is not a version {REPORT_VERSION} benchmark report")
+
+    return report
@@ -0,0 +1,317 @@
+"""
+This module contains the benchmark scenarios: one or more calls to every v1
+API endpoint and every CLI command, against a seeded table
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from typing import Callable, List, NamedTuple, Optional
+
+import requests
+
+from pq_dashboard.config import settings
+
+# Deletes and cleanups are given a cutoff no seeded item reaches, so they
+# measure finding what to delete without emptying the table
+NOTHING_OLDER_THAN = 10 * 365 * 86400
+
+CLI_COMMAND = [sys.executable, "-c", "from pq_dashboard.cli import main; main()"]
+
+
+class Targets(NamedTuple):
+    """Items and queues of the seeded table the scenarios are run against"""
+
+    big_queue: str
+    small_queue: str
+    item_ids: List[int]
+    large_item_id: Optional[int]
+    page_token: Optional[str]
+    deep_offset: int
+    ids: "IdPool"
+    import_file: str
+
+
+class IdPool:
+    """Thread-safe supply of processed item IDs, for calls which consume them"""
+
+    def __init__(self, ids: List[int]):
+        self._ids = list(ids)
+        self._lock = threading.Lock()
+
+    def take(self, count: int = 1) -> List[int]:
+        with self._lock:
+            if len(self._ids) < count:
+                raise ValueError("Ran out of item IDs, seed more processed items")
+
+            taken, self._ids = self._ids[:count], self._ids[count:]
+
+        return taken
+
+
+class Scenario(NamedTuple):
+    """One benchmarked operation
+
+    `call` makes one call given its number, returning whether it succeeded.
+    Serial scenarios change the schema, so they are run once, in order,
+    rather than at every concurrency level.
+    """
+
+    name: str
+    call: Callable[[int], bool]
+    serial: bool = False
+
+
+def get_targets(
+    cursor, base_url: str, rows: int, processed_ids: int, import_file: str
+) -> Targets:
+    """Pick the items and queues the scenarios act on"""
+    cursor.execute(
+        f"SELECT q_name, COUNT(*) FROM {settings.QUEUE_TABLE} "
+        "GROUP BY q_name ORDER BY COUNT(*) DESC"
+    )
+    queues = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(
+        f"SELECT id FROM {settings.QUEUE_TABLE} ORDER BY random() LIMIT 1000"
+    )
+    item_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(
+        f"SELECT id FROM {settings.QUEUE_TABLE} "
+        "WHERE octet_length(data::text) > %s LIMIT 1",
+        (settings.PREVIEW_SIZE,),
+    )
+    large = cursor.fetchone()
+
+    cursor.execute(
+        f"SELECT id FROM {settings.QUEUE_TABLE} "
+        "WHERE dequeued_at IS NOT NULL ORDER BY id DESC LIMIT %s",
+        (processed_ids,),
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+
+    page = requests.get(f"{base_url}/api/v1/items/", params={"limit": 100}).json()
+
+    return Targets(
+        big_queue=queues[0],
+        small_queue=queues[-1],
+        item_ids=item_ids,
+        large_item_id=large[0] if large else None,
+        page_token=page.get("next_after"),
+        deep_offset=rows // 2,
+        ids=IdPool(ids),
+        import_file=import_file,
+    )
+
+
+def get_http_scenarios(base_url: str, targets: Targets) -> List[Scenario]:
+    """Scenarios covering every endpoint of the v1 API, and /metrics"""
+    local = threading.local()
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def request(method: str, path: str, params=None, body=None) -> bool:
+        response = session().request(
+            method, f"{base_url}{path}", params=params, json=body
+        )
+        return response.ok
+
+    def get(path: str, **params) -> Callable[[int], bool]:
+        return lambda number: request("GET", path, params)
+
+    def first_event(number: int) -> bool:
+        with session().get(f"{base_url}/api/v1/queues/events", stream=True) as response:
+            for line in response.iter_lines():
+                if line.startswith(b"data:"):
+                    return True
+        return False
+
+    def random_id(number: int) -> int:
+        return targets.item_ids[number % len(targets.item_ids)]
+
+    def take(count: int) -> List[int]:
+        return targets.ids.take(count)
+
+    items = "/api/v1/items"
+    queues = "/api/v1/queues"
+    never = {"older_than": NOTHING_OLDER_THAN}
+
+    return [
+        Scenario("GET items", get(f"{items}/")),
+        Scenario("GET items?queue", get(f"{items}/", queue=targets.big_queue)),
+        Scenario("GET items?state=processed", get(f"{items}/", state="processed")),
+        Scenario(
+            "GET items?order_by=queue_DESC", get(f"{items}/", order_by="queue_DESC")
+        ),
+        Scenario("GET items?offset=100", get(f"{items}/", offset=100)),
+        Scenario("GET items?offset=deep", get(f"{items}/", offset=targets.deep_offset)),
+        Scenario("GET items?after", get(f"{items}/", after=targets.page_token)),
+        Scenario(
+            "GET items?search=text",
+            get(f"{items}/", search="invoice", search_mode="text"),
+        ),
+        Scenario(
+            "GET items?search=contains",
+            get(
+                f"{items}/",
+                search=json.dumps({"kind": "invoice"}),
+                search_mode="contains",
+            ),
+        ),
+        Scenario(
+            "GET items?search=path",
+            get(f"{items}/", search="$.attempt > 2", search_mode="path"),
+        ),
+        Scenario("GET items/search-indexes", get(f"{items}/search-indexes")),
+        Scenario(
+            "GET items/{id}",
+            lambda number: request("GET", f"{items}/{random_id(number)}"),
+        ),
+        Scenario(
+            "GET items/{id}/payload",
+            get(f"{items}/{targets.large_item_id}/payload"),
+        ),
+        Scenario("GET items/export", get(f"{items}/export", queue=targets.small_queue)),
+        Scenario(
+            "GET items/export?format=csv",
+            get(f"{items}/export", queue=targets.small_queue, format="csv"),
+        ),
+        Scenario(
+            "POST items/{id}/requeue",
+            lambda number: request("POST", f"{items}/{take(1)[0]}/requeue"),
+        ),
+        Scenario(
+            "DELETE items/{id}",
+            lambda number: request("DELETE", f"{items}/{take(1)[0]}"),
+        ),
+        Scenario(
+            "POST items/bulk/requeue",
+            lambda number: request(
+                "POST", f"{items}/bulk/requeue", body={"ids": take(10)}
+            ),
+        ),
+        Scenario(
+            "POST items/bulk/delete",
+            lambda number: request(
+                "POST", f"{items}/bulk/delete", body={"ids": take(10)}
+            ),
+        ),
+        Scenario("GET queues", get(f"{queues}/")),
+        Scenario("GET queues/events", first_event),
+        Scenario(
+            "GET queues/{name}/metrics", get(f"{queues}/{targets.big_queue}/metrics")
+        ),
+        Scenario(
+            "POST queues/{name}/delete-queued",
+            lambda number: request(
+                "POST", f"{queues}/{targets.big_queue}/delete-queued", never
+            ),
+        ),
+        Scenario(
+            "POST queues/{name}/delete-processed",
+            lambda number: request(
+                "POST", f"{queues}/{targets.big_queue}/delete-processed", never
+            ),
+        ),
+        Scenario("GET health/check", get("/api/v1/health/check")),
+        Scenario("GET health/pool", get("/api/v1/health/pool")),
+        Scenario("GET health/retention", get("/api/v1/health/retention")),
+        Scenario("GET health/timings", get("/api/v1/health/timings")),
+        Scenario("GET health/config", get("/api/v1/health/config")),
+        Scenario("GET /metrics", get("/metrics")),
+    ]
+
+
+def run_cli(args: List[str], env: dict = None) -> bool:
+    """Run a CLI command to completion, discarding its output"""
+    completed = subprocess.run(
+        CLI_COMMAND + args,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return completed.returncode == 0
+
+
+def get_cli_scenarios(targets: Targets) -> List[Scenario]:
+    """Scenarios covering every CLI command but the server itself
+
+    `--help` measures the interpreter and import overhead included in every
+    other command. `stats --metrics` is left out, as it mostly sleeps.
+    """
+    never = f"{NOTHING_OLDER_THAN}s"
+
+    def cli(*args: str, env: dict = None) -> Callable[[int], bool]:
+        return lambda number: run_cli(list(args), env)
+
+    def with_ids(command: str, count: int) -> Callable[[int], bool]:
+        def call(number: int) -> bool:
+            ids = ",".join(str(item_id) for item_id in targets.ids.take(count))
+            return run_cli([command, "--ids", ids])
+
+        return call
+
+    return [
+        Scenario("pq-dashboard --help", cli("--help")),
+        Scenario("pq-dashboard stats", cli("stats")),
+        Scenario("pq-dashboard stats <queue>", cli("stats", targets.big_queue)),
+        Scenario(
+            "pq-dashboard export",
+            cli("export", "--queue", targets.small_queue, "-o", os.devnull),
+        ),
+        Scenario(
+            "pq-dashboard export --format csv",
+            cli(
+                "export",
+                "--queue",
+                targets.small_queue,
+                "--format",
+                "csv",
+                "-o",
+                os.devnull,
+            ),
+        ),
+        Scenario(
+            "pq-dashboard import",
+            cli("import", targets.import_file, "--queue", "benchmark-import"),
+        ),
+        Scenario("pq-dashboard requeue", with_ids("requeue", 10)),
+        Scenario("pq-dashboard delete", with_ids("delete", 10)),
+        Scenario(
+            "pq-dashboard cleanup",
+            cli("cleanup", targets.big_queue, "--older-than", never),
+        ),
+        Scenario(
+            "pq-dashboard cancel-all",
+            cli("cancel-all", targets.big_queue, "--older-than", never),
+        ),
+        Scenario(
+            "pq-dashboard retain --once",
+            cli(
+                "retain",
+                "--once",
+                env={"PQ_DASH_RETENTION_MAX_AGE": str(NOTHING_OLDER_THAN)},
+            ),
+        ),
+        Scenario("pq-dashboard install-counters", cli("install-counters"), True),
+        Scenario("pq-dashboard reconcile", cli("reconcile"), True),
+        Scenario(
+            "pq-dashboard stats (counters)",
+            cli("stats", env={"PQ_DASH_USE_COUNTERS": "true"}),
+            True,
+        ),
+        Scenario("pq-dashboard uninstall-counters", cli("uninstall-counters"), True),
+        Scenario(
+            "pq-dashboard create-search-indexes", cli("create-search-indexes"), True
+        ),
+        Scenario(
+            "pq-dashboard create-search-indexes --drop",
+            cli("create-search-indexes", "--drop"),
+            True,
+        ),
+    ]
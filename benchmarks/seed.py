@@ -0,0 +1,190 @@
+"""This module contains helper methods for seeding a synthetic pq table"""
+import csv
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from pq import PQ
+
+from pq_dashboard.data.items import PayloadEncoding, encode_payload
+
+# Payload sizes, in bytes of padding, and the share of items of each size.
+# The middle size is above the default PQ_DASH_PREVIEW_SIZE, so that lists
+# exercise previews as well as full payloads.
+PAYLOAD_SIZES = [(64, 0.8), (4096, 0.18), (32768, 0.02)]
+
+# Kinds of payloads, which containment searches can match on
+PAYLOAD_KINDS = ["email", "invoice", "report", "webhook", "thumbnail"]
+
+COPY_COLUMNS = ["q_name", "enqueued_at", "dequeued_at", "expected_at", "schedule_at"]
+
+
+def get_queue_name(index: int) -> str:
+    return f"queue-{index:03d}"
+
+
+def get_queue_weights(queues: int) -> List[float]:
+    """Skew items towards the first queues, as real deployments are"""
+    return [1 / (index + 1) for index in range(queues)]
+
+
+def make_payload(rng: random.Random, number: int) -> dict:
+    sizes, weights = zip(*PAYLOAD_SIZES)
+    size = rng.choices(sizes, weights)[0]
+
+    return {
+        "number": number,
+        "kind": rng.choice(PAYLOAD_KINDS),
+        "tags": rng.sample(PAYLOAD_KINDS, 2),
+        "attempt": rng.randint(0, 3),
+        "body": "x" * size,
+    }
+
+
+def make_row(
+    rng: random.Random,
+    number: int,
+    queue_names: List[str],
+    queue_weights: List[float],
+    processed_ratio: float,
+    pickle_ratio: float,
+    now: datetime,
+    days: float,
+) -> list:
+    """Make the COPY fields of one synthetic item"""
+    enqueued_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+    dequeued_at = None
+    expected_at = None
+    schedule_at = None
+
+    if rng.random() < processed_ratio:
+        dequeued_at = enqueued_at + timedelta(seconds=rng.expovariate(1 / 30))
+    elif rng.random() < 0.05:
+        schedule_at = now + timedelta(seconds=rng.uniform(0, 86400))
+
+    if rng.random() < 0.1:
+        expected_at = enqueued_at + timedelta(seconds=60)
+
+    encoding = (
+        PayloadEncoding.pickle if rng.random() < pickle_ratio else PayloadEncoding.json
+    )
+    payload = encode_payload(make_payload(rng, number), encoding)
+
+    return [
+        rng.choices(queue_names, queue_weights)[0],
+        enqueued_at.isoformat(),
+        dequeued_at.isoformat() if dequeued_at else None,
+        expected_at.isoformat() if expected_at else None,
+        schedule_at.isoformat() if schedule_at else None,
+        json.dumps(payload),
+    ]
+
+
+def seed_table(
+    connection,
+    table: str,
+    rows: int,
+    queues: int = 50,
+    processed_ratio: float = 0.5,
+    pickle_ratio: float = 0.3,
+    days: float = 30.0,
+    seed: int = 0,
+    chunk_size: int = 10000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """(Re)create a pq table and fill it with synthetic items, with COPY
+
+    Items are spread over `queues` queues with a long tail, enqueued over the
+    last `days` days, and hold JSON or pickled payloads of mixed sizes. The
+    same arguments always produce the same items.
+
+    Args:
+        connection: DB connection
+        table (str): Name of the table to create, dropping any existing one
+        rows (int): Number of items
+        queues (int, optional): Number of queues. Defaults to 50
+        processed_ratio (float, optional): Share of dequeued items. Defaults to 0.5
+        pickle_ratio (float, optional): Share of pickled payloads. Defaults to 0.3
+        days (float, optional): Days items are enqueued over. Defaults to 30
+        seed (int, optional): Random seed. Defaults to 0
+        chunk_size (int, optional): Items copied per transaction
+        progress (Callable[[int], None], optional): Called with the number
+            of items seeded so far after every chunk
+
+    Returns:
+        dict: The seeding parameters, and how long seeding took
+    """
+    started = time.monotonic()
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    queue_names = [get_queue_name(index) for index in range(queues)]
+    queue_weights = get_queue_weights(queues)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    connection.commit()
+
+    PQ(connection, table=table).create()
+
+    statement = (
+        f"COPY {table} ({', '.join(COPY_COLUMNS)}, data) FROM STDIN WITH (FORMAT csv)"
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    with connection.cursor() as cursor:
+        for number in range(rows):
+            writer.writerow(
+                make_row(
+                    rng,
+                    number,
+                    queue_names,
+                    queue_weights,
+                    processed_ratio,
+                    pickle_ratio,
+                    now,
+                    days,
+                )
+            )
+
+            if (number + 1) % chunk_size == 0 or number + 1 == rows:
+                buffer.seek(0)
+                cursor.copy_expert(statement, buffer)
+                connection.commit()
+                buffer.seek(0)
+                buffer.truncate()
+
+                if progress is not None:
+                    progress(number + 1)
+
+        cursor.execute(f"ANALYZE {table}")
+    connection.commit()
+
+    return {
+        "table": table,
+        "rows": rows,
+        "queues": queues,
+        "processed_ratio": processed_ratio,
+        "pickle_ratio": pickle_ratio,
+        "days": days,
+        "seed": seed,
+        "duration": time.monotonic() - started,
+    }
+
+
+def get_table_rows(connection, table: str) -> Optional[int]:
+    """Count the items of a table, or None if it does not exist"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+        if not cursor.fetchone()[0]:
+            connection.commit()
+            return None
+
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        rows = cursor.fetchone()[0]
+
+    connection.commit()
+    return rows
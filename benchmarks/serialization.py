@@ -0,0 +1,122 @@
+"""
+This module contains the item page serialization benchmark, comparing the
+validated ItemPage path with the fast path, without a database
+"""
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.load import summarize
+from benchmarks.seed import make_payload
+from pq_dashboard import serialization
+from pq_dashboard.schema.item import Item, ItemPage
+
+
+def make_rows(count: int, seed: int = 0) -> List[dict]:
+    """Make rows shaped as `get_items` fetches them, with nested payloads"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    rows = []
+
+    for number in range(count):
+        enqueued_at = now - timedelta(seconds=rng.uniform(0, 86400))
+        payload = make_payload(rng, number)
+        payload["body"] = payload["body"][:64]
+        payload["meta"] = {"retries": [rng.random() for _ in range(5)]}
+
+        rows.append(
+            {
+                "id": number,
+                "enqueued_at": enqueued_at,
+                "dequeued_at": enqueued_at + timedelta(seconds=5),
+                "expected_at": None,
+                "schedule_at": None,
+                "q_name": "queue-000",
+                "size": 300,
+                "data": payload,
+                "preview": None,
+            }
+        )
+
+    return rows
+
+
+def validated_page(rows: List[dict]) -> bytes:
+    """Encode a page the way item pages used to be: models validated, then
+    passed through jsonable_encoder and json.dumps"""
+    records = [Item(**row, truncated=False) for row in rows]
+    page = ItemPage(records=records, total=len(rows), limit=len(rows), offset=0)
+
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def fast_page(rows: List[dict]) -> bytes:
+    records = [Item.construct(**row, truncated=False) for row in rows]
+    content = serialization.get_item_page_content(
+        records,
+        total=len(rows),
+        total_exact=True,
+        limit=len(rows),
+        offset=0,
+        next_after=None,
+        errors=[],
+    )
+
+    return serialization.FastJSONResponse(content).body
+
+
+def fast_page_json(rows: List[dict]) -> bytes:
+    """The fast path, with the standard library encoder"""
+    orjson = serialization.orjson
+    serialization.orjson = None
+    try:
+        return fast_page(rows)
+    finally:
+        serialization.orjson = orjson
+
+
+PATHS = [
+    ("ItemPage (validated)", validated_page),
+    ("ItemPage (fast, json)", fast_page_json),
+    ("ItemPage (fast)", fast_page),
+]
+
+
+def measure(encode: Callable[[List[dict]], bytes], rows: List[dict], repeat: int):
+    encode(rows)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        encode(rows)
+        latencies.append(time.perf_counter() - call_started)
+
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+def run_serialization(page_sizes: List[int], repeat: int) -> List[dict]:
+    """Time encoding item pages of each size with each path"""
+    results = []
+
+    for page_size in page_sizes:
+        rows = make_rows(page_size)
+
+        for name, encode in PATHS:
+            if name.endswith("(fast)") and serialization.orjson is None:
+                continue
+
+            results.append(
+                {
+                    "kind": "serialization",
+                    "name": f"{name} x{page_size}",
+                    "concurrency": 1,
+                    **measure(encode, rows, repeat),
+                }
+            )
+
+    return results
@@ -0,0 +1,206 @@
+"""
+This module contains the statement timeout budgets of API endpoints, and the
+cancellation of the queries of requests whose client disconnected
+"""
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Set
+
+from pq_dashboard.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """Raised when a request would query the database after its client left"""
+
+
+class RequestQueries:
+    """Connections running the queries of one API request"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.connections: Set = set()
+        self.disconnected = False
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> Optional[str]:
+        """Name of the endpoint handling the request, once it was routed"""
+        return getattr(self.scope.get("endpoint"), "__name__", None)
+
+    def add(self, connection):
+        with self._lock:
+            if self.disconnected:
+                raise ClientDisconnected("The client disconnected")
+            self.connections.add(connection)
+
+    def discard(self, connection):
+        with self._lock:
+            self.connections.discard(connection)
+
+    def disconnect(self) -> int:
+        """Cancel the running queries, and refuse any further ones
+
+        The cancel requests are sent while holding the lock, so that the
+        request's threads cannot `discard` a connection, and return it to
+        the pool for another request to use, before its cancel is sent.
+
+        Returns:
+            int: Number of connections which were sent a cancel request
+        """
+        cancelled = 0
+
+        with self._lock:
+            self.disconnected = True
+
+            for connection in self.connections:
+                try:
+                    connection.cancel()
+                    cancelled += 1
+                except Exception:
+                    logger.debug("Unable to cancel a query", exc_info=True)
+
+        return cancelled
+
+
+# Queries of the current request. Unset outside of API requests.
+_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "request_queries", default=None
+)
+
+
+def client_disconnected() -> bool:
+    """Whether the client of the current request disconnected"""
+    queries = _queries.get()
+    return queries is not None and queries.disconnected
+
+
+def get_endpoint_timeout(endpoint: Optional[str]) -> float:
+    """statement_timeout of an endpoint's queries, in seconds, 0 for none"""
+    return settings.STATEMENT_TIMEOUTS.get(endpoint, settings.STATEMENT_TIMEOUT)
+
+
+def get_statement_timeout() -> Optional[float]:
+    """statement_timeout of the current request's queries, in seconds
+
+    Returns:
+        Optional[float]: The timeout, 0 for none, or None outside of requests
+    """
+    queries = _queries.get()
+    if queries is None:
+        return None
+
+    return get_endpoint_timeout(queries.endpoint)
+
+
+def set_statement_timeout(connection, timeout: Optional[float]):
+    """Set the statement_timeout of an idle connection's session
+
+    The timeout is set outside of a transaction so that it survives the
+    commits and rollbacks of data functions, and only when it changes, as
+    connections remember the last one set. None restores the server default.
+    """
+    milliseconds = None if timeout is None else int(timeout * 1000)
+    if getattr(connection, "statement_timeout", None) == milliseconds:
+        return
+
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            if milliseconds is None:
+                cursor.execute("RESET statement_timeout")
+            else:
+                cursor.execute("SET statement_timeout = %s", (milliseconds,))
+    finally:
+        connection.autocommit = autocommit
+
+    connection.statement_timeout = milliseconds
+
+
+@contextmanager
+def cancellable(connection):
+    """ContextManager running queries on a connection within the current
+    request's budget, and cancelling them if its client disconnects
+
+    Raises:
+        ClientDisconnected: If the client already disconnected
+    """
+    set_statement_timeout(connection, get_statement_timeout())
+
+    queries = _queries.get()
+    if queries is None:
+        yield connection
+        return
+
+    queries.add(connection)
+    try:
+        yield connection
+    finally:
+        queries.discard(connection)
+
+
+class CancellationMiddleware:
+    """
+    ASGI middleware watching for the client of each request disconnecting
+    before its response started, to cancel the request's running queries
+    on the server rather than leave them to finish for nobody.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        token = _queries.set(queries)
+        messages: asyncio.Queue = asyncio.Queue()
+        response_started = False
+        disconnected = False
+
+        # Only this task reads from the server, so that disconnects are
+        # noticed while the app is busy querying rather than reading
+        async def listen():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    if not response_started:
+                        loop = asyncio.get_running_loop()
+                        cancelled = await loop.run_in_executor(None, queries.disconnect)
+                        if cancelled:
+                            logger.info(
+                                "Cancelled %d queries of %s %s, as its client disconnected",
+                                cancelled,
+                                scope["method"],
+                                scope["path"],
+                            )
+                    return
+
+        async def receive_message():
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def send_message(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        listener = asyncio.ensure_future(listen())
+        try:
+            await self.app(scope, receive_message, send_message)
+        finally:
+            listener.cancel()
+            _queries.reset(token)
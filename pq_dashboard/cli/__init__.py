@@ -1,10 +1,95 @@
 """Entrypoint script for invoking pq-dashboard on the command line"""
 import argparse
 import sys
+from datetime import datetime, timedelta
 
 import psycopg2
 
-from pq_dashboard.cli.commands import cancel_all, cleanup, show_stats, start_dashboard
+from pq_dashboard.cli.commands import (
+    cancel_all,
+    cleanup,
+    compact_counters,
+    create_search_indexes,
+    delete,
+    diagnose,
+    export,
+    import_file,
+    install_counters,
+    reconcile,
+    requeue,
+    retain,
+    show_stats,
+    start_dashboard,
+    uninstall_counters,
+)
+from pq_dashboard.sources import UnknownSource
+from pq_dashboard.watch import WATCH_SORTS
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse a duration such as `90`, `90s`, `30m`, `12h`, `7d` or `2w`"""
+    unit = value[-1:].lower()
+    number = value[:-1] if unit in DURATION_UNITS else value
+
+    try:
+        seconds = float(number) * DURATION_UNITS.get(unit, 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+
+    return timedelta(seconds=seconds)
+
+
+def add_batch_arguments(subparser: argparse.ArgumentParser):
+    """Add the flags controlling batched deletes to a subcommand"""
+    subparser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Items deleted per transaction (default: PQ_DASH_BULK_BATCH_SIZE)",
+    )
+    subparser.add_argument(
+        "--sleep",
+        type=float,
+        default=None,
+        help="Seconds to pause between batches (default: PQ_DASH_BULK_SLEEP)",
+    )
+
+
+def add_selection_arguments(subparser: argparse.ArgumentParser):
+    """Add the flags selecting items for a bulk action to a subcommand"""
+    subparser.add_argument(
+        "--ids", help="Comma-separated list of item IDs", default=None
+    )
+    subparser.add_argument("--queue", help="Only items in this queue", default=None)
+    subparser.add_argument(
+        "--search", help="Only items whose payload matches this term", default=None
+    )
+    subparser.add_argument(
+        "--search-mode",
+        choices=["auto", "text", "contains", "path"],
+        default="auto",
+        help="How the search term is matched (default: auto)",
+    )
+    subparser.add_argument(
+        "--state",
+        choices=["queued", "processed"],
+        default=None,
+        help="Only queued or only processed items",
+    )
+    subparser.add_argument(
+        "--enqueued-after",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only items enqueued at or after this ISO 8601 time",
+    )
+    subparser.add_argument(
+        "--enqueued-before",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Only items enqueued before this ISO 8601 time",
+    )
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -20,6 +105,12 @@ def get_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--port", help="Port for server to listen on (default: 9182)", default=9182
     )
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="Name of the source commands act on (default: the first). "
+        "retain and compact-counters act on every source unless given one",
+    )
 
     subparsers = parser.add_subparsers(help="CLI help", dest="subcommand")
 
@@ -29,6 +120,31 @@ def get_parser() -> argparse.ArgumentParser:
         nargs="?",
         help="Comma-separated list of queue names to show stats for (optional, default is all queues)",
     )
+    stats_subparser.add_argument(
+        "--metrics",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Also show throughput and wait times, sampled over this many seconds",
+    )
+    stats_subparser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep redrawing the table, with changes and rates since the last poll",
+    )
+    stats_subparser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Seconds between polls when watching, stretched when polls are slow (default: PQ_DASH_WATCH_INTERVAL)",
+    )
+    stats_subparser.add_argument(
+        "--sort",
+        choices=list(WATCH_SORTS),
+        default="name",
+        help="Column to sort queues by when watching (default: name)",
+    )
 
     cleanup_subparser = subparsers.add_parser(
         "cleanup", help="Cleanup processed items from one-or-more queues"
@@ -38,6 +154,13 @@ def get_parser() -> argparse.ArgumentParser:
         nargs="+",
         help="Comma-separated list of queue names to cleanup processed items from",
     )
+    cleanup_subparser.add_argument(
+        "--older-than",
+        type=parse_duration,
+        default=None,
+        help="Only items dequeued at least this long ago, e.g. 12h or 7d",
+    )
+    add_batch_arguments(cleanup_subparser)
 
     cancel_all_subparser = subparsers.add_parser(
         "cancel-all",
@@ -48,6 +171,150 @@ def get_parser() -> argparse.ArgumentParser:
         nargs="+",
         help="Comma-separated list of queue names to cleanup processed items from",
     )
+    cancel_all_subparser.add_argument(
+        "--older-than",
+        type=parse_duration,
+        default=None,
+        help="Only items enqueued at least this long ago, e.g. 12h or 7d",
+    )
+    add_batch_arguments(cancel_all_subparser)
+
+    subparsers.add_parser(
+        "install-counters",
+        help="Install a trigger-maintained table of per-queue counts, for fast stats",
+    )
+
+    subparsers.add_parser(
+        "uninstall-counters",
+        help="Remove the per-queue counts table and its triggers",
+    )
+
+    subparsers.add_parser(
+        "reconcile",
+        help="Rebuild the per-queue counts table from the queue table",
+    )
+
+    compact_subparser = subparsers.add_parser(
+        "compact-counters",
+        help="Fold the changes recorded by the counts triggers into the per-queue counts",
+    )
+    compact_subparser.add_argument(
+        "--once",
+        action="store_true",
+        help="Compact once, instead of every PQ_DASH_COUNTERS_COMPACT_INTERVAL seconds",
+    )
+
+    search_indexes_subparser = subparsers.add_parser(
+        "create-search-indexes",
+        help="Create indexes on item payloads, for fast searches",
+    )
+    search_indexes_subparser.add_argument(
+        "--no-trigram",
+        action="store_true",
+        help="Skip the pg_trgm index used by text searches",
+    )
+    search_indexes_subparser.add_argument(
+        "--no-jsonb",
+        action="store_true",
+        help="Skip the jsonb_path_ops index used by contains and path searches",
+    )
+    search_indexes_subparser.add_argument(
+        "--drop", action="store_true", help="Drop the search indexes instead"
+    )
+
+    doctor_subparser = subparsers.add_parser(
+        "doctor",
+        help="Explain the dashboard's queries and recommend indexes for them",
+    )
+    doctor_subparser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="Run the queries with EXPLAIN ANALYZE, for actual timings. "
+        "Otherwise they are only planned",
+    )
+    doctor_subparser.add_argument(
+        "--create",
+        action="store_true",
+        help="Create the recommended indexes, with CREATE INDEX CONCURRENTLY",
+    )
+    doctor_subparser.add_argument(
+        "--queue",
+        dest="queue_name",
+        default=None,
+        help="Queue to explain per-queue queries with (default: the most common)",
+    )
+
+    retain_subparser = subparsers.add_parser(
+        "retain",
+        help="Delete processed items outside the configured retention policies",
+    )
+    retain_subparser.add_argument(
+        "--once",
+        action="store_true",
+        help="Apply the policies once, instead of every PQ_DASH_RETENTION_INTERVAL seconds",
+    )
+
+    requeue_subparser = subparsers.add_parser(
+        "requeue", help="Requeue items by ID or by filter"
+    )
+    add_selection_arguments(requeue_subparser)
+
+    delete_subparser = subparsers.add_parser(
+        "delete", help="Delete items by ID or by filter"
+    )
+    add_selection_arguments(delete_subparser)
+    add_batch_arguments(delete_subparser)
+
+    export_subparser = subparsers.add_parser(
+        "export", help="Export items as NDJSON or CSV, optionally by ID or by filter"
+    )
+    add_selection_arguments(export_subparser)
+    export_subparser.add_argument(
+        "--format",
+        choices=["ndjson", "csv"],
+        default="ndjson",
+        help="Output format (default: ndjson)",
+    )
+    export_subparser.add_argument(
+        "--output",
+        "-o",
+        default="-",
+        help="File to write the export to (default: STDOUT)",
+    )
+    export_subparser.add_argument(
+        "--fetch-size",
+        type=int,
+        default=None,
+        help="Rows fetched per round trip (default: PQ_DASH_EXPORT_FETCH_SIZE)",
+    )
+
+    import_subparser = subparsers.add_parser(
+        "import", help="Import the items of an NDJSON or CSV export as queued items"
+    )
+    import_subparser.add_argument(
+        "input", nargs="?", default="-", help="Export to import (default: STDIN)"
+    )
+    import_subparser.add_argument(
+        "--format",
+        choices=["ndjson", "csv"],
+        default="ndjson",
+        help="Format of the export (default: ndjson)",
+    )
+    import_subparser.add_argument(
+        "--queue", default=None, help="Put every item in this queue instead"
+    )
+    import_subparser.add_argument(
+        "--schedule-at",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Schedule every item for this ISO 8601 time instead",
+    )
+    import_subparser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Items copied per transaction (default: PQ_DASH_IMPORT_CHUNK_SIZE)",
+    )
 
     return parser
 
@@ -67,6 +334,32 @@ def main():
             cleanup(**vars(flags))
         elif flags.subcommand == "cancel-all":
             cancel_all(**vars(flags))
+        elif flags.subcommand == "install-counters":
+            install_counters(**vars(flags))
+        elif flags.subcommand == "uninstall-counters":
+            uninstall_counters(**vars(flags))
+        elif flags.subcommand == "reconcile":
+            reconcile(**vars(flags))
+        elif flags.subcommand == "compact-counters":
+            compact_counters(**vars(flags))
+        elif flags.subcommand == "create-search-indexes":
+            create_search_indexes(**vars(flags))
+        elif flags.subcommand == "doctor":
+            diagnose(**vars(flags))
+        elif flags.subcommand == "retain":
+            retain(**vars(flags))
+        elif flags.subcommand == "requeue":
+            requeue(**vars(flags))
+        elif flags.subcommand == "delete":
+            delete(**vars(flags))
+        elif flags.subcommand == "export":
+            export(**vars(flags))
+        elif flags.subcommand == "import":
+            import_file(**vars(flags))
+    except UnknownSource as err:
+        print()
+        print(f"Error: {err}")
+        sys.exit(1)
     except psycopg2.OperationalError as err:
         print()
         print(f"Error: Unable to connect to Postgres")
@@ -1,14 +1,25 @@
 """This module contains command functions invoked by the CLI"""
-from typing import List
+import sys
+import time
+from typing import Callable, List, Tuple
 
 import uvicorn
 
-from pq_dashboard.connection import cursor_manager
+from pq_dashboard.compaction import compactor
+from pq_dashboard.connection import cursor_manager, get_connection, get_pool
+from pq_dashboard.data import counters, doctor, search
+from pq_dashboard.data.export import export_items
+from pq_dashboard.data.imports import import_items
+from pq_dashboard.data.items import delete_items, get_selection_filters, requeue_items
 from pq_dashboard.data.queues import (
     delete_processed_items,
     delete_queued_items,
     get_queue_stats,
 )
+from pq_dashboard.metrics import MetricsCollector
+from pq_dashboard.retention import retention
+from pq_dashboard.sources import get_source
+from pq_dashboard.watch import StatsWatcher, sort_queues
 
 
 def start_dashboard(host="0.0.0.0", port=9182, **kwargs):
@@ -19,13 +30,91 @@ def start_dashboard(host="0.0.0.0", port=9182, **kwargs):
     uvicorn.run("pq_dashboard.main:app", host=host, port=port, log_level="error")
 
 
-def show_stats(stats_queue_names, **kwargs):
-    """Prints a table of queue statistics to STDOUT"""
+def format_seconds(value) -> str:
+    """Format a duration in seconds for a stats table cell"""
+    if value is None:
+        return "-"
+    if value < 1:
+        return f"{value * 1000:.0f}ms"
+    if value < 120:
+        return f"{value:.1f}s"
+
+    return f"{value / 60:.1f}m"
+
+
+def sample_metrics(seconds: float, source=None) -> MetricsCollector:
+    """Collect the queue metrics of a source over the given number of seconds"""
+    sampler = MetricsCollector(source=get_source(source).name)
+    sampler.tick()
+    time.sleep(seconds)
+    sampler.tick()
+
+    return sampler
+
+
+def format_table(columns: List[Tuple[str, int]], rows_values: List[list]) -> List[str]:
+    """Format the rows of a stats table, between borders
+
+    Args:
+        columns: Title and width of each column
+        rows_values: Values of each row's cells
+    """
+    SEP = "\x1b[38;5;7m╎\x1b[0m"
+
+    row_format = SEP + "".join(f"{{:^{width}}}{SEP}" for _, width in columns)
+
+    def border(left: str, middle: str, right: str) -> str:
+        return (
+            "\x1b[38;5;7m"
+            + left
+            + middle.join("╌" * width for _, width in columns)
+            + right
+            + "\x1b[0m"
+        )
+
+    rows = []
+    rows.append(border("┌", "┬", "┐"))
+    rows.append(row_format.format(*(title for title, _ in columns)))
+    rows.append(border("├", "┼", "┤"))
+    rows.extend(row_format.format(*values) for values in rows_values)
+    rows.append(border("└", "┴", "┘"))
+
+    return rows
+
+
+def show_stats(
+    stats_queue_names,
+    metrics=None,
+    watch=False,
+    interval=None,
+    sort="name",
+    source=None,
+    **kwargs,
+):
+    """Prints a table of queue statistics to STDOUT
+
+    Args:
+        stats_queue_names: Comma-separated queues to show, or None for all
+        metrics: Also sample throughput and wait times over this many seconds
+        watch: Keep redrawing the table, with changes and rates, until interrupted
+        interval: Seconds between redraws when watching
+        sort: Column to sort queues by when watching
+        source: Source whose queues to show
+    """
     stats_queue_names = (
         stats_queue_names.split(",") if stats_queue_names is not None else []
     )
 
-    with cursor_manager() as cursor:
+    if watch:
+        watch_stats(stats_queue_names, interval=interval, sort=sort, source=source)
+        return
+
+    if metrics:
+        print()
+        print(f"  Sampling throughput for \x1b[1m{metrics}\x1b[0m seconds...")
+        sampler = sample_metrics(metrics, source)
+
+    with cursor_manager(source) as cursor:
         data = get_queue_stats(cursor)
 
     if stats_queue_names:
@@ -40,90 +129,199 @@ def show_stats(stats_queue_names, **kwargs):
         max([len(queue.name) for queue in data]) if len(data) > 1 else len(data[0].name)
     ) + 2
 
-    SEP = "\x1b[38;5;7m╎\x1b[0m"
-
-    header_format = (
-        f"{SEP}{{:^{max_name_length}}}{SEP}{{:^10}}{SEP}{{:^11}}{SEP}{{:^10}}{SEP}"
-    )
-    row_format = (
-        f"{SEP}{{:^{max_name_length}}}{SEP}{{:^10}}{SEP}{{:^11}}{SEP}{{:^10}}{SEP}"
-    )
+    columns = [("Name", max_name_length), ("Queued", 10), ("Processed", 11)]
+    columns.append(("Total", 10))
+    rows_values = [
+        [queue.name, queue.queued, queue.processed, queue.total] for queue in data
+    ]
 
-    header_text = header_format.format("Name", "Queued", "Processed", "Total")
-
-    rows = []
-    rows.append(
-        "\x1b[38;5;7m"
-        + "┌"
-        + ("╌" * max_name_length)
-        + "┬"
-        + ("╌" * 10)
-        + "┬"
-        + ("╌" * 11)
-        + "┬"
-        + ("╌" * 10)
-        + "┐"
-        + "\x1b[0m"
-    )
-    rows.append(header_text)
-    rows.append(
-        "\x1b[38;5;7m"
-        + "├"
-        + ("╌" * max_name_length)
-        + "┼"
-        + ("╌" * 10)
-        + "┼"
-        + ("╌" * 11)
-        + "┼"
-        + ("╌" * 10)
-        + "┤"
-        + "\x1b[0m"
-    )
-    rows.extend(
-        row_format.format(queue.name, queue.queued, queue.processed, queue.total)
-        for queue in data
-    )
-    rows.append(
-        "\x1b[38;5;7m"
-        + "└"
-        + ("╌" * max_name_length)
-        + "┴"
-        + ("╌" * 10)
-        + "┴"
-        + ("╌" * 11)
-        + "┴"
-        + ("╌" * 10)
-        + "┘"
-        + "\x1b[0m"
-    )
+    if metrics:
+        columns.extend(
+            [("Enq/s", 9), ("Deq/s", 9), ("Wait p50", 10), ("p95", 10), ("p99", 10)]
+        )
+        for values, queue in zip(rows_values, data):
+            window = sampler.get_window(queue.name, metrics * 2, source)
+            values.extend(
+                [
+                    f"{window.enqueue_rate:.1f}",
+                    f"{window.dequeue_rate:.1f}",
+                    format_seconds(window.wait.p50),
+                    format_seconds(window.wait.p95),
+                    format_seconds(window.wait.p99),
+                ]
+            )
 
     print()
-    for row in rows:
+    for row in format_table(columns, rows_values):
         print("  " + row)
 
 
-def cleanup(cleanup_queue_names, **kwargs):
-    """Cleanup all processed tasks from the given queues
+def format_delta(value) -> str:
+    """Format the change in a count for a stats table cell"""
+    if not value:
+        return "-" if value is None else ""
+
+    return f"{value:+d}"
+
+
+def format_rate(value) -> str:
+    """Format a rate per second for a stats table cell"""
+    return "-" if value is None else f"{value:.1f}"
+
+
+def watch_stats(queue_names: List[str], interval=None, sort="name", source=None):
+    """Redraw a table of queue statistics in place until interrupted
 
     Args:
-        cleanup_queue_names: Comma-separated queues to clean
+        queue_names: Queues to show, or an empty list for all
+        interval: Shortest interval between redraws, in seconds
+        sort: Column to sort queues by, see `WATCH_SORTS`
+        source: Source whose queues to show
     """
-    cleanup_queue_names = cleanup_queue_names[0].split(",")
+    columns = [
+        ("Name", 12),
+        ("Queued", 10),
+        ("±", 8),
+        ("Processed", 11),
+        ("±", 8),
+        ("Total", 10),
+        ("Enq/s", 9),
+        ("Deq/s", 9),
+    ]
+    connection = get_connection(source)
+    watcher = StatsWatcher(connection, interval=interval)
+
+    # Clear the screen and hide the cursor, restored on the way out
+    print("\x1b[2J\x1b[?25l", end="")
 
-    with cursor_manager() as cursor:
+    try:
+        while True:
+            queues = watcher.poll()
+            if queue_names:
+                queues = [queue for queue in queues if queue["name"] in queue_names]
+            queues = sort_queues(queues, sort)
+
+            columns[0] = (
+                "Name",
+                max([len(queue["name"]) for queue in queues], default=4) + 2,
+            )
+            rows_values = [
+                [
+                    queue["name"],
+                    queue["queued"],
+                    format_delta(queue["queued_delta"]),
+                    queue["processed"],
+                    format_delta(queue["processed_delta"]),
+                    queue["total"],
+                    format_rate(queue["enqueue_rate"]),
+                    format_rate(queue["dequeue_rate"]),
+                ]
+                for queue in queues
+            ]
+
+            lines = [
+                "",
+                f"  Every \x1b[1m{watcher.interval:.1f}s\x1b[0m "
+                f"(polls take {format_seconds(watcher.duration)}), "
+                f"sorted by \x1b[1m{sort}\x1b[0m. Press Ctrl+C to stop",
+                "",
+            ]
+            lines.extend("  " + row for row in format_table(columns, rows_values))
+
+            # Redraw from the top left, clearing what the last table left over
+            print(
+                "\x1b[H" + "".join(line + "\x1b[K\n" for line in lines) + "\x1b[J",
+                end="",
+                flush=True,
+            )
+
+            time.sleep(watcher.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\x1b[?25h", end="")
+        connection.close()
+
+
+def show_progress(verb: str, queue_name: str, total: int) -> Callable[[int], None]:
+    """Build a progress callback redrawing a single line on STDOUT"""
+
+    def progress(done: int):
+        percent = f" ({100 * done // total}%)" if total else ""
+        print(
+            f"\r  {verb} \x1b[1m{done}\x1b[0m/{total} items from queue "
+            f"\x1b[1m{queue_name}\x1b[0m{percent}",
+            end="",
+            flush=True,
+        )
+
+    return progress
+
+
+def delete_from_queues(
+    queue_names: List[str], delete, verb: str, state: str, source=None, **kwargs
+):
+    """Delete items from each of the given queues in batches, showing progress
+
+    Args:
+        queue_names: Queues to delete items from
+        delete: Either `delete_processed_items` or `delete_queued_items`
+        verb: Describes the deletion in progress messages
+        state: Queue statistic giving the number of items to delete
+        source: Source of the queues
+    """
+    with cursor_manager(source) as cursor:
         data = get_queue_stats(cursor)
         data = {queue.name: queue for queue in data}
 
         print()
 
-        for queue_name in cleanup_queue_names:
-            if queue_name in data:
-                delete_processed_items(cursor, queue_name)
+        for queue_name in queue_names:
+            if queue_name not in data:
+                print(f"Unknown queue: {queue_name}")
+                continue
+
+            progress = show_progress(verb, queue_name, getattr(data[queue_name], state))
+            deleted = 0
+
+            def track(done: int):
+                nonlocal deleted
+                deleted = done
+                progress(done)
+
+            try:
+                delete(
+                    cursor,
+                    queue_name,
+                    older_than=kwargs.get("older_than"),
+                    batch_size=kwargs.get("batch_size"),
+                    sleep=kwargs.get("sleep"),
+                    progress=track,
+                )
+            except KeyboardInterrupt:
+                print()
                 print(
-                    f"  Cleaned up \x1b[1m{data[queue_name].processed}\x1b[0m processed items from queue \x1b[1m{queue_name}\x1b[0m"
+                    f"  Interrupted after \x1b[1m{deleted}\x1b[0m items. "
+                    "Deleted batches are committed, run the same command to resume"
                 )
-            else:
-                print(f"Unknown queue: {queue_name}")
+                return
+
+            print()
+
+
+def cleanup(cleanup_queue_names, **kwargs):
+    """Cleanup all processed tasks from the given queues
+
+    Args:
+        cleanup_queue_names: Comma-separated queues to clean
+    """
+    delete_from_queues(
+        cleanup_queue_names[0].split(","),
+        delete_processed_items,
+        "Cleaned up",
+        "processed",
+        **kwargs,
+    )
 
 
 def cancel_all(cancel_queue_names, **kwargs):
@@ -132,19 +330,341 @@ def cancel_all(cancel_queue_names, **kwargs):
     Args:
         cancel_queue_names: Comma-separated queues to cancel tasks from
     """
-    cancel_queue_names = cancel_queue_names[0].split(",")
+    delete_from_queues(
+        cancel_queue_names[0].split(","),
+        delete_queued_items,
+        "Cancelled",
+        "queued",
+        **kwargs,
+    )
 
-    with cursor_manager() as cursor:
-        data = get_queue_stats(cursor)
-        data = {queue.name: queue for queue in data}
 
+def install_counters(source=None, **kwargs):
+    """Install the per-queue counters table and its triggers"""
+    with cursor_manager(source) as cursor:
+        counters.install_counters(cursor)
+        table = counters.get_counters_table(cursor)
+
+    print()
+    print(f"  Installed counters table \x1b[1m{table}\x1b[0m")
+    print("  Set \x1b[1mPQ_DASH_USE_COUNTERS=true\x1b[0m to read queue stats from it")
+
+
+def uninstall_counters(source=None, **kwargs):
+    """Remove the per-queue counters table and its triggers"""
+    with cursor_manager(source) as cursor:
+        counters.uninstall_counters(cursor)
+        table = counters.get_counters_table(cursor)
+
+    print()
+    print(f"  Removed counters table \x1b[1m{table}\x1b[0m")
+
+
+def reconcile(source=None, **kwargs):
+    """Rebuild the per-queue counters from the queue table"""
+    with cursor_manager(source) as cursor:
+        counters.reconcile_counters(cursor)
+        table = counters.get_counters_table(cursor)
+
+    print()
+    print(f"  Rebuilt counters table \x1b[1m{table}\x1b[0m")
+
+
+def compact_counters(once=False, source=None, **kwargs):
+    """Fold the deltas recorded by the counters triggers into the counters,
+    once or on a schedule
+
+    Args:
+        once: Compact once and exit, instead of every COUNTERS_COMPACT_INTERVAL
+        source: Only compact this source's counters, instead of every source's
+    """
+    runs = [compactor.run_once(source)] if once else compactor.run_forever(source)
+
+    for compacted in runs:
         print()
+        if not compacted:
+            print("  No source has counters installed")
+
+        for source, queues in compacted.items():
+            print(
+                f"  Compacted the counters of \x1b[1m{queues}\x1b[0m queues of source \x1b[1m{source}\x1b[0m"
+            )
+
+
+def create_search_indexes(
+    no_trigram=False, no_jsonb=False, drop=False, source=None, **kwargs
+):
+    """Create (or drop) the payload search indexes on the queue table
+
+    Args:
+        no_trigram: Skip the trigram index used by text searches
+        no_jsonb: Skip the jsonb index used by contains and path searches
+        drop: Drop the indexes instead
+        source: Source whose queue table to index
+    """
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction block
+    connection = get_connection(source)
+    connection.autocommit = True
+
+    print()
+
+    try:
+        with connection.cursor() as cursor:
+            if drop:
+                for name in search.drop_search_indexes(cursor):
+                    print(f"  Dropped index \x1b[1m{name}\x1b[0m")
+                return
+
+            print("  Creating indexes, this may take a while on large tables...")
+            names = search.create_search_indexes(
+                cursor, trigram=not no_trigram, jsonb=not no_jsonb
+            )
+            for name in names:
+                print(f"  Created index \x1b[1m{name}\x1b[0m")
+    finally:
+        connection.close()
+
+
+def diagnose(analyze=False, create=False, queue_name=None, source=None, **kwargs):
+    """Explain the dashboard's queries, and recommend (or create) indexes
+
+    Args:
+        analyze: EXPLAIN ANALYZE the queries, running them for real timings.
+            Otherwise they are only planned
+        create: Create the recommended indexes
+        queue_name: Queue to explain per-queue queries with. Defaults to
+            the most common queue
+        source: Source whose queue table to diagnose
+    """
+    with cursor_manager(source) as cursor:
+        rows = doctor.get_table_rows(cursor)
+
+    with get_pool(source).connection() as connection:
+        shapes, indexes = doctor.diagnose(
+            connection, analyze=analyze, queue_name=queue_name
+        )
 
-        for queue_name in cancel_queue_names:
-            if queue_name in data:
-                delete_queued_items(cursor, queue_name)
+    print()
+    for shape in shapes:
+        print(f"  \x1b[1m{shape['name']}\x1b[0m")
+
+        for statement in shape["statements"]:
+            time_taken = (
+                f", {statement['time']:.1f}ms" if statement["time"] is not None else ""
+            )
+            print(f"    cost {statement['cost']:.0f}{time_taken}")
+
+            for scan in statement["seq_scans"]:
+                condition = f" where {scan['filter']}" if scan["filter"] else ""
+                print(f"    \x1b[33mseq scan\x1b[0m of ~{scan['rows']} rows{condition}")
+            if statement["sorts"]:
+                print(f"    {statement['sorts']} sorts")
+
+        if shape["index"] is not None:
+            print(f"    -> {shape['index']['name']}")
+        if shape["note"] is not None:
+            print(f"    note: {shape['note']}")
+
+    print()
+    if rows < 10000:
+        print(
+            f"  The queue table holds ~{rows} items, "
+            "sequential scans of it are expected to be cheapest"
+        )
+
+    if not indexes:
+        print("  No indexes to recommend")
+        return
+
+    print("  Recommended indexes:")
+    for index in indexes:
+        print(f"    {index['definition']};")
+
+    if not create:
+        print()
+        print("  Run with \x1b[1m--create\x1b[0m to create them")
+        return
+
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction block
+    connection = get_connection(source)
+    connection.autocommit = True
+
+    print()
+    print("  Creating indexes, this may take a while on large tables...")
+
+    try:
+        with connection.cursor() as cursor:
+            for name in doctor.create_indexes(cursor, indexes):
+                print(f"  Created index \x1b[1m{name}\x1b[0m")
+    finally:
+        connection.close()
+
+
+def retain(once=False, source=None, **kwargs):
+    """Apply the configured retention policies, once or on a schedule
+
+    Args:
+        once: Apply them once and exit, instead of every RETENTION_INTERVAL
+        source: Only apply them to this source, instead of every source
+    """
+    runs = [retention.run_once(source)] if once else retention.run_forever(source)
+
+    for run in runs:
+        for source_name, source_run in run["sources"].items():
+            print()
+            print(f"  Source \x1b[1m{source_name}\x1b[0m")
+
+            if source_run["error"] is not None:
+                print(f"  Retention run failed: {source_run['error']}")
+            elif not source_run["acquired_lock"]:
+                print("  Retention is being applied by another process, skipping")
+            elif not source_run["deleted"]:
+                print("  No queues have a retention policy")
+
+            for queue_name, deleted in source_run["deleted"].items():
                 print(
-                    f"  Cancelled all \x1b[1m{data[queue_name].queued}\x1b[0m queued items from queue \x1b[1m{queue_name}\x1b[0m"
+                    f"  Deleted \x1b[1m{deleted}\x1b[0m processed items from queue \x1b[1m{queue_name}\x1b[0m"
                 )
-            else:
-                print(f"Unknown queue: {queue_name}")
+
+
+def get_selection(
+    cursor, ids=None, queue=None, search_mode="auto", allow_all=False, **kwargs
+) -> dict:
+    """Resolve the item selection flags of a bulk command into filters"""
+    return get_selection_filters(
+        cursor,
+        ids=[int(item_id) for item_id in ids.split(",")] if ids else None,
+        queue_name=queue,
+        search=kwargs.get("search"),
+        search_mode=search_mode,
+        state=kwargs.get("state"),
+        enqueued_after=kwargs.get("enqueued_after"),
+        enqueued_before=kwargs.get("enqueued_before"),
+        allow_all=allow_all,
+    )
+
+
+def requeue(source=None, **kwargs):
+    """Requeue items selected by ID or by filter"""
+    print()
+
+    with cursor_manager(source) as cursor:
+        try:
+            filters = get_selection(cursor, **kwargs)
+        except ValueError as err:
+            print(f"  {err}")
+            return
+
+        affected = requeue_items(cursor, **filters)
+
+    print(f"  Requeued \x1b[1m{affected}\x1b[0m items")
+
+
+def delete(batch_size=None, sleep=None, source=None, **kwargs):
+    """Delete items selected by ID or by filter"""
+    print()
+
+    with cursor_manager(source) as cursor:
+        try:
+            filters = get_selection(cursor, **kwargs)
+        except ValueError as err:
+            print(f"  {err}")
+            return
+
+        affected = delete_items(cursor, batch_size=batch_size, sleep=sleep, **filters)
+
+    print(f"  Deleted \x1b[1m{affected}\x1b[0m items")
+
+
+def export(output="-", format="ndjson", fetch_size=None, source=None, **kwargs):
+    """Export items selected by ID or by filter, or every item, as NDJSON or CSV
+
+    Args:
+        output: File to write to, or - for STDOUT
+        format: ndjson or csv
+        fetch_size: Rows fetched per round trip
+        source: Source to export items from
+    """
+    with cursor_manager(source) as cursor:
+        try:
+            filters = get_selection(cursor, allow_all=True, **kwargs)
+        except ValueError as err:
+            print(f"  {err}", file=sys.stderr)
+            return
+
+    def progress(done: int):
+        print(f"\r  Exported \x1b[1m{done}\x1b[0m items", end="", file=sys.stderr)
+
+    file = sys.stdout if output == "-" else open(output, "w", newline="")
+
+    try:
+        with get_pool(source).connection() as connection:
+            for chunk in export_items(
+                connection,
+                format,
+                fetch_size=fetch_size,
+                progress=progress,
+                **filters,
+            ):
+                file.write(chunk)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+    print(file=sys.stderr)
+
+
+def import_file(
+    input="-",
+    format="ndjson",
+    queue=None,
+    schedule_at=None,
+    chunk_size=None,
+    source=None,
+    **kwargs,
+):
+    """Import the items of an NDJSON or CSV export as new queued items
+
+    Args:
+        input: File to read from, or - for STDIN
+        format: ndjson or csv
+        queue: Queue to put every item in, instead of their original queues
+        schedule_at: Time to schedule every item for
+        chunk_size: Items copied per transaction
+        source: Source to import items into
+    """
+    started = time.monotonic()
+
+    def progress(done: int):
+        elapsed = time.monotonic() - started
+        print(
+            f"\r  Imported \x1b[1m{done}\x1b[0m items "
+            f"({done / elapsed if elapsed else 0:.0f} items/s)",
+            end="",
+        )
+
+    file = sys.stdin if input == "-" else open(input, newline="")
+
+    print()
+
+    try:
+        with cursor_manager(source) as cursor:
+            imported = import_items(
+                cursor,
+                file,
+                format,
+                queue_name=queue,
+                schedule_at=schedule_at,
+                chunk_size=chunk_size,
+                progress=progress,
+            )
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    elapsed = time.monotonic() - started
+    print()
+    print(
+        f"  Imported \x1b[1m{imported}\x1b[0m items in {elapsed:.2f}s "
+        f"({imported / elapsed if elapsed else 0:.0f} items/s)"
+    )
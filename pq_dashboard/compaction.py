@@ -0,0 +1,79 @@
+"""
+This module contains the counters compactor, which periodically folds the
+deltas appended by the counters triggers into the per-queue counters
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.data.counters import compact_counters, counters_installed
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.sources import get_source_names
+
+logger = logging.getLogger(__name__)
+
+
+class CountersCompactor:
+    """
+    Compacts the counters of every source which has them installed, on a
+    schedule, so that reading them only sums the deltas of one interval.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self, source: Optional[str] = None) -> Dict[str, int]:
+        """Compact the counters of every source once, blocking until done
+
+        Args:
+            source (str, optional): Only compact this source's counters.
+                Defaults to every source
+
+        Returns:
+            Dict[str, int]: Number of queues compacted, by source name.
+                Sources without counters, or which failed, are left out
+        """
+        compacted = {}
+
+        for name in get_source_names(source):
+            try:
+                with cursor_manager(name) as cursor:
+                    if counters_installed(cursor):
+                        compacted[name] = compact_counters(cursor)
+            except Exception:
+                logger.exception("Compacting counters of %s failed", name)
+
+        return compacted
+
+    async def _run(self):
+        while True:
+            await run_blocking(self.run_once)
+            await asyncio.sleep(settings.COUNTERS_COMPACT_INTERVAL)
+
+    def start(self):
+        """Compact counters in the background of the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop compacting counters in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def run_forever(self, source: Optional[str] = None):
+        """Compact counters on a schedule in the current thread, for the CLI.
+        Yields the result of every run."""
+        while True:
+            yield self.run_once(source)
+            time.sleep(settings.COUNTERS_COMPACT_INTERVAL)
+
+
+compactor = CountersCompactor()
@@ -0,0 +1,57 @@
+"""
+This module contains helpers for conditional GET requests, answered with
+`304 Not Modified` when nothing changed since the ETag the client holds
+was issued
+"""
+import hashlib
+from typing import Dict
+
+from fastapi import Request, Response
+
+
+def get_etag(markers: Dict[str, str], request: Request) -> str:
+    """Weak ETag of a response, from change markers and the request
+
+    Args:
+        markers (Dict[str, str]): Markers from `get_change_marker`, by the
+            name of the source they are for
+        request (Request): Request being answered, whose query selects
+            what the response holds
+
+    Returns:
+        str: The ETag
+    """
+    marker = "|".join(f"{source}={marker}" for source, marker in markers.items())
+    key = f"{marker}|{request.url.path}?{request.url.query}"
+    return 'W/"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header holds the ETag
+
+    ETags are compared weakly, ignoring their `W/` prefix.
+    """
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+
+    if header.strip() == "*":
+        return True
+
+    def strip(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return strip(etag) in {strip(tag) for tag in header.split(",")}
+
+
+def set_etag(response: Response, etag: str):
+    """Add an ETag to a response, which clients must revalidate before use"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
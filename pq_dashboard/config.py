@@ -1,6 +1,35 @@
 """This module contains configuration logic using environment variables
 for the pq-dashboard application"""
-from pydantic import BaseSettings
+from datetime import timedelta
+from enum import Enum
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, BaseSettings, validator
+
+
+class CountStrategy(str, Enum):
+    """How the items page computes its totals"""
+
+    exact = "exact"
+    cached = "cached"
+    estimated = "estimated"
+
+
+class RetentionPolicy(BaseModel):
+    """How long, and how many, processed items of a queue are kept"""
+
+    max_age: Optional[timedelta] = None
+    max_count: Optional[int] = None
+
+
+class Source(BaseModel):
+    """A queue table in a database, monitored alongside the other sources"""
+
+    name: str
+    dsn: str
+    queue_table: str = "queue"
+    counters_table: Optional[str] = None
+    replica_dsn: Optional[str] = None
 
 
 class Settings(BaseSettings):
@@ -17,6 +46,123 @@ class Settings(BaseSettings):
     DATABASE: str = "postgres"
     QUEUE_TABLE: str = "queue"
 
+    # Queue tables monitored together, as a JSON list of objects with a
+    # "name", a "dsn" and a "queue_table". Without any, the database and
+    # table above are the only source. Sources are queried concurrently, each
+    # for at most SOURCE_TIMEOUT seconds unless it is 0
+    SOURCES: List[Source] = []
+    SOURCE_TIMEOUT: float = 10.0
+
+    # Read replica of the database above, which dashboard reads are sent to
+    # while its replication lag is under REPLICA_MAX_LAG seconds. The lag is
+    # checked at most every REPLICA_LAG_INTERVAL seconds. Sources take a
+    # "replica_dsn" instead
+    REPLICA_HOST: Optional[str] = None
+    REPLICA_PORT: Optional[int] = None
+    REPLICA_MAX_LAG: float = 30.0
+    REPLICA_LAG_INTERVAL: float = 5.0
+
+    # statement_timeout of the queries of API requests, in seconds (0 for
+    # none), by endpoint name in STATEMENT_TIMEOUTS and STATEMENT_TIMEOUT for
+    # the other endpoints. Queries of clients which disconnect are cancelled
+    STATEMENT_TIMEOUT: float = 30.0
+    STATEMENT_TIMEOUTS: Dict[str, float] = {"items": 5.0, "export": 0.0}
+
+    # Connection pool shared by the API and the CLI
+    POOL_MIN_SIZE: int = 1
+    POOL_MAX_SIZE: int = 10
+    POOL_TIMEOUT: float = 30.0
+    POOL_IDLE_TIMEOUT: float = 300.0
+    POOL_MAX_LIFETIME: float = 3600.0
+    POOL_CHECK_ON_CHECKOUT: bool = True
+
+    # Threads available to async routes for running blocking queries
+    DB_WORKERS: int = 10
+
+    # Item page totals: exact COUNTs, COUNTs cached for COUNT_CACHE_TTL
+    # seconds, or planner estimates (exact below COUNT_EXACT_THRESHOLD rows)
+    COUNT_STRATEGY: CountStrategy = CountStrategy.exact
+    COUNT_CACHE_TTL: float = 10.0
+    COUNT_EXACT_THRESHOLD: int = 10000
+
+    # Read queue statistics from the trigger-maintained counters table
+    # (see `pq-dashboard install-counters`). Defaults to <QUEUE_TABLE>_counters.
+    # With USE_COUNTERS, the server folds the changes the triggers append
+    # into it every COUNTERS_COMPACT_INTERVAL seconds
+    USE_COUNTERS: bool = False
+    COUNTERS_TABLE: Optional[str] = None
+    COUNTERS_COMPACT_INTERVAL: float = 60.0
+
+    # Live queue statistics pushed over /queues/events: notifications are
+    # coalesced for LIVE_DEBOUNCE seconds, and stats are refreshed at least
+    # every LIVE_REFRESH_INTERVAL seconds as pq only notifies on insert
+    LIVE_DEBOUNCE: float = 0.5
+    LIVE_REFRESH_INTERVAL: float = 5.0
+    LIVE_KEEPALIVE: float = 15.0
+    # Without counters, live stats are coalesced for longer when counting
+    # them would keep the database busy more than LIVE_MAX_LOAD of the time
+    LIVE_MAX_LOAD: float = 0.05
+
+    # Queue throughput and wait time metrics, collected by the server every
+    # METRICS_INTERVAL seconds. METRICS_HISTORY collections are kept, and
+    # rolled up over each of METRICS_WINDOWS seconds. Off by default, as
+    # reading dequeues scans the queue table without an index on dequeued_at
+    METRICS_ENABLED: bool = False
+    METRICS_INTERVAL: float = 10.0
+    # Transactions enqueuing and dequeuing items are expected to commit within
+    # METRICS_LOOKBACK seconds. Items committed later than that may be missed
+    METRICS_LOOKBACK: float = 60.0
+    METRICS_HISTORY: int = 360
+    METRICS_WINDOWS: List[int] = [60, 300, 900]
+
+    # Prometheus metrics served at /metrics, collected every
+    # PROMETHEUS_INTERVAL seconds rather than on every scrape. Off by
+    # default, as collecting counts the items of every queue
+    PROMETHEUS_ENABLED: bool = False
+    PROMETHEUS_INTERVAL: float = 15.0
+
+    # Item lists send payloads over PREVIEW_SIZE bytes as a preview this long
+    PREVIEW_SIZE: int = 2048
+
+    # Rows fetched per round trip by exports, and copied per transaction
+    # by imports
+    EXPORT_FETCH_SIZE: int = 1000
+    IMPORT_CHUNK_SIZE: int = 10000
+
+    # Items deleted per transaction by bulk deletes and cleanups, and the
+    # seconds to pause between those transactions
+    BULK_BATCH_SIZE: int = 5000
+    BULK_SLEEP: float = 0.0
+
+    # `pq-dashboard stats --watch` polls every WATCH_INTERVAL seconds, or
+    # less often when its queries would take more than WATCH_MAX_LOAD of
+    # the time between polls
+    WATCH_INTERVAL: float = 1.0
+    WATCH_MAX_LOAD: float = 0.05
+
+    # Retention of processed items, enforced every RETENTION_INTERVAL seconds
+    # by `pq-dashboard retain` or, with RETENTION_ENABLED, by the server.
+    # RETENTION_MAX_AGE/RETENTION_MAX_COUNT apply to every queue without an
+    # entry in RETENTION_POLICIES, a JSON object keyed by queue name
+    RETENTION_ENABLED: bool = False
+    RETENTION_INTERVAL: float = 300.0
+    RETENTION_MAX_AGE: Optional[timedelta] = None
+    RETENTION_MAX_COUNT: Optional[int] = None
+    RETENTION_POLICIES: Dict[str, RetentionPolicy] = {}
+
+    # Statements taking longer than SLOW_QUERY_THRESHOLD seconds are logged,
+    # unless it is 0
+    SLOW_QUERY_THRESHOLD: float = 0.5
+
+    @validator("SOURCES")
+    def check_source_names(cls, sources: List[Source]) -> List[Source]:
+        names = [source.name for source in sources]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"duplicate source names: {', '.join(sorted(duplicates))}")
+
+        return sources
+
     class Config:
         env_prefix = "PQ_DASH_"
 
@@ -1,39 +1,133 @@
 """This module contains utilities for interacting with the database"""
+import math
+import threading
 from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
 
 from psycopg2 import connect
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import connection as Connection
+from psycopg2.extensions import parse_dsn
 
+from pq_dashboard.cancellation import cancellable
 from pq_dashboard.config import settings
+from pq_dashboard.pool import ConnectionPool
+from pq_dashboard.sources import get_source
+from pq_dashboard.timing import TimedCursor, phase
 
+_pools: Dict[Tuple[str, bool], ConnectionPool] = {}
+_pool_lock = threading.Lock()
 
-def get_connection():
-    """Utility function for connecting to Postgres"""
-    connection = connect(
-        database=settings.DATABASE,
-        user=settings.PGUSER,
-        password=settings.PGPASSWORD,
-        host=settings.PGHOST,
-        port=settings.PGPORT,
-        cursor_factory=DictCursor,
-    )
+
+class SourceConnection(Connection):
+    """Connection which knows the name of the source it connects to, so that
+    data helpers can find the source's queue table from a cursor"""
+
+    source_name: Optional[str] = None
+    # statement_timeout last set on the session, in milliseconds
+    statement_timeout: Optional[int] = None
+
+
+def get_connection(source: Optional[str] = None, replica: bool = False):
+    """Utility function for connecting to Postgres
+
+    Args:
+        source (str, optional): Name of the source whose database to connect
+            to. Defaults to the first source
+        replica (bool, optional): Connect to the source's read replica
+            instead. Defaults to False
+    """
+    source = get_source(source)
+    dsn = source.replica_dsn if replica else source.dsn
+
+    if replica and not dsn:
+        raise ValueError(f"Source {source.name} has no replica")
+
+    if dsn:
+        options = {}
+        if settings.SOURCE_TIMEOUT and "connect_timeout" not in parse_dsn(dsn):
+            # libpq rounds timeouts under 2 seconds up to 2 seconds
+            options["connect_timeout"] = max(2, math.ceil(settings.SOURCE_TIMEOUT))
+
+        connection = connect(
+            dsn,
+            connection_factory=SourceConnection,
+            cursor_factory=TimedCursor,
+            **options,
+        )
+    else:
+        connection = connect(
+            database=settings.DATABASE,
+            user=settings.PGUSER,
+            password=settings.PGPASSWORD,
+            host=settings.PGHOST,
+            port=settings.PGPORT,
+            connection_factory=SourceConnection,
+            cursor_factory=TimedCursor,
+        )
+
+    connection.source_name = source.name
 
     return connection
 
 
-def get_cursor():
-    """FastAPI DI function for getting a DB cursor which cleans up after itself"""
-    connection = get_connection()
-    cursor = connection.cursor()
+def get_pool(source: Optional[str] = None, replica: bool = False) -> ConnectionPool:
+    """Get the process-wide connection pool of a source, creating it on first use
+
+    Args:
+        source (str, optional): Name of the source. Defaults to the first source
+        replica (bool, optional): Get the pool of the source's read replica
+            instead. Defaults to False
+    """
+    key = (get_source(source).name, replica)
+
+    if key not in _pools:
+        with _pool_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(
+                    lambda: get_connection(*key),
+                    min_size=settings.POOL_MIN_SIZE,
+                    max_size=settings.POOL_MAX_SIZE,
+                    timeout=settings.POOL_TIMEOUT,
+                    idle_timeout=settings.POOL_IDLE_TIMEOUT,
+                    max_lifetime=settings.POOL_MAX_LIFETIME,
+                    check_on_checkout=settings.POOL_CHECK_ON_CHECKOUT,
+                )
+
+    return _pools[key]
+
+
+def close_pool():
+    """Close the process-wide connection pools, if any were created"""
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def get_cursor(source: Optional[str] = None):
+    """FastAPI DI function for getting a DB cursor which cleans up after itself
+
+    In routes, the source is picked with the `source` query parameter.
+    Queries run within the endpoint's statement timeout, and are cancelled
+    if the client disconnects.
+    """
+    pool = get_pool(source)
+    with phase("pool"):
+        connection = pool.getconn()
+
+    try:
+        with cancellable(connection):
+            cursor = connection.cursor()
 
-    yield cursor
+            yield cursor
 
-    connection.commit()
-    cursor.close()
-    connection.close()
+            connection.commit()
+            cursor.close()
+    finally:
+        pool.putconn(connection)
 
 
 @contextmanager
-def cursor_manager():
+def cursor_manager(source: Optional[str] = None):
     """Standalone ContextManager variation of get_cursor for CLI scripts"""
-    yield from get_cursor()
+    yield from get_cursor(source)
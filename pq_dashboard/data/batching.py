@@ -0,0 +1,67 @@
+"""This module contains helper methods for deleting large numbers of items"""
+import time
+from typing import Callable, Optional
+
+from pq_dashboard.sources import get_queue_table
+
+
+def delete_in_batches(
+    cursor,
+    where_clause: str,
+    params: list,
+    batch_size: int,
+    sleep: float = 0.0,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Delete items matching a WHERE clause, committing after every batch
+
+    Keeping each transaction small bounds how long locks are held and how
+    much WAL each commit produces. Rows locked by a pq worker are skipped.
+
+    Batches walk the matching items in ID order, so each one starts where
+    the last one stopped instead of rescanning skipped rows. As every batch
+    is committed, an interrupted delete is resumed by running it again.
+
+    Args:
+        cursor: DB cursor
+        where_clause (str): Clause selecting the items, e.g. " WHERE q_name = %s"
+        params (list): Parameters for the clause
+        batch_size (int): Maximum items deleted per transaction
+        sleep (float, optional): Seconds to pause between batches, giving
+            replicas and pq workers room to catch up. Defaults to 0.0
+        progress (Callable[[int], None], optional): Called with the number
+            of items deleted so far after every batch
+
+    Returns:
+        int: Number of items deleted
+    """
+    table = get_queue_table(cursor)
+    keyset = " AND id > %s" if where_clause else " WHERE id > %s"
+
+    statement = (
+        f"WITH deleted AS (DELETE FROM {table} WHERE id IN ("
+        f"SELECT id FROM {table}{where_clause}{keyset} "
+        "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING id) "
+        "SELECT COUNT(*), MAX(id) FROM deleted"
+    )
+
+    deleted = 0
+    last_id = 0
+
+    while True:
+        cursor.execute(statement, (*params, last_id, batch_size))
+        batch, max_id = cursor.fetchone()
+        cursor.connection.commit()
+
+        deleted += batch
+
+        if progress is not None:
+            progress(deleted)
+
+        if batch < batch_size:
+            return deleted
+
+        last_id = max_id
+
+        if sleep > 0:
+            time.sleep(sleep)
@@ -0,0 +1,26 @@
+"""
+This module contains helper methods for detecting changes to the queue
+table cheaply, without reading the rows which changed
+"""
+from pq_dashboard.timing import timed
+
+
+@timed("get_change_marker")
+def get_change_marker(cursor) -> str:
+    """Get a marker which changes whenever items may have changed
+
+    The marker is the current transaction snapshot: the transactions which
+    are writing, and the next transaction ID. It changes as soon as any
+    transaction starts writing, such as one putting, dequeuing or deleting
+    items, and again when it commits, without reading the queue table.
+    Writes to other tables change it too, so on busy databases it changes
+    more often than the queue table does.
+
+    Args:
+        cursor: DB cursor
+
+    Returns:
+        str: The marker
+    """
+    cursor.execute("SELECT txid_current_snapshot()::text")
+    return cursor.fetchone()[0]
@@ -0,0 +1,249 @@
+"""
+This module contains helper methods for the optional per-queue counters
+table, which is kept up to date by triggers on the queue table so that
+queue statistics can be read without scanning it
+"""
+from typing import List
+
+from pq_dashboard.schema.queue import Queue
+from pq_dashboard.sources import get_cursor_source, get_queue_table
+
+TRIGGER_PREFIX = "pq_dashboard_counters"
+
+
+def get_counters_table(cursor) -> str:
+    """Name of the counters table of the source a cursor is connected to"""
+    source = get_cursor_source(cursor)
+
+    return source.counters_table or f"{source.queue_table}_counters"
+
+
+def get_deltas_table(cursor) -> str:
+    """Name of the table the triggers append count changes to"""
+    return f"{get_counters_table(cursor)}_deltas"
+
+
+def install_counters(cursor):
+    """Create the counters tables and the triggers maintaining them, then fill them
+
+    The triggers are statement-level and aggregate each statement's rows
+    per queue, so bulk inserts and deletes cost one row per queue rather
+    than one per row. They only ever append those changes to the deltas
+    table: updating a row per queue would make concurrent dequeues of a
+    queue wait on each other until commit, defeating SKIP LOCKED. Deltas
+    are folded into the counters table by `compact_counters`.
+
+    Args:
+        cursor: DB cursor
+    """
+    counters = get_counters_table(cursor)
+    deltas = get_deltas_table(cursor)
+    table = get_queue_table(cursor)
+
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {counters} (
+            q_name    text   PRIMARY KEY,
+            queued    bigint NOT NULL DEFAULT 0,
+            processed bigint NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS {deltas} (
+            q_name    text   NOT NULL,
+            queued    bigint NOT NULL,
+            processed bigint NOT NULL
+        );
+
+        CREATE OR REPLACE FUNCTION {counters}_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM {deltas};
+                DELETE FROM {counters};
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO {deltas} (q_name, queued, processed)
+                SELECT q_name,
+                       count(*) FILTER (WHERE dequeued_at IS NULL),
+                       count(*) FILTER (WHERE dequeued_at IS NOT NULL)
+                FROM new_rows GROUP BY q_name;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO {deltas} (q_name, queued, processed)
+                SELECT q_name,
+                       -count(*) FILTER (WHERE dequeued_at IS NULL),
+                       -count(*) FILTER (WHERE dequeued_at IS NOT NULL)
+                FROM old_rows GROUP BY q_name;
+            ELSE
+                INSERT INTO {deltas} (q_name, queued, processed)
+                SELECT q_name, sum(queued), sum(processed)
+                FROM (
+                    SELECT q_name,
+                           count(*) FILTER (WHERE dequeued_at IS NULL) AS queued,
+                           count(*) FILTER (WHERE dequeued_at IS NOT NULL) AS processed
+                    FROM new_rows GROUP BY q_name
+                    UNION ALL
+                    SELECT q_name,
+                           -count(*) FILTER (WHERE dequeued_at IS NULL),
+                           -count(*) FILTER (WHERE dequeued_at IS NOT NULL)
+                    FROM old_rows GROUP BY q_name
+                ) AS changes
+                GROUP BY q_name
+                HAVING sum(queued) <> 0 OR sum(processed) <> 0;
+            END IF;
+
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_insert ON {table};
+        CREATE TRIGGER {TRIGGER_PREFIX}_insert
+            AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE {counters}_apply();
+
+        DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_update ON {table};
+        CREATE TRIGGER {TRIGGER_PREFIX}_update
+            AFTER UPDATE ON {table}
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE {counters}_apply();
+
+        DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_delete ON {table};
+        CREATE TRIGGER {TRIGGER_PREFIX}_delete
+            AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE {counters}_apply();
+
+        DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_truncate ON {table};
+        CREATE TRIGGER {TRIGGER_PREFIX}_truncate
+            AFTER TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE PROCEDURE {counters}_apply();
+        """
+    )
+
+    reconcile_counters(cursor)
+
+
+def uninstall_counters(cursor):
+    """Drop the counters triggers and tables
+
+    Args:
+        cursor: DB cursor
+    """
+    counters = get_counters_table(cursor)
+    table = get_queue_table(cursor)
+
+    for event in ("insert", "update", "delete", "truncate"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_{event} ON {table}")
+
+    cursor.execute(f"DROP FUNCTION IF EXISTS {counters}_apply()")
+    cursor.execute(f"DROP TABLE IF EXISTS {get_deltas_table(cursor)}")
+    cursor.execute(f"DROP TABLE IF EXISTS {counters}")
+    cursor.connection.commit()
+
+
+def counters_installed(cursor) -> bool:
+    """Whether the counters tables of the source a cursor is connected to exist"""
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (get_deltas_table(cursor),))
+
+    return cursor.fetchone()[0]
+
+
+def compact_counters(cursor) -> int:
+    """Fold the deltas appended by the triggers into the counters table
+
+    Deltas are deleted and added to the counters in one statement, so
+    readers see either, and concurrent compactions never fold one twice.
+    Writers only append deltas, so they never wait on a compaction.
+
+    Args:
+        cursor: DB cursor
+
+    Returns:
+        int: Number of queues whose counters changed
+    """
+    counters = get_counters_table(cursor)
+
+    cursor.execute(
+        f"""
+        WITH folded AS (
+            DELETE FROM {get_deltas_table(cursor)}
+            RETURNING q_name, queued, processed
+        )
+        INSERT INTO {counters} AS c (q_name, queued, processed)
+        SELECT q_name, sum(queued), sum(processed)
+        FROM folded GROUP BY q_name ORDER BY q_name
+        ON CONFLICT (q_name) DO UPDATE
+        SET queued = c.queued + EXCLUDED.queued,
+            processed = c.processed + EXCLUDED.processed
+        """
+    )
+    compacted = cursor.rowcount
+    cursor.connection.commit()
+
+    return compacted
+
+
+def reconcile_counters(cursor):
+    """Rebuild the counters from a full scan of the queue table
+
+    Writers to the queue table wait on the deltas table lock until the
+    rebuild commits, so no change is counted twice or missed.
+
+    Args:
+        cursor: DB cursor
+    """
+    counters = get_counters_table(cursor)
+    deltas = get_deltas_table(cursor)
+    table = get_queue_table(cursor)
+
+    cursor.execute(f"LOCK TABLE {deltas} IN EXCLUSIVE MODE")
+    cursor.execute(f"DELETE FROM {deltas}")
+    cursor.execute(f"DELETE FROM {counters}")
+    cursor.execute(
+        f"""
+        INSERT INTO {counters} (q_name, queued, processed)
+        SELECT q_name,
+               count(*) FILTER (WHERE dequeued_at IS NULL),
+               count(*) FILTER (WHERE dequeued_at IS NOT NULL)
+        FROM {table} GROUP BY q_name
+        """
+    )
+    cursor.connection.commit()
+
+
+def get_counter_stats(cursor) -> List[Queue]:
+    """Get a list of Queue objects from the counters table, and the deltas
+    not yet folded into it
+
+    Args:
+        cursor: DB cursor
+
+    Returns:
+        List[Queue]: List of Queue statistics objects
+    """
+    cursor.execute(
+        f"""
+        SELECT q_name, sum(queued)::bigint, sum(processed)::bigint
+        FROM (
+            SELECT q_name, queued, processed FROM {get_counters_table(cursor)}
+            UNION ALL
+            SELECT q_name, queued, processed FROM {get_deltas_table(cursor)}
+        ) AS counts
+        GROUP BY q_name
+        HAVING sum(queued) + sum(processed) > 0
+        ORDER BY q_name
+        """
+    )
+
+    source = get_cursor_source(cursor).name
+
+    return [
+        Queue(
+            name=name,
+            queued=queued,
+            processed=processed,
+            total=queued + processed,
+            source=source,
+        )
+        for name, queued, processed in cursor.fetchall()
+    ]
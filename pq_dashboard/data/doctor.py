@@ -0,0 +1,426 @@
+"""
+This module contains the index advisor behind `pq-dashboard doctor`, which
+explains the queries the dashboard runs against the queue table and
+recommends indexes serving those which scan it
+"""
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pq_dashboard.config import CountStrategy, settings
+from pq_dashboard.data import search
+from pq_dashboard.data.items import (
+    ORDERINGS,
+    get_item_counts,
+    get_items,
+    get_items_and_counts,
+    get_ordering,
+)
+from pq_dashboard.data.queues import get_queue_activity, get_queue_stats
+from pq_dashboard.data.search import SearchMode
+from pq_dashboard.metrics import WAIT_BUCKETS
+from pq_dashboard.schema.item import ItemState
+from pq_dashboard.sources import get_queue_table
+from pq_dashboard.timing import TimedCursor, normalize_sql
+
+# Terms the search shapes are explained with. What matters is their mode.
+TEXT_SEARCH = "doctor"
+CONTAINS_SEARCH = '{"doctor": true}'
+
+
+class RecordingCursor(TimedCursor):
+    """Cursor recording the statements it is given, with their parameters
+    bound, without running them. Every result is empty"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: List[bytes] = []
+
+    def execute(self, query, vars=None):
+        self.statements.append(self.mogrify(query, vars))
+
+    def fetchone(self):
+        return None
+
+    def fetchmany(self, size=None):
+        return []
+
+    def fetchall(self):
+        return []
+
+
+def get_query_shapes(
+    queue_name: Optional[str] = None, watermarks: Optional[dict] = None
+) -> List[Tuple[str, Callable, dict]]:
+    """Query shapes the dashboard runs, as names, data functions and arguments
+
+    Item pages are fetched with their counts in one statement, unless the
+    counts are cached or estimated, in which case pages are fetched alone,
+    sorted by any of the orderings, and counted apart.
+
+    Args:
+        queue_name (str, optional): Queue to explain the per-queue shapes
+            with. Without one, they are left out
+        watermarks (dict, optional): Watermarks to explain the metrics
+            collector's reads with. Without them, they are left out
+    """
+    shapes = [
+        ("queue stats", get_queue_stats, {}),
+        ("item page", get_items_and_counts, {}),
+        ("queued items", get_items_and_counts, {"exclude_processed": True}),
+        ("processed items", get_items_and_counts, {"state": ItemState.processed}),
+        (
+            "text search",
+            get_items_and_counts,
+            {"search": TEXT_SEARCH, "search_mode": SearchMode.text},
+        ),
+        (
+            "contains search",
+            get_items_and_counts,
+            {"search": CONTAINS_SEARCH, "search_mode": SearchMode.contains},
+        ),
+    ]
+
+    if watermarks is not None:
+        shapes.append(
+            (
+                "queue activity",
+                get_queue_activity,
+                {"watermarks": watermarks, "bounds": WAIT_BUCKETS},
+            )
+        )
+
+    if settings.COUNT_STRATEGY != CountStrategy.exact:
+        shapes.append(("item counts", get_item_counts, {}))
+        for order_by in ORDERINGS:
+            shapes.append((f"items by {order_by}", get_items, {"order_by": order_by}))
+        shapes.append(
+            (
+                "queued items by schedule",
+                get_items,
+                {"exclude_processed": True, "order_by": "scheduledAt_ASC"},
+            )
+        )
+
+    if queue_name is not None:
+        shapes.append(("queue page", get_items_and_counts, {"queue_name": queue_name}))
+
+        if settings.COUNT_STRATEGY != CountStrategy.exact:
+            shapes.append(
+                ("queue item counts", get_item_counts, {"queue_name": queue_name})
+            )
+            shapes.append(
+                (
+                    "queued items of a queue",
+                    get_items,
+                    {"queue_name": queue_name, "exclude_processed": True},
+                )
+            )
+
+    return shapes
+
+
+def explain(cursor, statement: bytes, analyze: bool = False) -> dict:
+    """EXPLAIN a statement whose parameters are already bound
+
+    Args:
+        cursor: DB cursor
+        statement (bytes): The statement, as recorded by `RecordingCursor`
+        analyze (bool, optional): Run the statement, for actual row counts
+            and times. Defaults to False
+
+    Returns:
+        dict: The plan, in the JSON format
+    """
+    options = b"ANALYZE, FORMAT JSON" if analyze else b"FORMAT JSON"
+    cursor.execute(b"EXPLAIN (" + options + b") " + statement)
+
+    return cursor.fetchone()[0][0]
+
+
+def get_plan_nodes(node: dict) -> List[dict]:
+    """Flatten a plan node and every node below it"""
+    nodes = [node]
+    for child in node.get("Plans", []):
+        nodes.extend(get_plan_nodes(child))
+
+    return nodes
+
+
+def summarize_plan(plan: dict, queue_table: str) -> dict:
+    """Summarize a plan: its cost, its time if analyzed, and the sequential
+    scans of the queue table and sorts it needs"""
+    # Plans name relations without their schema
+    relation = queue_table.split(".")[-1]
+    nodes = get_plan_nodes(plan["Plan"])
+
+    return {
+        "cost": plan["Plan"]["Total Cost"],
+        "time": plan.get("Execution Time"),
+        "seq_scans": [
+            {"rows": node["Plan Rows"], "filter": node.get("Filter")}
+            for node in nodes
+            if node["Node Type"] == "Seq Scan" and node["Relation Name"] == relation
+        ],
+        "sorts": sum(
+            node["Node Type"] in ("Sort", "Incremental Sort") for node in nodes
+        ),
+    }
+
+
+def get_index(queue_table: str, columns: List[str], state: ItemState = None) -> dict:
+    """Recommendation of a btree index on the queue table, partial for a state"""
+    table = queue_table.split(".")[-1]
+    name = f"{table}_{'_'.join(columns)}_idx"
+    where = ""
+
+    if state == ItemState.queued:
+        name = f"{table}_queued_{'_'.join(columns)}_idx"
+        where = " WHERE dequeued_at IS NULL"
+    elif state == ItemState.processed:
+        name = f"{table}_processed_{'_'.join(columns)}_idx"
+        where = " WHERE dequeued_at IS NOT NULL"
+
+    return {
+        "name": name,
+        "kind": "btree",
+        "definition": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON {queue_table} ({', '.join(columns)}){where}",
+    }
+
+
+def get_search_index(queue_table: str, kind: str) -> dict:
+    """Recommendation of a search index, as `create-search-indexes` creates it"""
+    name = search.get_index_names(queue_table)[kind]
+    operators = (
+        "(data::TEXT) gin_trgm_ops"
+        if kind == "trigram"
+        else "(data::jsonb) jsonb_path_ops"
+    )
+
+    return {
+        "name": name,
+        "kind": kind,
+        "definition": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON {queue_table} USING gin ({operators})",
+    }
+
+
+def advise(
+    queue_table: str, func: Callable, arguments: dict
+) -> Tuple[Optional[dict], Optional[str]]:
+    """Index serving a query shape whose plan scans the queue table, or a
+    note on why no index can
+
+    Returns:
+        Tuple[Optional[dict], Optional[str]]: The recommended index, and a note
+    """
+    if arguments.get("search") is not None:
+        if arguments.get("search_mode") == SearchMode.contains:
+            return get_search_index(queue_table, "jsonb"), None
+        return get_search_index(queue_table, "trigram"), None
+
+    queue_name = arguments.get("queue_name")
+
+    if func is get_queue_stats:
+        return (
+            get_index(queue_table, ["q_name", "dequeued_at"]),
+            "An index-only scan still reads an entry per item. "
+            "`pq-dashboard install-counters` reads per-queue counts instead",
+        )
+
+    if func is get_queue_activity:
+        return get_index(queue_table, ["dequeued_at"], ItemState.processed), None
+
+    if func is get_items:
+        _, column, _ = get_ordering(arguments.get("order_by"))
+        columns = [column, "id"]
+        if queue_name is not None and column != "q_name":
+            columns = ["q_name"] + columns
+
+        state = arguments.get("state")
+        if arguments.get("exclude_processed"):
+            state = ItemState.queued
+
+        return get_index(queue_table, columns, state), None
+
+    # Counting, alone or with a page
+    if queue_name is not None:
+        return get_index(queue_table, ["q_name", "dequeued_at"]), None
+
+    return (
+        None,
+        "Exact totals count every matching item. Set PQ_DASH_COUNT_STRATEGY "
+        "to `estimated` or `cached` to avoid counting on every request",
+    )
+
+
+def get_existing_indexes(cursor) -> List[str]:
+    """Names of the valid indexes of the queue table"""
+    cursor.execute(
+        "SELECT indexrelid::regclass::text FROM pg_index "
+        "WHERE indrelid = %s::regclass AND indisvalid",
+        (get_queue_table(cursor),),
+    )
+
+    return [row[0].split(".")[-1] for row in cursor.fetchall()]
+
+
+def get_table_rows(cursor) -> int:
+    """Estimated number of items in the queue table, from its statistics"""
+    cursor.execute(
+        "SELECT reltuples::BIGINT FROM pg_class WHERE oid = %s::regclass",
+        (get_queue_table(cursor),),
+    )
+
+    return max(cursor.fetchone()[0], 0)
+
+
+def get_sample_queue(cursor) -> Optional[str]:
+    """The most common queue according to the queue table's statistics, or
+    the queue of the last item if the table was never analyzed"""
+    queue_table = get_queue_table(cursor)
+    cursor.execute(
+        "SELECT (most_common_vals::TEXT::TEXT[])[1] FROM pg_stats s "
+        "JOIN pg_namespace n ON n.nspname = s.schemaname "
+        "JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename "
+        "WHERE c.oid = %s::regclass AND s.attname = 'q_name'",
+        (queue_table,),
+    )
+    row = cursor.fetchone()
+    if row is not None and row[0] is not None:
+        return row[0]
+
+    cursor.execute(f"SELECT q_name FROM {queue_table} ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone()
+
+    return row[0] if row is not None else None
+
+
+def get_sample_watermarks(cursor) -> dict:
+    """Watermarks of a metrics collection, as the collector would read
+    its activity with after METRICS_INTERVAL seconds"""
+    cursor.execute(
+        "SELECT MAX(id), statement_timestamp(), txid_current_snapshot()::text "
+        f"FROM {get_queue_table(cursor)}"
+    )
+    last_id, now, snapshot = cursor.fetchone()
+
+    return {
+        "at": now - timedelta(seconds=settings.METRICS_INTERVAL),
+        "last_id": last_id or 0,
+        "missing": {},
+        "snapshot": snapshot,
+    }
+
+
+def diagnose(
+    connection, analyze: bool = False, queue_name: Optional[str] = None
+) -> Tuple[List[dict], List[dict]]:
+    """Explain every query shape of the dashboard, and recommend indexes
+    for those which sequentially scan the queue table
+
+    Each shape's data function is given a cursor which records its
+    statements without running them, and those querying the queue table
+    are explained. This way the statements explained are exactly those the
+    dashboard runs, while only their plans are computed. With `analyze`,
+    they run once, under EXPLAIN ANALYZE.
+
+    Args:
+        connection: DB connection
+        analyze (bool, optional): EXPLAIN ANALYZE the statements. Defaults to False
+        queue_name (str, optional): Queue to explain per-queue shapes with.
+            Defaults to the most common queue in the table's statistics
+
+    Returns:
+        Tuple[List[dict], List[dict]]: Each shape's name and summarized
+            statements, with its recommended index and note if it scans
+            the queue table, and the distinct indexes recommended
+    """
+    with connection.cursor() as cursor, connection.cursor(
+        cursor_factory=RecordingCursor
+    ) as recorder:
+        queue_table = get_queue_table(cursor)
+        relation = queue_table.split(".")[-1].encode()
+        existing = get_existing_indexes(cursor)
+        watermarks = get_sample_watermarks(cursor)
+
+        if queue_name is None:
+            queue_name = get_sample_queue(cursor)
+
+        shapes = []
+        recommendations: Dict[str, dict] = {}
+
+        for name, func, arguments in get_query_shapes(queue_name, watermarks):
+            recorder.statements = []
+            try:
+                func(recorder, **arguments)
+            except (LookupError, TypeError):
+                # Functions expecting a row stop at the empty results, after
+                # their statements were recorded
+                pass
+
+            statements = []
+            for statement in recorder.statements:
+                if (
+                    relation not in statement
+                    or not statement.lstrip().upper().startswith((b"SELECT", b"WITH"))
+                ):
+                    continue
+
+                plan = explain(cursor, statement, analyze=analyze)
+                statements.append(
+                    {
+                        "sql": normalize_sql(statement),
+                        **summarize_plan(plan, queue_table),
+                    }
+                )
+
+            shape = {
+                "name": name,
+                "statements": statements,
+                "index": None,
+                "note": None,
+            }
+
+            if any(statement["seq_scans"] for statement in statements):
+                index, shape["note"] = advise(queue_table, func, arguments)
+                if index is not None and index["name"] not in existing:
+                    shape["index"] = index
+                    recommendations.setdefault(index["name"], index)
+
+            shapes.append(shape)
+
+    connection.rollback()
+
+    return shapes, list(recommendations.values())
+
+
+def create_indexes(cursor, indexes: List[dict]) -> List[str]:
+    """Create recommended indexes without blocking writers
+
+    Search indexes are created by `create_search_indexes`, which also
+    creates the pg_trgm extension if the trigram index needs it.
+
+    Args:
+        cursor: DB cursor on an autocommit connection
+        indexes (List[dict]): Indexes recommended by `diagnose`
+
+    Returns:
+        List[str]: Names of the indexes created
+    """
+    kinds = {index["kind"] for index in indexes}
+    created = []
+
+    if "trigram" in kinds or "jsonb" in kinds:
+        created.extend(
+            search.create_search_indexes(
+                cursor, trigram="trigram" in kinds, jsonb="jsonb" in kinds
+            )
+        )
+
+    for index in indexes:
+        if index["kind"] == "btree":
+            cursor.execute(index["definition"])
+            created.append(index["name"])
+
+    return created
@@ -0,0 +1,170 @@
+"""This module contains helper methods for exporting items in bulk"""
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Iterator, Optional
+
+from psycopg2.extras import DictCursor
+
+from pq_dashboard.config import settings
+from pq_dashboard.data.items import (
+    PayloadEncoding,
+    decode_payload_encoding,
+    get_filter_clauses,
+    get_where_clause,
+)
+from pq_dashboard.sources import get_queue_table
+
+EXPORT_COLUMNS = [
+    "id",
+    "q_name",
+    "enqueued_at",
+    "dequeued_at",
+    "expected_at",
+    "schedule_at",
+    "encoding",
+    "data",
+    "raw",
+]
+
+# Rows are written out in chunks of about this many characters
+CHUNK_SIZE = 64 * 1024
+
+
+class ExportFormat(str, Enum):
+    """File format of an export"""
+
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+def json_default(value):
+    """Serialize the values pickled payloads may hold which JSON cannot"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("latin-1")
+
+    return repr(value)
+
+
+def get_export_record(row) -> dict:
+    """Build the exported record of a queue row
+
+    The payload is decoded into `data`. Pickled payloads are also exported
+    as stored in `raw`, so importing them restores the exact same object.
+    """
+    data, encoding = decode_payload_encoding(row["data"])
+
+    return {
+        "id": row["id"],
+        "q_name": row["q_name"],
+        "enqueued_at": row["enqueued_at"],
+        "dequeued_at": row["dequeued_at"],
+        "expected_at": row["expected_at"],
+        "schedule_at": row["schedule_at"],
+        "encoding": encoding.value,
+        "data": data,
+        "raw": row["data"] if encoding == PayloadEncoding.pickle else None,
+    }
+
+
+def get_csv_value(column: str, value):
+    """Format one field of an exported record for CSV"""
+    if value is None:
+        return ""
+    if column == "data":
+        return json.dumps(value, default=json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+def format_ndjson(record: dict, buffer: io.StringIO):
+    buffer.write(json.dumps(record, default=json_default))
+    buffer.write("\n")
+
+
+def format_csv(writer) -> Callable[[dict, io.StringIO], None]:
+    def write(record: dict, buffer: io.StringIO):
+        writer.writerow(
+            [get_csv_value(column, record[column]) for column in EXPORT_COLUMNS]
+        )
+
+    return write
+
+
+def export_items(
+    connection,
+    format: ExportFormat = ExportFormat.ndjson,
+    fetch_size: int = None,
+    progress: Optional[Callable[[int], None]] = None,
+    **filters,
+) -> Iterator[str]:
+    """Export items as chunks of NDJSON or CSV, in constant memory
+
+    Rows are read through a server-side cursor `fetch_size` at a time, and
+    decoded and formatted as they arrive, so exports of any size can be
+    streamed to a file or a client.
+
+    Args:
+        connection: DB connection, which must not be in autocommit mode
+        format (ExportFormat, optional): Output format. Defaults to ndjson
+        fetch_size (int, optional): Rows fetched per round trip.
+            Defaults to `settings.EXPORT_FETCH_SIZE`
+        progress (Callable[[int], None], optional): Called with the number
+            of items exported so far after every chunk
+        **filters: Filters as accepted by `get_filter_clauses`
+
+    Yields:
+        str: Chunks of the export
+    """
+    where_clauses, params = get_filter_clauses(**filters)
+
+    buffer = io.StringIO()
+
+    if format == ExportFormat.csv:
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        write = format_csv(writer)
+    else:
+        write = format_ndjson
+
+    exported = 0
+
+    with connection.cursor(
+        name="pq_dashboard_export", cursor_factory=DictCursor
+    ) as cursor:
+        cursor.itersize = fetch_size or settings.EXPORT_FETCH_SIZE
+        cursor.execute(
+            "SELECT id, q_name, enqueued_at, dequeued_at, expected_at, schedule_at, data "
+            f"FROM {get_queue_table(cursor)}"
+            + get_where_clause(where_clauses)
+            + " ORDER BY id",
+            tuple(params),
+        )
+
+        for row in cursor:
+            write(get_export_record(row), buffer)
+            exported += 1
+
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+                if progress is not None:
+                    progress(exported)
+
+    connection.commit()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+    if progress is not None:
+        progress(exported)
@@ -0,0 +1,125 @@
+"""This module contains helper methods for importing items in bulk"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+from pq_dashboard.config import settings
+from pq_dashboard.data.export import ExportFormat
+from pq_dashboard.data.items import PayloadEncoding, encode_payload
+from pq_dashboard.sources import get_queue_table
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    """Read the records of an NDJSON export"""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[dict]:
+    """Read the records of a CSV export, decoding payloads and blank fields"""
+    for row in csv.DictReader(lines):
+        record = {key: (value if value != "" else None) for key, value in row.items()}
+        if record.get("data") is not None:
+            record["data"] = json.loads(record["data"])
+        yield record
+
+
+def get_stored_payload(record: dict):
+    """Get the value to store in the `data` column for an exported record
+
+    Pickled payloads are restored exactly as they were exported when their
+    `raw` form is available, and pickled again otherwise.
+    """
+    encoding = PayloadEncoding(record.get("encoding") or PayloadEncoding.json)
+
+    if encoding == PayloadEncoding.pickle and record.get("raw") is not None:
+        return record["raw"]
+
+    return encode_payload(record["data"], encoding)
+
+
+def format_timestamp(value) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+def import_items(
+    cursor,
+    lines: Iterable[str],
+    format: ExportFormat = ExportFormat.ndjson,
+    queue_name: str = None,
+    schedule_at: datetime = None,
+    chunk_size: int = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Import the items of an export as new queued items, with COPY
+
+    Records are sent with `COPY ... FROM STDIN` `chunk_size` at a time, each
+    chunk committed on its own. Payloads are stored the same way pq stores
+    them, so that items of pickle queues can be taken by pq workers.
+
+    Args:
+        cursor: DB cursor
+        lines (Iterable[str]): Lines of an NDJSON or CSV export
+        format (ExportFormat, optional): Format of the export. Defaults to ndjson
+        queue_name (str, optional): Queue to put every item in, instead
+            of the queue it was exported from
+        schedule_at (datetime, optional): Time to schedule every item for,
+            instead of the time it was scheduled for when exported
+        chunk_size (int, optional): Items copied per transaction.
+            Defaults to `settings.IMPORT_CHUNK_SIZE`
+        progress (Callable[[int], None], optional): Called with the number
+            of items imported so far after every chunk
+
+    Returns:
+        int: Number of items imported
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    records = read_csv(lines) if format == ExportFormat.csv else read_ndjson(lines)
+
+    statement = (
+        f"COPY {get_queue_table(cursor)} (q_name, data, schedule_at, expected_at) "
+        "FROM STDIN WITH (FORMAT csv)"
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    imported = 0
+    pending = 0
+
+    def copy():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        cursor.connection.commit()
+        buffer.seek(0)
+        buffer.truncate()
+
+        if progress is not None:
+            progress(imported)
+
+    for record in records:
+        # Unquoted empty fields are NULL in COPY's CSV format
+        writer.writerow(
+            [
+                queue_name or record["q_name"],
+                json.dumps(get_stored_payload(record)),
+                format_timestamp(schedule_at or record.get("schedule_at")),
+                format_timestamp(record.get("expected_at")),
+            ]
+        )
+        imported += 1
+        pending += 1
+
+        if pending >= chunk_size:
+            copy()
+            pending = 0
+
+    if pending:
+        copy()
+
+    return imported
@@ -1,36 +1,101 @@
 """This module contains helper methods for working with items"""
+import base64
+import binascii
 import json
 import pickle
-from typing import Dict, List
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pq_dashboard.cache import TTLCache
+from pq_dashboard.config import CountStrategy, settings
+from pq_dashboard.data.batching import delete_in_batches
+from pq_dashboard.data.search import (
+    SearchMode,
+    get_search_clause,
+    resolve_search_mode,
+    validate_search,
+)
+from pq_dashboard.schema.item import Item, ItemState
+from pq_dashboard.sources import get_cursor_source, get_queue_table
+from pq_dashboard.timing import phase, timed
+
+_count_cache = TTLCache(ttl=settings.COUNT_CACHE_TTL)
+
+
+def get_filter_clauses(
+    queue_name: str = None,
+    exclude_processed: bool = False,
+    search: str = None,
+    search_mode=SearchMode.text,
+    state: ItemState = None,
+    enqueued_after: datetime = None,
+    enqueued_before: datetime = None,
+    ids: List[int] = None,
+) -> Tuple[List[str], list]:
+    """Build the WHERE conditions and parameters shared by item queries"""
+    where_clauses = []
+    params = []
 
-from pq_dashboard.config import settings
-from pq_dashboard.schema.item import Item
+    if ids is not None:
+        where_clauses.append("id = ANY(%s)")
+        params.append(list(ids))
 
+    if queue_name is not None:
+        where_clauses.append("q_name = %s")
+        params.append(queue_name)
 
-def get_item_counts(
-    cursor, queue_name: str = None, search: str = None
-) -> Dict[str, int]:
-    """Get count of queued, processed and total items"""
-    statement = f"SELECT (dequeued_at IS NOT NULL) AS dequeued, COUNT(dequeued_at IS NOT NULL) FROM {settings.QUEUE_TABLE}"
-    parameters = []
+    if exclude_processed == True or state == ItemState.queued:
+        where_clauses.append("dequeued_at IS NULL")
+    elif state == ItemState.processed:
+        where_clauses.append("dequeued_at IS NOT NULL")
 
-    where_clauses = []
+    if enqueued_after is not None:
+        where_clauses.append("enqueued_at >= %s")
+        params.append(enqueued_after)
 
-    if queue_name is not None:
-        where_clauses.append("q_name = %s")
-        parameters.append(queue_name)
+    if enqueued_before is not None:
+        where_clauses.append("enqueued_at < %s")
+        params.append(enqueued_before)
 
     if search is not None:
-        search = search.replace("=", "==").replace("%", "=%").replace("_", "=_")
-        where_clauses.append("data::TEXT ILIKE %s ESCAPE '='")
-        parameters.append("%" + search + "%")
+        search_clause, search_params = get_search_clause(search, search_mode)
+        where_clauses.append(search_clause)
+        params.extend(search_params)
 
+    return where_clauses, params
+
+
+def get_where_clause(where_clauses: List[str]) -> str:
+    """Join WHERE conditions into a clause, or nothing if there are none"""
     if len(where_clauses) > 0:
-        where_clause = " WHERE " + " AND ".join(where_clauses)
-    else:
-        where_clause = ""
+        return " WHERE " + " AND ".join(where_clauses)
 
-    statement += where_clause
+    return ""
+
+
+@timed("get_item_counts")
+def get_item_counts(
+    cursor,
+    queue_name: str = None,
+    search: str = None,
+    search_mode=SearchMode.text,
+    enqueued_after: datetime = None,
+    enqueued_before: datetime = None,
+) -> Dict[str, int]:
+    """Get count of queued, processed and total items"""
+    statement = f"SELECT (dequeued_at IS NOT NULL) AS dequeued, COUNT(dequeued_at IS NOT NULL) FROM {get_queue_table(cursor)}"
+
+    where_clauses, parameters = get_filter_clauses(
+        queue_name,
+        search=search,
+        search_mode=search_mode,
+        enqueued_after=enqueued_after,
+        enqueued_before=enqueued_before,
+    )
+
+    statement += get_where_clause(where_clauses)
     statement += " GROUP BY dequeued"
 
     cursor.execute(statement, tuple(parameters))
@@ -39,34 +104,318 @@ def get_item_counts(
 
     labels = {True: "processed", False: "queued"}
 
-    response = {labels[state]: count for state, count in results}
+    response = {"queued": 0, "processed": 0}
+    response.update({labels[state]: count for state, count in results})
 
     response["total"] = sum(response.values())
 
     return response
 
 
-def get_order_by_clause(order_by=None):
+@timed("estimate_item_counts")
+def estimate_item_counts(
+    cursor,
+    queue_name: str = None,
+    search: str = None,
+    search_mode=SearchMode.text,
+    enqueued_after: datetime = None,
+    enqueued_before: datetime = None,
+) -> Dict[str, int]:
+    """Estimate count of queued, processed and total items from the query planner
+
+    Only the plans are computed, so this costs the same however large the table.
+    """
+    response = {}
+
+    for state in ItemState:
+        where_clauses, parameters = get_filter_clauses(
+            queue_name,
+            search=search,
+            search_mode=search_mode,
+            state=state,
+            enqueued_after=enqueued_after,
+            enqueued_before=enqueued_before,
+        )
+
+        cursor.execute(
+            f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {get_queue_table(cursor)}"
+            + get_where_clause(where_clauses),
+            tuple(parameters),
+        )
+        plan = cursor.fetchone()[0]
+
+        response[state.value] = int(plan[0]["Plan"]["Plan Rows"])
+
+    response["total"] = response["queued"] + response["processed"]
+
+    return response
+
+
+def count_items(
+    cursor,
+    queue_name: str = None,
+    search: str = None,
+    search_mode=SearchMode.text,
+    enqueued_after: datetime = None,
+    enqueued_before: datetime = None,
+    strategy=None,
+) -> Tuple[Dict[str, int], bool]:
+    """Get count of queued, processed and total items using a counting strategy
+
+    Args:
+        cursor: DB cursor
+        queue_name (str, optional): Queue to count items in
+        search (str, optional): Only count items matching this term
+        search_mode (SearchMode, optional): How `search` is matched
+        enqueued_after (datetime, optional): Only count items enqueued since
+        enqueued_before (datetime, optional): Only count items enqueued before
+        strategy (CountStrategy, optional): Defaults to `settings.COUNT_STRATEGY`
+
+    Returns:
+        Tuple[Dict[str, int], bool]: The counts, and whether they are exact
+    """
+    filters = {
+        "queue_name": queue_name,
+        "search": search,
+        "search_mode": search_mode,
+        "enqueued_after": enqueued_after,
+        "enqueued_before": enqueued_before,
+    }
+
+    counts = peek_item_counts(cursor, strategy, **filters)
+    if counts is not None:
+        return counts, False
+
+    counts = get_item_counts(cursor, **filters)
+    remember_item_counts(cursor, counts, strategy, **filters)
+
+    return counts, True
+
+
+def get_count_key(cursor, **filters) -> tuple:
+    """Key of the counts of the items matching `count_items` filters in the cache"""
+    return (
+        get_cursor_source(cursor).name,
+        get_queue_table(cursor),
+        filters.get("queue_name"),
+        filters.get("search"),
+        SearchMode(filters.get("search_mode") or SearchMode.text),
+        filters.get("enqueued_after"),
+        filters.get("enqueued_before"),
+    )
+
+
+def peek_item_counts(cursor, strategy=None, **filters) -> Optional[Dict[str, int]]:
+    """Get approximate counts of items without counting them, if the
+    counting strategy allows it
+
+    Takes the same filters as `count_items`.
+
+    Returns:
+        Optional[Dict[str, int]]: Cached counts under the cached strategy,
+            or estimates of at least COUNT_EXACT_THRESHOLD items under the
+            estimated strategy. None if the items must be counted exactly
+    """
+    strategy = CountStrategy(strategy or settings.COUNT_STRATEGY)
+
+    if strategy == CountStrategy.cached:
+        return _count_cache.get(get_count_key(cursor, **filters))
+
+    if strategy == CountStrategy.estimated:
+        counts = estimate_item_counts(cursor, **filters)
+        if counts["total"] >= settings.COUNT_EXACT_THRESHOLD:
+            return counts
+
+    return None
+
+
+def remember_item_counts(cursor, counts: Dict[str, int], strategy=None, **filters):
+    """Cache exact counts of items, if the counting strategy reuses them"""
+    strategy = CountStrategy(strategy or settings.COUNT_STRATEGY)
+
+    if strategy == CountStrategy.cached:
+        _count_cache.set(get_count_key(cursor, **filters), counts)
+
+
+def clear_count_cache():
+    """Forget cached counts, e.g. after items have been added or removed"""
+    _count_cache.clear()
+
+
+ORDERINGS: Dict[str, Tuple[str, str]] = {
+    "enqueuedAt_ASC": ("enqueued_at", "ASC"),
+    "enqueuedAt_DESC": ("enqueued_at", "DESC"),
+    "dequeuedAt_ASC": ("dequeued_at", "ASC"),
+    "dequeuedAt_DESC": ("dequeued_at", "DESC"),
+    "expectedAt_ASC": ("expected_at", "ASC"),
+    "expectedAt_DESC": ("expected_at", "DESC"),
+    "scheduledAt_ASC": ("schedule_at", "ASC"),
+    "scheduledAt_DESC": ("schedule_at", "DESC"),
+    "queue_ASC": ("q_name", "ASC"),
+    "queue_DESC": ("q_name", "DESC"),
+}
+DEFAULT_ORDERING = "enqueuedAt_ASC"
+
+# Sort columns which may be NULL. Postgres sorts NULLs last
+# for ASC and first for DESC, which keyset predicates must respect.
+NULLABLE_COLUMNS = {"dequeued_at", "expected_at", "schedule_at"}
+
+
+def get_ordering(order_by=None) -> Tuple[str, str, str]:
+    """Resolve a frontend ordering name to (name, column, direction)"""
+    if order_by not in ORDERINGS:
+        order_by = DEFAULT_ORDERING
+
+    column, direction = ORDERINGS[order_by]
+
+    return order_by, column, direction
+
+
+def get_order_by_clause(order_by=None, keyset=False):
     """
     Helper method to build an ordering clause based on
-    selected ordering from the frontend
+    selected ordering from the frontend. Ties are broken by id so
+    that pages are stable, and keyset pages have no OFFSET.
+    """
+    _, column, direction = get_ordering(order_by)
+
+    clause = f" ORDER BY {column} {direction}, id {direction} LIMIT %s"
+
+    if not keyset:
+        clause += " OFFSET %s"
+
+    return clause
+
+
+def encode_page_token(order_by, item: Item) -> str:
+    """Build an opaque `after` token pointing just past the given item"""
+    order_by, column, _ = get_ordering(order_by)
+
+    value = getattr(item, column)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    payload = json.dumps([order_by, value, item.id]).encode("utf-8")
+
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_page_token(order_by, token: str) -> Tuple[Any, int]:
+    """Decode an `after` token into the sort value and id of the last row seen
+
+    Raises:
+        ValueError: If the token is malformed or was issued for another ordering
+    """
+    order_by, column, _ = get_ordering(order_by)
+
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        token_order_by, value, item_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode("ascii"))
+        )
+        item_id = int(item_id)
+
+        if value is not None and column != "q_name":
+            value = datetime.fromisoformat(value)
+    except (TypeError, ValueError, UnicodeError, binascii.Error) as err:
+        raise ValueError("Invalid page token") from err
+
+    if token_order_by != order_by:
+        raise ValueError("Page token was issued for a different ordering")
+
+    if value is None and column not in NULLABLE_COLUMNS:
+        raise ValueError("Invalid page token")
+
+    return value, item_id
+
+
+def get_keyset_clause(order_by, token: str) -> Tuple[str, list]:
+    """Build a WHERE clause selecting rows after the one encoded in `token`"""
+    _, column, direction = get_ordering(order_by)
+    value, item_id = decode_page_token(order_by, token)
+
+    if value is None:
+        if direction == "ASC":
+            # NULLs sort last, so only later NULLs remain
+            return f"({column} IS NULL AND id > %s)", [item_id]
+        # NULLs sort first, so later NULLs and every non-NULL row remain
+        return f"(({column} IS NULL AND id < %s) OR {column} IS NOT NULL)", [item_id]
+
+    operator = ">" if direction == "ASC" else "<"
+    clause = f"({column}, id) {operator} (%s, %s)"
+
+    if direction == "ASC" and column in NULLABLE_COLUMNS:
+        clause = f"({clause} OR {column} IS NULL)"
+
+    return clause, [value, item_id]
+
+
+def get_item_columns(alias: str = "") -> Tuple[str, str, list]:
+    """Build the columns listing items, the join they read payloads from,
+    and their parameters
+
+    Payloads above PREVIEW_SIZE bytes are not sent in full, so they never
+    leave Postgres just to be listed. Objects and arrays are sent as a
+    truncated preview of their JSON, and other payloads, such as pickles,
+    only by their size. Each payload is serialized and measured once, by
+    the join.
+
+    Args:
+        alias (str, optional): Alias of the queue table to qualify columns with
+
+    Returns:
+        Tuple[str, str, list]: The columns, the join to add after the queue
+            table, and the parameters of the columns
     """
-    ordering = {
-        "enqueuedAt_ASC": " enqueued_at ASC ",
-        "enqueuedAt_DESC": " enqueued_at DESC ",
-        "dequeuedAt_ASC": "dequeued_at ASC",
-        "dequeuedAt_DESC": "dequeued_at DESC",
-        "expectedAt_ASC": "expected_at ASC",
-        "expectedAt_DESC": "expected_at DESC",
-        "scheduledAt_ASC": "scheduled_at ASC",
-        "scheduledAt_DESC": "scheduled_at DESC",
-        "queue_ASC": "q_name ASC",
-        "queue_DESC": "q_name DESC",
-    }.get(order_by, "enqueued_at ASC")
+    table = f"{alias}." if alias else ""
+    columns = (
+        f"{table}id, {table}enqueued_at, {table}dequeued_at, {table}expected_at, "
+        f"{table}schedule_at, {table}q_name, payload.size, "
+        f"CASE WHEN payload.size <= %s THEN {table}data END AS data, "
+        "payload.size > %s AS truncated, "
+        f"CASE WHEN payload.size > %s AND json_typeof({table}data::json) "
+        "IN ('object', 'array') THEN left(payload.text, %s) END AS preview"
+    )
+    # OFFSET 0 keeps the subqueries from being inlined into every column
+    # which reads them
+    join = (
+        " CROSS JOIN LATERAL (SELECT text, octet_length(text) AS size FROM "
+        f"(SELECT {table}data::text AS text OFFSET 0) AS serialized OFFSET 0) "
+        "AS payload"
+    )
 
-    return f" ORDER BY {ordering} LIMIT %s OFFSET %s"
+    return columns, join, [settings.PREVIEW_SIZE] * 4
 
 
+def coerce_payload(data):
+    """Coerce a decoded payload the way validating `Item.data` would
+
+    Numbers and booleans, which JSON payloads may be and pickled payloads
+    may hold, are listed as strings, like the other scalars.
+    """
+    if isinstance(data, (int, float, Decimal)):
+        return str(data)
+
+    return data
+
+
+def make_items(cursor, rows) -> List[Item]:
+    """Build items from rows of `get_item_columns`, decoding their payloads"""
+    source = get_cursor_source(cursor).name
+    items = []
+    with phase("decode"):
+        for object in rows:
+            if not object["truncated"]:
+                object["data"] = coerce_payload(decode_payload(object["data"]))
+
+            # Rows are exactly the shape of an Item, so validating them
+            # again would only cost time on large pages
+            items.append(Item.construct(**object, source=source))
+
+    return items
+
+
+@timed("get_items")
 def get_items(
     cursor,
     limit=25,
@@ -75,6 +424,11 @@ def get_items(
     exclude_processed=False,
     search=None,
     order_by=None,
+    after=None,
+    search_mode=SearchMode.text,
+    state=None,
+    enqueued_after=None,
+    enqueued_before=None,
 ) -> List[Item]:
     """Get queue items
 
@@ -82,61 +436,309 @@ def get_items(
         cursor: DB cursor
         limit (int, optional): How many items to fetch. Defaults to 25.
         offset (int, optional): How many items to skip fetching. Defaults to 0.
+        after (str, optional): Page token from `encode_page_token`. When given,
+            items after that token are fetched by keyset and `offset` is ignored.
+        search_mode (SearchMode, optional): How `search` is matched. Defaults to text.
+        state (ItemState, optional): Only fetch queued or processed items
+        enqueued_after (datetime, optional): Only fetch items enqueued since
+        enqueued_before (datetime, optional): Only fetch items enqueued before
 
     Returns:
         List[Item]: Items retrieved from the relevant queue table
     """
-    select_clause = f"SELECT id, enqueued_at, dequeued_at, expected_at, schedule_at, q_name, data FROM {settings.QUEUE_TABLE}"
-    params = []
+    columns, join, column_params = get_item_columns()
+    select_clause = f"SELECT {columns} FROM {get_queue_table(cursor)}{join}"
+
+    where_clauses, params = get_filter_clauses(
+        queue_name,
+        exclude_processed,
+        search,
+        search_mode,
+        state=state,
+        enqueued_after=enqueued_after,
+        enqueued_before=enqueued_before,
+    )
+    params = column_params + params
 
-    where_clauses = []
+    if after is not None:
+        keyset_clause, keyset_params = get_keyset_clause(order_by, after)
+        where_clauses.append(keyset_clause)
+        params.extend(keyset_params)
 
-    if queue_name is not None:
-        where_clauses.append("q_name = %s")
-        params.append(queue_name)
+        order_by_clause = get_order_by_clause(order_by, keyset=True)
+        params.append(limit)
+    else:
+        order_by_clause = get_order_by_clause(order_by)
+        params.extend([limit, offset])
 
-    if exclude_processed == True:
-        where_clauses.append("dequeued_at IS NULL")
+    cursor.execute(
+        select_clause + get_where_clause(where_clauses) + order_by_clause,
+        tuple(params),
+    )
 
-    if search is not None:
-        search = search.replace("=", "==").replace("%", "=%").replace("_", "=_")
-        where_clauses.append("data::TEXT ILIKE %s ESCAPE '='")
-        params.append("%" + search + "%")
+    return make_items(cursor, cursor.fetchall())
 
-    order_by_clause = get_order_by_clause(order_by)
-    params.extend([limit, offset])
 
-    if len(where_clauses) > 0:
-        where_clause = " WHERE " + " AND ".join(where_clauses)
+@timed("get_items_and_counts")
+def get_items_and_counts(
+    cursor,
+    limit=25,
+    offset=0,
+    queue_name=None,
+    exclude_processed=False,
+    search=None,
+    order_by=None,
+    after=None,
+    search_mode=SearchMode.text,
+    state=None,
+    enqueued_after=None,
+    enqueued_before=None,
+) -> Tuple[List[Item], Dict[str, int]]:
+    """Get queue items, and the counts `get_item_counts` would get, in one statement
+
+    Takes the same arguments as `get_items`. The counts and the page are
+    separate subqueries of the queue table, so that the page is planned
+    like `get_items`' and can read an index in order and stop at its
+    limit, whatever the number of items counted. Only the page's items
+    are then read in full, so payloads are not read for items sorted out
+    of the page.
+
+    Returns:
+        Tuple[List[Item], Dict[str, int]]: The items, and the count of
+            queued, processed and total items matching all but the state and
+            keyset filters of the page
+    """
+    table = get_queue_table(cursor)
+    _, column, direction = get_ordering(order_by)
+
+    where_clauses, params = get_filter_clauses(
+        queue_name,
+        search=search,
+        search_mode=search_mode,
+        enqueued_after=enqueued_after,
+        enqueued_before=enqueued_before,
+    )
+    page_clauses, page_params = get_filter_clauses(
+        exclude_processed=exclude_processed, state=state
+    )
+
+    if after is not None:
+        keyset_clause, keyset_params = get_keyset_clause(order_by, after)
+        page_clauses.append(keyset_clause)
+        page_params.extend(keyset_params)
+
+        order_by_clause = get_order_by_clause(order_by, keyset=True)
+        page_params.append(limit)
     else:
-        where_clause = ""
+        order_by_clause = get_order_by_clause(order_by)
+        page_params.extend([limit, offset])
+
+    columns, join, column_params = get_item_columns("item")
+
+    statement = (
+        f"SELECT {columns}, queued_count, processed_count FROM (SELECT "
+        "COUNT(*) FILTER (WHERE dequeued_at IS NULL) AS queued_count, "
+        "COUNT(*) FILTER (WHERE dequeued_at IS NOT NULL) AS processed_count "
+        f"FROM {table}"
+        + get_where_clause(where_clauses)
+        + f") AS counts LEFT JOIN ((SELECT id FROM {table}"
+        + get_where_clause(where_clauses + page_clauses)
+        + order_by_clause
+        + f") AS page JOIN {table} item USING (id){join}) ON true "
+        f"ORDER BY item.{column} {direction}, item.id {direction}"
+    )
 
-    cursor.execute(
-        select_clause + where_clause + order_by_clause,
-        tuple(params),
+    cursor.execute(statement, tuple(column_params + params + params + page_params))
+    rows = cursor.fetchall()
+
+    # There is always a row of counts, which has no item if the page is empty
+    counts = {
+        "queued": rows[0]["queued_count"],
+        "processed": rows[0]["processed_count"],
+    }
+    counts["total"] = counts["queued"] + counts["processed"]
+
+    items = make_items(
+        cursor,
+        [
+            {key: value for key, value in row.items() if not key.endswith("_count")}
+            for row in rows
+            if row["id"] is not None
+        ],
     )
 
-    items = []
-    for object in cursor.fetchall():
+    return items, counts
+
+
+def get_item_page(
+    cursor,
+    limit=25,
+    offset=0,
+    queue_name=None,
+    exclude_processed=False,
+    search=None,
+    order_by=None,
+    after=None,
+    search_mode=SearchMode.auto,
+    state=None,
+    enqueued_after=None,
+    enqueued_before=None,
+) -> Tuple[List[Item], int, bool]:
+    """Get a page of items, and how many items match its filters
+
+    Takes the same arguments as `get_items`, with `auto` search modes
+    resolved to text. When the
+    items must be counted exactly, they are counted by the same statement
+    as the page is fetched with.
 
-        if isinstance(object["data"], str):
-            # data is a string for PQ's pickled queues.
-            # In this case we try to deserialize using pickle
-            try:
-                object["data"] = pickle.loads(object["data"].encode("latin-1"))
-            except pickle.UnpicklingError as err:
-                # We assume the fact it's an invalid pickle means it's an ordinary string
-                pass
+    Returns:
+        Tuple[List[Item], int, bool]: The items, the number of matching
+            items, and whether that number is exact
 
-        if isinstance(object["data"], bytes):
-            try:
-                object["data"] = pickle.loads(object["data"])
-            except pickle.UnpicklingError as err:
-                object["data"] = "<unknown binary data>"
+    Raises:
+        ValueError: If the search term is invalid for its mode
+    """
+    if search is not None:
+        search_mode = resolve_search_mode(search_mode)
+        validate_search(cursor, search, search_mode)
+
+    filters = {
+        "queue_name": queue_name,
+        "search": search,
+        "search_mode": search_mode,
+        "enqueued_after": enqueued_after,
+        "enqueued_before": enqueued_before,
+    }
+    page = {
+        "limit": limit,
+        "offset": offset,
+        "exclude_processed": exclude_processed,
+        "order_by": order_by,
+        "after": after,
+        "state": state,
+    }
+
+    totals = peek_item_counts(cursor, **filters)
+    if totals is None:
+        records, totals = get_items_and_counts(cursor, **page, **filters)
+        remember_item_counts(cursor, totals, **filters)
+        total_exact = True
+    else:
+        records = get_items(cursor, **page, **filters)
+        total_exact = False
+
+    if exclude_processed or state == ItemState.queued:
+        total = totals["queued"]
+    elif state == ItemState.processed:
+        total = totals["processed"]
+    else:
+        total = totals["total"]
 
-        items.append(Item(**object))
+    return records, total, total_exact
 
-    return items
+
+def sort_items(items: List[Item], order_by=None) -> List[Item]:
+    """Sort items from several queue tables the way `get_order_by_clause`
+    sorts the items of one"""
+    _, column, direction = get_ordering(order_by)
+
+    # Postgres sorts NULLs as if larger than any value
+    def key(item: Item):
+        value = getattr(item, column)
+        return (value is None, value, item.id)
+
+    return sorted(items, key=key, reverse=direction == "DESC")
+
+
+class PayloadEncoding(str, Enum):
+    """How a payload is stored in the `data` column"""
+
+    json = "json"
+    pickle = "pickle"
+
+
+def decode_payload(data):
+    """Decode an item payload, unpickling it if it was put in a pickle queue
+
+    Args:
+        data: Payload as stored in the `data` column
+
+    Returns:
+        Decoded payload
+    """
+    return decode_payload_encoding(data)[0]
+
+
+def decode_payload_encoding(data) -> Tuple[Any, PayloadEncoding]:
+    """Decode an item payload, also reporting how it was encoded
+
+    Args:
+        data: Payload as stored in the `data` column
+
+    Returns:
+        Tuple[Any, PayloadEncoding]: Decoded payload and its encoding
+    """
+    if isinstance(data, str):
+        # data is a string for PQ's pickled queues.
+        # In this case we try to deserialize using pickle
+        try:
+            return pickle.loads(data.encode("latin-1")), PayloadEncoding.pickle
+        except pickle.UnpicklingError as err:
+            # We assume the fact it's an invalid pickle means it's an ordinary string
+            pass
+
+    if isinstance(data, bytes):
+        try:
+            return pickle.loads(data), PayloadEncoding.pickle
+        except pickle.UnpicklingError as err:
+            data = "<unknown binary data>"
+
+    return data, PayloadEncoding.json
+
+
+def encode_payload(data, encoding: PayloadEncoding = PayloadEncoding.json):
+    """Encode a payload for the `data` column the way pq does for its queues
+
+    Args:
+        data: Decoded payload
+        encoding (PayloadEncoding, optional): Encoding of the target queue
+
+    Returns:
+        Value to store, as JSON, in the `data` column
+    """
+    if encoding == PayloadEncoding.pickle:
+        # Pickle protocol 0 is treated as Latin-1 so it can be stored as JSON
+        return pickle.dumps(data, 0).decode("latin-1")
+
+    return data
+
+
+@timed("get_item")
+def get_item(cursor, item_id: int) -> Optional[Item]:
+    """Get a single item, with its full decoded payload
+
+    Args:
+        cursor: DB cursor
+        item_id (int): ID of the item to fetch
+
+    Returns:
+        Optional[Item]: The item, or None if there is no item with that ID
+    """
+    cursor.execute(
+        "SELECT id, enqueued_at, dequeued_at, expected_at, schedule_at, q_name, "
+        f"octet_length(data::text) AS size, data FROM {get_queue_table(cursor)} "
+        "WHERE id = %s",
+        (item_id,),
+    )
+    object = cursor.fetchone()
+
+    if object is None:
+        return None
+
+    with phase("decode"):
+        object["data"] = decode_payload(object["data"])
+
+    return Item(**object, source=get_cursor_source(cursor).name)
 
 
 def delete_item(cursor, item_id: int):
@@ -146,7 +748,7 @@ def delete_item(cursor, item_id: int):
         cursor: DB cursor
         item_id (int): ID of the item to delete
     """
-    cursor.execute(f"DELETE FROM {settings.QUEUE_TABLE} WHERE id = %s", (item_id,))
+    cursor.execute(f"DELETE FROM {get_queue_table(cursor)} WHERE id = %s", (item_id,))
     cursor.connection.commit()
 
 
@@ -157,13 +759,108 @@ def requeue_item(cursor, item_id: int):
         cursor: DB cursor
         item_id (int): ID of the item to requeue
     """
+    requeue_items(cursor, ids=[item_id])
+
+
+def get_selection_filters(
+    cursor,
+    ids: List[int] = None,
+    queue_name: str = None,
+    search: str = None,
+    search_mode=SearchMode.auto,
+    state: ItemState = None,
+    enqueued_after: datetime = None,
+    enqueued_before: datetime = None,
+    allow_all: bool = False,
+) -> Dict[str, Any]:
+    """Check and resolve a selection of items for a bulk action or export
+
+    Args:
+        allow_all (bool, optional): Accept a selection of every item,
+            for read-only actions. Defaults to False
+
+    Returns:
+        Dict[str, Any]: Filters for `requeue_items` and `delete_items`
+
+    Raises:
+        ValueError: If nothing would narrow the selection, which would
+            otherwise act on the whole queue table, or the search is invalid
+    """
+    filters = {
+        "ids": ids,
+        "queue_name": queue_name,
+        "search": search,
+        "state": state,
+        "enqueued_after": enqueued_after,
+        "enqueued_before": enqueued_before,
+    }
+
+    if not allow_all and all(value is None for value in filters.values()):
+        raise ValueError("Select items by ID or by at least one filter")
+
+    if search is not None:
+        search_mode = resolve_search_mode(search_mode)
+        validate_search(cursor, search, search_mode)
+        filters["search_mode"] = search_mode
+
+    return filters
+
+
+def requeue_items(cursor, **filters) -> int:
+    """Requeue every item matching the given filters, in a single statement
+
+    Args:
+        cursor: DB cursor
+        **filters: IDs and filters as accepted by `get_filter_clauses`
+
+    Returns:
+        int: Number of items requeued
+    """
+    table = get_queue_table(cursor)
+    where_clauses, params = get_filter_clauses(**filters)
+
     cursor.execute(
-        f"SELECT q_name, data FROM {settings.QUEUE_TABLE} WHERE id = %s", (item_id,)
+        f"INSERT INTO {table}(q_name, data) "
+        f"SELECT q_name, data FROM {table}"
+        + get_where_clause(where_clauses)
+        + " ORDER BY id",
+        tuple(params),
     )
+    affected = cursor.rowcount
+    cursor.connection.commit()
 
-    result = cursor.fetchone()
+    return affected
 
-    cursor.execute(
-        f"INSERT INTO {settings.QUEUE_TABLE}(q_name, data) VALUES(%s, %s)",
-        (result[0], json.dumps(result[1])),
+
+def delete_items(
+    cursor,
+    batch_size: int = None,
+    sleep: float = None,
+    progress: Optional[Callable[[int], None]] = None,
+    **filters,
+) -> int:
+    """Delete every item matching the given filters, in batches
+
+    Args:
+        cursor: DB cursor
+        batch_size (int, optional): Items deleted per transaction.
+            Defaults to `settings.BULK_BATCH_SIZE`
+        sleep (float, optional): Seconds to pause between batches.
+            Defaults to `settings.BULK_SLEEP`
+        progress (Callable[[int], None], optional): Called with the number
+            of items deleted so far after every batch
+        **filters: IDs and filters as accepted by `get_filter_clauses`
+
+    Returns:
+        int: Number of items deleted
+    """
+    where_clauses, params = get_filter_clauses(**filters)
+
+    return delete_in_batches(
+        cursor,
+        get_where_clause(where_clauses),
+        params,
+        batch_size=batch_size or settings.BULK_BATCH_SIZE,
+        sleep=settings.BULK_SLEEP if sleep is None else sleep,
+        progress=progress,
     )
@@ -1,10 +1,16 @@
 """This module contains helper methods for working with queues"""
-from typing import Dict, List
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 
 from pq_dashboard.config import settings
+from pq_dashboard.data.batching import delete_in_batches
+from pq_dashboard.data.counters import get_counter_stats
 from pq_dashboard.schema.queue import Queue
+from pq_dashboard.sources import get_cursor_source, get_queue_table
+from pq_dashboard.timing import timed
 
 
+@timed("get_queue_stats")
 def get_queue_stats(cursor) -> List[Queue]:
     """Get a list of Queue objects
 
@@ -14,8 +20,11 @@ def get_queue_stats(cursor) -> List[Queue]:
     Returns:
         List[Queue]: List of Queue statistics objects
     """
+    if settings.USE_COUNTERS:
+        return get_counter_stats(cursor)
+
     cursor.execute(
-        f"SELECT q_name, (dequeued_at IS NOT NULL) AS dequeued, COUNT(dequeued_at IS NOT NULL) FROM {settings.QUEUE_TABLE} GROUP BY q_name, dequeued"
+        f"SELECT q_name, (dequeued_at IS NOT NULL) AS dequeued, COUNT(dequeued_at IS NOT NULL) FROM {get_queue_table(cursor)} GROUP BY q_name, dequeued"
     )
     results = cursor.fetchall()
 
@@ -25,39 +34,310 @@ def get_queue_stats(cursor) -> List[Queue]:
     for name, item_type, count in results:
         raw_queues_by_name.setdefault(name, {})[lookup[item_type]] = count
 
+    source = get_cursor_source(cursor).name
+
     return [
         Queue(
             name=name,
             total=(value.get("processed", 0) + value.get("queued", 0)),
+            source=source,
             **value,
         )
         for name, value in raw_queues_by_name.items()
     ]
 
 
-def delete_queued_items(cursor, queue_name: str):
-    """Delete all currently-queued items from a queue
+def delete_queued_items(
+    cursor,
+    queue_name: str,
+    older_than: Optional[timedelta] = None,
+    batch_size: int = None,
+    sleep: float = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Delete all currently-queued items from a queue, in batches
 
     Args:
         cursor: DB cursor
         queue_name (str): Name of queue to empty
+        older_than (timedelta, optional): Only delete items enqueued at
+            least this long ago
+        batch_size (int, optional): Items deleted per transaction.
+            Defaults to `settings.BULK_BATCH_SIZE`
+        sleep (float, optional): Seconds to pause between batches.
+            Defaults to `settings.BULK_SLEEP`
+        progress (Callable[[int], None], optional): Called with the number
+            of items deleted so far after every batch
+
+    Returns:
+        int: Number of items deleted
+    """
+    where_clause = " WHERE q_name = %s AND dequeued_at IS NULL"
+    params: list = [queue_name]
+
+    if older_than is not None:
+        where_clause += " AND enqueued_at < now() - %s"
+        params.append(older_than)
+
+    return delete_in_batches(
+        cursor,
+        where_clause,
+        params,
+        batch_size=batch_size or settings.BULK_BATCH_SIZE,
+        sleep=settings.BULK_SLEEP if sleep is None else sleep,
+        progress=progress,
+    )
+
+
+def delete_processed_items(
+    cursor,
+    queue_name: str,
+    older_than: Optional[timedelta] = None,
+    batch_size: int = None,
+    sleep: float = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Delete all processed items from a queue, in batches
+
+    Args:
+        cursor: DB cursor
+        queue_name (str): Name of queue to cleanup items from
+        older_than (timedelta, optional): Only delete items dequeued at
+            least this long ago
+        batch_size (int, optional): Items deleted per transaction.
+            Defaults to `settings.BULK_BATCH_SIZE`
+        sleep (float, optional): Seconds to pause between batches.
+            Defaults to `settings.BULK_SLEEP`
+        progress (Callable[[int], None], optional): Called with the number
+            of items deleted so far after every batch
+
+    Returns:
+        int: Number of items deleted
     """
+    where_clause = " WHERE q_name = %s AND dequeued_at IS NOT NULL"
+    params: list = [queue_name]
+
+    if older_than is not None:
+        where_clause += " AND dequeued_at < now() - %s"
+        params.append(older_than)
+
+    return delete_in_batches(
+        cursor,
+        where_clause,
+        params,
+        batch_size=batch_size or settings.BULK_BATCH_SIZE,
+        sleep=settings.BULK_SLEEP if sleep is None else sleep,
+        progress=progress,
+    )
+
+
+def trim_processed_items(
+    cursor,
+    queue_name: str,
+    max_count: int,
+    batch_size: int = None,
+    sleep: float = None,
+) -> int:
+    """Delete processed items from a queue, keeping only the newest ones
+
+    Args:
+        cursor: DB cursor
+        queue_name (str): Name of queue to trim
+        max_count (int): Number of processed items to keep
+        batch_size (int, optional): Items deleted per transaction.
+            Defaults to `settings.BULK_BATCH_SIZE`
+        sleep (float, optional): Seconds to pause between batches.
+            Defaults to `settings.BULK_SLEEP`
+
+    Returns:
+        int: Number of items deleted
+    """
+    # Fix the cutoff up front, so items processed meanwhile are not counted
     cursor.execute(
-        f"DELETE FROM {settings.QUEUE_TABLE} WHERE q_name = %s AND dequeued_at IS NULL",
-        (queue_name,),
+        f"SELECT id FROM {get_queue_table(cursor)} "
+        "WHERE q_name = %s AND dequeued_at IS NOT NULL "
+        "ORDER BY id DESC OFFSET %s LIMIT 1",
+        (queue_name, max_count),
     )
+    row = cursor.fetchone()
     cursor.connection.commit()
 
+    if row is None:
+        return 0
+
+    return delete_in_batches(
+        cursor,
+        " WHERE q_name = %s AND dequeued_at IS NOT NULL AND id <= %s",
+        [queue_name, row[0]],
+        batch_size=batch_size or settings.BULK_BATCH_SIZE,
+        sleep=settings.BULK_SLEEP if sleep is None else sleep,
+    )
+
+
+def get_queue_activity(
+    cursor, watermarks: Optional[dict], bounds: List[float]
+) -> Tuple[dict, dict]:
+    """Aggregate what happened to each queue since the last watermarks
+
+    pq stamps items with the time their transaction started, and IDs are
+    taken from a sequence before their transaction commits, so items show
+    up late, below the watermarks. Each of them is still counted once, if
+    its transaction committed within METRICS_LOOKBACK seconds:
 
-def delete_processed_items(cursor, queue_name: str):
-    """Delete all processed (processed) items from a queue
+    - Enqueues are read from the rows past `last_id`, a range scan of the
+      primary key, and from the IDs below it which were missing when read,
+      which are read again until they show up or are given up on.
+    - Dequeues are read from the rows dequeued since METRICS_LOOKBACK
+      seconds before `at`, a range scan of an index on dequeued_at if the
+      queue table has one (see `pq-dashboard doctor`), and a scan of the
+      whole table otherwise. Of those, only the rows dequeued by
+      transactions the last read's snapshot did not see are counted.
+
+    Without watermarks, only new watermarks are taken.
 
     Args:
         cursor: DB cursor
-        queue_name (str): Name of queue to cleanup items from
+        watermarks (dict, optional): Watermarks returned by the last read
+        bounds (List[float]): Upper bounds, in seconds, of the wait time
+            histogram buckets. A last bucket holds longer waits
+
+    Returns:
+        Tuple[dict, dict]: Activity per queue, as dicts of `enqueued`,
+            `dequeued` and `wait_buckets` counts and the `wait_sum` of the
+            dequeued items' waits, and the new watermarks
     """
+    table = get_queue_table(cursor)
+
+    if watermarks is None:
+        cursor.execute(
+            "SELECT statement_timestamp(), MAX(id), txid_current_snapshot()::text "
+            f"FROM {table}"
+        )
+        now, max_id, snapshot = cursor.fetchone()
+        cursor.connection.commit()
+
+        return {}, {
+            "at": now,
+            "last_id": max_id or 0,
+            "missing": {},
+            "snapshot": snapshot,
+        }
+
+    last_id = watermarks["last_id"]
+    missing = watermarks["missing"]
+
+    cursor.execute(
+        f"WITH new AS (SELECT id, q_name FROM {table} "
+        "WHERE id > %(last_id)s OR id = ANY(%(missing)s::bigint[])) "
+        "SELECT q_name, COUNT(*) AS enqueued, MAX(id) AS max_id, NULL AS missing "
+        "FROM new GROUP BY q_name "
+        "UNION ALL SELECT NULL, NULL, NULL, ARRAY("
+        "(SELECT unnest(%(missing)s::bigint[]) UNION ALL "
+        "SELECT generate_series(%(last_id)s + 1, (SELECT MAX(id) FROM new))) "
+        "EXCEPT SELECT id FROM new)",
+        {"last_id": last_id, "missing": list(missing)},
+    )
+    # IDs missing below the highest one read belong to transactions still
+    # running, rolled back, or to items deleted since
+    enqueues = cursor.fetchall()
+
+    # The new watermarks are taken by the statement reading dequeues, so
+    # that the next one reads those committed after it ran. Rows stamped
+    # with a frozen or bootstrap xmin are too old to be new
     cursor.execute(
-        f"DELETE FROM {settings.QUEUE_TABLE} WHERE q_name = %s AND dequeued_at IS NOT NULL",
-        (queue_name,),
+        "WITH snapshot AS (SELECT statement_timestamp() AS now, "
+        "txid_current_snapshot() AS current), "
+        "dequeued AS (SELECT dequeued_at - enqueued_at AS wait, q_name, "
+        "xmin::text::bigint AS xid, "
+        "txid_snapshot_xmax(current) >> 32 << 32 AS epoch, "
+        "txid_snapshot_xmax(current) AS xmax "
+        f"FROM {table}, snapshot "
+        "WHERE dequeued_at > %(since)s::timestamptz - %(lookback)s * interval '1 second'), "
+        "new AS (SELECT q_name, "
+        "width_bucket(EXTRACT(EPOCH FROM wait)::float8, %(bounds)s::float8[]) AS bucket, "
+        "COUNT(*) AS dequeued, SUM(EXTRACT(EPOCH FROM wait)) AS wait_sum "
+        "FROM dequeued WHERE xid > 2 AND NOT txid_visible_in_snapshot("
+        "epoch + xid - CASE WHEN epoch + xid > xmax THEN 4294967296 ELSE 0 END, "
+        "%(snapshot)s::txid_snapshot) "
+        "GROUP BY q_name, bucket) "
+        "SELECT now, current::text AS snapshot, q_name, bucket, dequeued, wait_sum "
+        "FROM snapshot LEFT JOIN new ON true",
+        {
+            "since": watermarks["at"],
+            "lookback": settings.METRICS_LOOKBACK,
+            "bounds": bounds,
+            "snapshot": watermarks["snapshot"],
+        },
     )
+    dequeues = cursor.fetchall()
     cursor.connection.commit()
+
+    now = dequeues[0]["now"]
+    given_up = now - timedelta(seconds=settings.METRICS_LOOKBACK)
+    still_missing = {}
+    for row in enqueues:
+        for id in row["missing"] or []:
+            seen = missing.get(id, now)
+            if seen > given_up:
+                still_missing[id] = seen
+
+    activity: Dict[str, dict] = {}
+
+    def get_queue(name: str) -> dict:
+        return activity.setdefault(
+            name,
+            {
+                "enqueued": 0,
+                "dequeued": 0,
+                "wait_buckets": [0] * (len(bounds) + 1),
+                "wait_sum": 0.0,
+            },
+        )
+
+    for row in enqueues:
+        if row["q_name"] is not None:
+            get_queue(row["q_name"])["enqueued"] += row["enqueued"]
+
+    for row in dequeues:
+        if row["q_name"] is None:
+            continue
+
+        queue = get_queue(row["q_name"])
+        queue["dequeued"] += row["dequeued"]
+        queue["wait_sum"] += float(row["wait_sum"])
+        queue["wait_buckets"][row["bucket"]] += row["dequeued"]
+
+    return activity, {
+        "at": now,
+        "last_id": max(
+            [last_id] + [row["max_id"] for row in enqueues if row["max_id"] is not None]
+        ),
+        "missing": still_missing,
+        "snapshot": dequeues[0]["snapshot"],
+    }
+
+
+def get_queued_ages(cursor) -> Dict[str, dict]:
+    """Get the age of the oldest queued item, and how many are overdue, per queue
+
+    Only queued items are read, which pq's partial indexes cover, so this
+    stays cheap however many processed items the table holds.
+
+    Args:
+        cursor: DB cursor
+
+    Returns:
+        Dict[str, dict]: `oldest_age` in seconds and `overdue` count,
+            keyed by queue name
+    """
+    cursor.execute(
+        "SELECT q_name, "
+        "EXTRACT(EPOCH FROM now() - MIN(enqueued_at)) AS oldest_age, "
+        "COUNT(*) FILTER (WHERE expected_at < now()) AS overdue "
+        f"FROM {get_queue_table(cursor)} WHERE dequeued_at IS NULL GROUP BY q_name"
+    )
+
+    return {
+        name: {"oldest_age": float(oldest_age), "overdue": overdue}
+        for name, oldest_age, overdue in cursor.fetchall()
+    }
@@ -0,0 +1,43 @@
+"""This module contains helper methods for measuring how far a read replica lags"""
+import math
+
+from pq_dashboard.timing import timed
+
+
+@timed("get_replication_lag")
+def get_replication_lag(cursor) -> float:
+    """Get how many seconds of the primary's writes a replica has yet to replay
+
+    A replica which is streaming from the primary and has replayed
+    everything it received is not lagging, however long ago the primary
+    last wrote. Otherwise, and notably when its WAL receiver disconnected,
+    the primary may have written anything since the replica last replayed
+    a transaction, so the time since then is its lag. A server which is
+    not a replica never lags.
+
+    Whether the replica is streaming is only visible to superusers and
+    roles with pg_read_all_stats. Others always get the time since the
+    last replay.
+
+    Args:
+        cursor: DB cursor on the replica
+
+    Returns:
+        float: The lag, in seconds
+    """
+    cursor.execute(
+        "SELECT CASE "
+        "WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "AND EXISTS (SELECT FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+        "END"
+    )
+    lag = cursor.fetchone()[0]
+    cursor.connection.commit()
+
+    # Nothing replayed since the replica started
+    if lag is None:
+        return math.inf
+
+    return max(float(lag), 0.0)
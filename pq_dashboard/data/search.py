@@ -0,0 +1,207 @@
+"""
+This module contains helper methods for searching item payloads, and for
+managing the indexes which make those searches fast
+"""
+import json
+from enum import Enum
+from typing import Dict, List, Tuple
+
+import psycopg2
+
+from pq_dashboard.cache import TTLCache
+from pq_dashboard.sources import get_cursor_source, get_queue_table
+
+_index_cache = TTLCache(ttl=60.0, maxsize=16)
+
+
+class SearchMode(str, Enum):
+    """How a search term is matched against item payloads"""
+
+    # text, whichever indexes exist, so that results do not depend on them
+    auto = "auto"
+    # Case-insensitive substring of the payload text: data::TEXT ILIKE
+    text = "text"
+    # JSON containment, e.g. {"task": "send_email"}: data::jsonb @> term
+    contains = "contains"
+    # SQL/JSON path predicate, e.g. $.priority > 5: data::jsonb @@ term
+    path = "path"
+
+
+def get_index_names(queue_table: str) -> Dict[str, str]:
+    """Names of the search indexes for a queue table"""
+    # Index names cannot be schema-qualified, they live in the table's schema
+    table = queue_table.split(".")[-1]
+
+    return {"trigram": f"{table}_data_trgm_idx", "jsonb": f"{table}_data_jsonb_idx"}
+
+
+def get_search_indexes(cursor) -> Dict[str, bool]:
+    """Detect which kinds of search index exist on the queue table
+
+    Any valid index on the same expression counts, whatever its name.
+    Results are cached for a minute.
+
+    Args:
+        cursor: DB cursor
+
+    Returns:
+        Dict[str, bool]: Whether a "trigram" and a "jsonb" index exist
+    """
+    source = get_cursor_source(cursor)
+    key = (source.name, source.queue_table)
+
+    indexes = _index_cache.get(key)
+    if indexes is not None:
+        return indexes
+
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND indisvalid",
+        (source.queue_table,),
+    )
+    definitions = [row[0] for row in cursor.fetchall()]
+
+    indexes = {
+        "trigram": any(
+            "gin_trgm_ops" in definition and "(data)::text" in definition
+            for definition in definitions
+        ),
+        "jsonb": any(
+            "USING gin" in definition and "(data)::jsonb" in definition
+            for definition in definitions
+        ),
+    }
+    _index_cache.set(key, indexes)
+
+    return indexes
+
+
+def create_search_indexes(
+    cursor, trigram: bool = True, jsonb: bool = True
+) -> List[str]:
+    """Create search indexes on the queue table without blocking writers
+
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction, so the
+    cursor's connection must be in autocommit mode. The trigram index
+    needs the pg_trgm extension, which is created if missing.
+
+    Args:
+        cursor: DB cursor on an autocommit connection
+        trigram (bool): Create a trigram index serving `text` searches
+        jsonb (bool): Create a jsonb_path_ops index serving `contains`
+            and `path` searches
+
+    Returns:
+        List[str]: Names of the indexes created
+    """
+    table = get_queue_table(cursor)
+    names = get_index_names(table)
+    created = []
+
+    if trigram:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {names['trigram']} "
+            f"ON {table} USING gin ((data::TEXT) gin_trgm_ops)"
+        )
+        created.append(names["trigram"])
+
+    if jsonb:
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {names['jsonb']} "
+            f"ON {table} USING gin ((data::jsonb) jsonb_path_ops)"
+        )
+        created.append(names["jsonb"])
+
+    _index_cache.clear()
+
+    return created
+
+
+def drop_search_indexes(cursor) -> List[str]:
+    """Drop the search indexes created by `create_search_indexes`
+
+    Args:
+        cursor: DB cursor on an autocommit connection
+
+    Returns:
+        List[str]: Names of the indexes dropped
+    """
+    table = get_queue_table(cursor)
+    schema = ".".join(table.split(".")[:-1])
+    names = list(get_index_names(table).values())
+
+    for name in names:
+        qualified_name = f"{schema}.{name}" if schema else name
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {qualified_name}")
+
+    _index_cache.clear()
+
+    return names
+
+
+def resolve_search_mode(search_mode=None) -> SearchMode:
+    """Choose a concrete search mode, resolving `auto`
+
+    `auto` is a text search, which the trigram index serves when it exists
+    and a scan otherwise. It never switches to another mode because of the
+    indexes which exist, as those match different items: `contains` and
+    `path` must be asked for.
+
+    Args:
+        search_mode (SearchMode, optional): Requested mode. Defaults to auto.
+
+    Returns:
+        SearchMode: text, contains or path
+    """
+    search_mode = SearchMode(search_mode or SearchMode.auto)
+
+    if search_mode == SearchMode.auto:
+        return SearchMode.text
+
+    return search_mode
+
+
+def validate_search(cursor, search: str, search_mode):
+    """Check that a search term is valid for a resolved search mode
+
+    Path expressions are parsed by Postgres, so that a malformed one
+    is reported as such rather than failing the items query.
+
+    Raises:
+        ValueError: If the term is invalid
+    """
+    search_mode = SearchMode(search_mode)
+
+    if search_mode == SearchMode.path:
+        try:
+            cursor.execute("SELECT %s::jsonpath", (search,))
+        except (psycopg2.DataError, psycopg2.ProgrammingError) as err:
+            cursor.connection.rollback()
+            raise ValueError(f"Search term is not a valid JSON path: {err}") from err
+
+    get_search_clause(search, search_mode)
+
+
+def get_search_clause(search: str, search_mode=SearchMode.text) -> Tuple[str, list]:
+    """Build a WHERE condition and parameters matching items against a search term
+
+    Raises:
+        ValueError: If a `contains` term is not JSON, or the mode is unresolved
+    """
+    search_mode = SearchMode(search_mode or SearchMode.text)
+
+    if search_mode == SearchMode.text:
+        search = search.replace("=", "==").replace("%", "=%").replace("_", "=_")
+        return "data::TEXT ILIKE %s ESCAPE '='", ["%" + search + "%"]
+
+    if search_mode == SearchMode.contains:
+        try:
+            json.loads(search)
+        except ValueError as err:
+            raise ValueError(f"Search term is not valid JSON: {err}") from err
+        return "data::jsonb @> %s::jsonb", [search]
+
+    if search_mode == SearchMode.path:
+        return "data::jsonb @@ %s::jsonpath", [search]
+
+    raise ValueError(f"Unresolved search mode: {search_mode.value}")
@@ -0,0 +1,52 @@
+"""
+This module contains utilities for running blocking database calls from
+async routes without stalling the event loop
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from pq_dashboard.config import settings
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the bounded executor used for database calls, creating it on first use"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DB_WORKERS,
+                    thread_name_prefix="pq-dashboard-db",
+                )
+
+    return _executor
+
+
+def shutdown_executor():
+    """Shut down the database executor, if one was created"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function on the database executor and await its result
+
+    The caller's context variables are carried over to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+
+    return await loop.run_in_executor(get_executor(), call)
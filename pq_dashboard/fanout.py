@@ -0,0 +1,136 @@
+"""
+This module contains helpers for running a query against every source at
+once, so that one slow or unreachable database only costs its own results
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from pq_dashboard.cancellation import get_statement_timeout, set_statement_timeout
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.replicas import read_cursor_manager
+from pq_dashboard.schema.queue import SourceError
+from pq_dashboard.sources import get_source, get_sources
+
+logger = logging.getLogger(__name__)
+
+
+class SourceTimeout(Exception):
+    """Raised when a source did not answer within `SOURCE_TIMEOUT`"""
+
+
+def query_source(source: str, func: Callable, *args, read_only: bool = False, **kwargs):
+    """Run a data function on a cursor to a source, bounded by `SOURCE_TIMEOUT`
+
+    The statement timeout stops the source's queries server-side, so that
+    a timed out source does not keep holding a database worker thread. It
+    is set on the session, so that it still applies after the function
+    commits, and the endpoint's own timeout is restored afterwards. The
+    endpoint's own timeout applies instead when it is shorter. Read-only
+    functions run on the source's replica, if it has one which is not
+    lagging.
+    """
+    manager = read_cursor_manager if read_only else cursor_manager
+    budget = get_statement_timeout()
+    # The endpoint's timeout is set on the session already
+    shorter = budget and settings.SOURCE_TIMEOUT and budget <= settings.SOURCE_TIMEOUT
+
+    with manager(source) as cursor:
+        if not settings.SOURCE_TIMEOUT or shorter:
+            return func(cursor, *args, **kwargs)
+
+        connection = cursor.connection
+        set_statement_timeout(connection, settings.SOURCE_TIMEOUT)
+        try:
+            result = func(cursor, *args, **kwargs)
+            connection.commit()
+            return result
+        finally:
+            # The session timeout can only be changed outside a transaction
+            if not connection.closed:
+                if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                set_statement_timeout(connection, budget)
+
+
+def describe_error(error: BaseException) -> str:
+    return str(error).strip() or type(error).__name__
+
+
+def get_source_errors(errors: Dict[str, str]) -> List[SourceError]:
+    """Build the `errors` of a response from the errors of `query_sources`"""
+    return [
+        SourceError(source=source, message=message)
+        for source, message in errors.items()
+    ]
+
+
+async def query_sources(
+    func: Callable,
+    *args,
+    sources: Optional[List[str]] = None,
+    read_only: bool = False,
+    **kwargs,
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Run a data function against every source concurrently
+
+    Each source gets at most `SOURCE_TIMEOUT` seconds. Sources which fail
+    or time out are reported alongside the results of the others, unless
+    every source failed, in which case the first source's error is raised
+    as it would be without fan-out.
+
+    Args:
+        func (Callable): Data function taking a cursor first
+        sources (List[str], optional): Names of the sources to query.
+            Defaults to every source
+        read_only (bool, optional): Whether the function only reads, and
+            can run on replicas. Defaults to False
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: Results by source name, in
+            source order, and error messages by source name
+
+    Raises:
+        SourceTimeout: If every source failed, the first by timing out
+    """
+    if sources is None:
+        names = [source.name for source in get_sources()]
+    else:
+        names = [get_source(name).name for name in sources]
+
+    async def query(name: str):
+        call = run_blocking(
+            query_source, name, func, *args, read_only=read_only, **kwargs
+        )
+
+        if not settings.SOURCE_TIMEOUT:
+            return await call
+
+        try:
+            return await asyncio.wait_for(call, timeout=settings.SOURCE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise SourceTimeout(
+                f"Source {name} timed out after {settings.SOURCE_TIMEOUT:g}s"
+            )
+
+    outcomes = await asyncio.gather(
+        *(query(name) for name in names), return_exceptions=True
+    )
+
+    results = {}
+    errors = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning("Source %s failed: %s", name, describe_error(outcome))
+            errors[name] = describe_error(outcome)
+        else:
+            results[name] = outcome
+
+    if not results and names:
+        raise outcomes[0]
+
+    return results, errors
@@ -28,10 +28,13 @@ export const App: React.FunctionComponent = () => {
 
   const {
     queues,
+    sources,
+    sourceErrors,
     error: queuesError,
     onDeleteQueued,
     onDeleteProcessed,
     mutate: mutateQueues,
+    live: queuesLive,
   } = useQueues();
   const {
     items,
@@ -72,8 +75,12 @@ export const App: React.FunctionComponent = () => {
       }
 
       if (counter > selectedTime) {
-        mutateQueues();
-        mutateItems();
+        // While queue stats are pushed live, items are refreshed
+        // when the queues change instead
+        if (!queuesLive) {
+          mutateQueues();
+          mutateItems();
+        }
         mutateSettings();
         counter = 0;
       }
@@ -86,27 +93,33 @@ export const App: React.FunctionComponent = () => {
     return () => {
       cancelAnimationFrame(handle);
     };
-  }, [selectedTime]);
+  }, [selectedTime, queuesLive]);
 
-  const handleDeleteQueued = async (queueName) => {
-    await onDeleteQueued(queueName);
+  useEffect(() => {
+    if (queuesLive) {
+      mutateItems();
+    }
+  }, [queues]);
+
+  const handleDeleteQueued = async (queueName, source) => {
+    await onDeleteQueued(queueName, source);
     triggerDeleteQueuedToast(queueName);
     mutateItems();
   };
 
-  const handleDeleteProcessed = async (queueName) => {
-    await onDeleteProcessed(queueName);
+  const handleDeleteProcessed = async (queueName, source) => {
+    await onDeleteProcessed(queueName, source);
     triggerDeleteProcessedToast(queueName);
     mutateItems();
   };
 
-  const handleDeleteItem = async (itemId) => {
-    await onDeleteItem(itemId);
+  const handleDeleteItem = async (itemId, source) => {
+    await onDeleteItem(itemId, source);
     triggerDeleteItemToast(itemId);
   };
 
-  const handleRequeueItem = async (itemId) => {
-    await onRequeueItem(itemId);
+  const handleRequeueItem = async (itemId, source) => {
+    await onRequeueItem(itemId, source);
     triggerRequeueItemToast(itemId);
   };
 
@@ -149,7 +162,17 @@ export const App: React.FunctionComponent = () => {
       </nav>
       {(queuesError || itemsError) && (
         <div className="w-full text-center text-white bg-red-500 p-2 transition ">
-          Unable to access database. Please check your configuration.
+          {itemsError instanceof Error
+            ? itemsError.message
+            : "Unable to access database. Please check your configuration."}
+        </div>
+      )}
+      {!queuesError && sourceErrors?.length > 0 && (
+        <div className="w-full text-center text-white bg-red-500 p-2 transition ">
+          Unable to query{" "}
+          {sourceErrors
+            .map((error) => `${error.source} (${error.message})`)
+            .join(", ")}
         </div>
       )}
       <div className="bg-gray-100 w-full h-full p-0">
@@ -158,6 +181,7 @@ export const App: React.FunctionComponent = () => {
             <h2 className="text-xl mb-6 text-gray-700">Queues</h2>
             <QueuesTable
               queues={queues}
+              showSources={sources?.length > 1}
               onDeleteQueued={handleDeleteQueued}
               onDeleteProcessed={handleDeleteProcessed}
               selectedQueue={selectedQueue}
@@ -43,6 +43,64 @@ const applyDataQuery = (data, query) => {
   }
 };
 
+const formatSize = (size: number) => {
+  if (size < 1024) {
+    return `${size} B`;
+  }
+  if (size < 1024 * 1024) {
+    return `${(size / 1024).toFixed(1)} KB`;
+  }
+  return `${(size / (1024 * 1024)).toFixed(1)} MB`;
+};
+
+const fetchPayload = async (itemId: number) => {
+  const response = await fetch(`/api/v1/items/${itemId}/payload`);
+  return await response.json();
+};
+
+const ItemDataCell = ({ item, query }) => {
+  const [payload, setPayload] = useState(undefined);
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    setPayload(undefined);
+  }, [item.id]);
+
+  if (!item.truncated) {
+    return <DataCell data={item.data} query={query} />;
+  }
+
+  if (payload !== undefined) {
+    return <DataCell data={payload} query={query} />;
+  }
+
+  const onLoad = async () => {
+    setLoading(true);
+    try {
+      setPayload(await fetchPayload(item.id));
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <div>
+      {item.preview !== null && (
+        <span className="block font-mono text-xs text-gray-600 break-all">
+          {item.preview.substring(0, 200)}…
+        </span>
+      )}
+      <button
+        className="text-xs text-blue-600 hover:underline"
+        onClick={onLoad}
+        disabled={loading}
+      >
+        {loading ? "Loading…" : `Load full payload (${formatSize(item.size)})`}
+      </button>
+    </div>
+  );
+};
+
 const DataCell = ({ data, query }) => {
   const queryResult = applyDataQuery(data, query);
 
@@ -72,8 +130,8 @@ type ItemsTableProps = {
   sortOrder: string;
   setOffset: (arg0: number) => void;
   setLimit: (arg0: number) => void;
-  onDeleteItem: (itemId: number) => void;
-  onRequestItem: (itemId: number) => void;
+  onDeleteItem: (itemId: number, source: string) => void;
+  onRequestItem: (itemId: number, source: string) => void;
   onChangeSortOrder: (order: string) => void;
 };
 
@@ -139,14 +197,14 @@ const TaskActions = ({ onDeleteItem, onRequeueItem, item }) => {
     <div className="flex flex-row flex-nowrap">
       <button
         className="border border-green-500 hover:bg-green-500 hover:text-white text-green-600 text-sm py-1 px-3 rounded-full mx-2"
-        onClick={async () => onDeleteItem(item.id)}
+        onClick={async () => onDeleteItem(item.id, item.source)}
       >
         {item.dequeued_at != undefined ? "Remove" : "Cancel"}
       </button>
       {item.dequeued_at != undefined && (
         <button
           className="border border-yellow-400 hover:bg-yellow-400 hover:text-white text-yellow-500 text-sm py-1 px-3 rounded-full mx-2"
-          onClick={async () => onRequeueItem(item.id)}
+          onClick={async () => onRequeueItem(item.id, item.source)}
         >
           Requeue
         </button>
@@ -311,7 +369,7 @@ const DefaultTable = ({
         {records &&
           records.map((item) => (
             <tr
-              key={`item-${item.id}`}
+              key={`item-${item.source}-${item.id}`}
               className="border-b border-gray-100 text-sm"
             >
               <td className="px-4 py-2">{item.id}</td>
@@ -331,7 +389,7 @@ const DefaultTable = ({
                 <QueueName name={item.q_name} />
               </td>
               <td className="px-4 py-2 text-left">
-                <DataCell data={item.data} query={dataQuery} />
+                <ItemDataCell item={item} query={dataQuery} />
               </td>
               <td>
                 <TaskActions
@@ -434,7 +492,7 @@ const TasksTable = ({
         {records &&
           records.map((item) => (
             <tr
-              key={`item-${item.id}`}
+              key={`item-${item.source}-${item.id}`}
               className="border-b border-gray-100 text-sm"
             >
               <td className="px-4 py-2">{item.id}</td>
@@ -467,7 +525,7 @@ const TasksTable = ({
                 </span>
               </td>
               <td className="px-4 py-2 text-center">
-                <span>{item.data.retried}</span>
+                <span>{item.data?.retried}</span>
               </td>
               <td>
                 <TaskActions
@@ -6,19 +6,22 @@ type Queue = {
   total: number;
   processed: number;
   queued: number;
+  source: string;
 };
 
 type QueuesTableProps = {
   queues: Array<Queue>;
   selectedQueue: string;
-  onDeleteQueued: (arg0: string) => void;
-  onDeleteProcessed: (arg0: string) => void;
+  showSources: boolean;
+  onDeleteQueued: (arg0: string, arg1: string) => void;
+  onDeleteProcessed: (arg0: string, arg1: string) => void;
   onSelectQueue: (arg0: string) => void;
 };
 
 export const QueuesTable: React.FunctionComponent<QueuesTableProps> = ({
   queues,
   selectedQueue,
+  showSources,
   onDeleteQueued,
   onDeleteProcessed,
   onSelectQueue,
@@ -66,7 +69,7 @@ export const QueuesTable: React.FunctionComponent<QueuesTableProps> = ({
         {sortedQueues &&
           sortedQueues.map((queue) => (
             <tr
-              key={`queue-${queue.name}`}
+              key={`queue-${queue.source}-${queue.name}`}
               className={
                 queue.name === selectedQueue
                   ? " border-l border-yellow-300 bg-yellow-50"
@@ -78,6 +81,11 @@ export const QueuesTable: React.FunctionComponent<QueuesTableProps> = ({
                   name={queue.name}
                   onClick={() => handleQueueNameClick(queue.name)}
                 />
+                {showSources && (
+                  <span className="ml-2 text-xs text-gray-400">
+                    {queue.source}
+                  </span>
+                )}
               </td>
               <td className="px-6 py-4">{queue.queued}</td>
               <td className="px-6 py-4">{queue.processed}</td>
@@ -86,13 +94,13 @@ export const QueuesTable: React.FunctionComponent<QueuesTableProps> = ({
                 <div className="flex flex-row items-center justify-center">
                   <button
                     className="bg-green-500 hover:bg-green-700 text-white text-sm py-1 px-3 rounded-full mx-2"
-                    onClick={async () => onDeleteQueued(queue.name)}
+                    onClick={async () => onDeleteQueued(queue.name, queue.source)}
                   >
                     Cancel queued items
                   </button>
                   <button
                     className="border border-green-500 hover:bg-green-500 hover:text-white text-green-600 text-sm py-1 px-3 rounded-full mx-2"
-                    onClick={async () => onDeleteProcessed(queue.name)}
+                    onClick={async () => onDeleteProcessed(queue.name, queue.source)}
                   >
                     Cleanup processed items
                   </button>
@@ -0,0 +1,62 @@
+// Last response body and ETag of each URL fetched with fetchWithETag
+const responses = new Map<string, { etag: string; data: any }>();
+
+// In-flight fetch of each path, aborted when a fetch of the same path with
+// another query supersedes it, so that the server cancels its queries
+const inFlight = new Map<string, { url: string; controller: AbortController }>();
+
+// Fetch JSON, revalidating the last response with If-None-Match, so that
+// unchanged responses are neither recomputed by the server nor resent
+export const fetchWithETag = async (url: string) => {
+  const cached = responses.get(url);
+
+  const path = url.split("?")[0];
+  const previous = inFlight.get(path);
+  if (previous && previous.url !== url) {
+    previous.controller.abort();
+  }
+  const controller = new AbortController();
+  inFlight.set(path, { url, controller });
+
+  let response: Response;
+  try {
+    response = await fetch(url, {
+      cache: "no-store",
+      headers: cached ? { "If-None-Match": cached.etag } : {},
+      signal: controller.signal,
+    });
+  } catch (error) {
+    if (error.name === "AbortError") {
+      return cached?.data;
+    }
+    throw error;
+  } finally {
+    if (inFlight.get(path)?.controller === controller) {
+      inFlight.delete(path);
+    }
+  }
+
+  if (response.status === 418) {
+    throw "Unable to connect to DB";
+  }
+
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+
+  const data = await response.json();
+
+  if (!response.ok) {
+    // Such as queries cancelled by their statement timeout
+    throw new Error(data.message || response.statusText);
+  }
+  const etag = response.headers.get("ETag");
+
+  if (etag) {
+    responses.set(url, { etag, data });
+  } else {
+    responses.delete(url);
+  }
+
+  return data;
+};
@@ -1,25 +1,22 @@
 import useSWR from "swr";
+import { fetchWithETag } from "./conditional";
 
-const genericFetch = async (url) => {
-  const response = await fetch(url);
+const sourceParams = (source: string) =>
+  new URLSearchParams({ source: source });
 
-  if (response.status === 418) {
-    throw "Unable to connect to DB";
-  }
-
-  const data = await response.json();
-  return data;
-};
-
-const deleteItem = async (itemId: number) => {
-  const response = await fetch(`/api/v1/items/${itemId}`, { method: "DELETE" });
+const deleteItem = async (itemId: number, source: string) => {
+  const response = await fetch(
+    `/api/v1/items/${itemId}?` + sourceParams(source),
+    { method: "DELETE" }
+  );
   return;
 };
 
-const requeueItem = async (itemId: number) => {
-  const response = await fetch(`/api/v1/items/${itemId}/requeue`, {
-    method: "POST",
-  });
+const requeueItem = async (itemId: number, source: string) => {
+  const response = await fetch(
+    `/api/v1/items/${itemId}/requeue?` + sourceParams(source),
+    { method: "POST" }
+  );
   const data = response.json();
   return data;
 };
@@ -49,23 +46,25 @@ export const useItems = ({
 
   const { data, mutate, error } = useSWR(
     `/api/v1/items/?` + params,
-    genericFetch
+    fetchWithETag
   );
 
-  const onDeleteItem = async (itemId) => {
+  const onDeleteItem = async (itemId, source) => {
     mutate(
       {
         ...data,
-        records: data.records.filter((item) => item.id != itemId),
+        records: data.records.filter(
+          (item) => item.id != itemId || item.source != source
+        ),
       },
       false
     );
-    await deleteItem(itemId);
+    await deleteItem(itemId, source);
     mutate();
   };
 
-  const onRequeueItem = async (itemId) => {
-    await requeueItem(itemId);
+  const onRequeueItem = async (itemId, source) => {
+    await requeueItem(itemId, source);
     mutate();
   };
 
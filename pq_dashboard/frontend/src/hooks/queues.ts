@@ -1,50 +1,92 @@
+import { useEffect, useState } from "react";
 import useSWR from "swr";
+import { fetchWithETag } from "./conditional";
 
-const fetchQueues = async () => {
-  const response = await fetch("/api/v1/queues/");
+const fetchQueues = () => fetchWithETag("/api/v1/queues/");
 
-  if (response.status === 418) {
-    throw "Unable to connect to DB";
-  }
-
-  const data = await response.json();
-  return data;
+const deleteQueuedItems = async (queueName: string, source: string) => {
+  const params = new URLSearchParams({ source: source });
+  const response = await fetch(
+    `/api/v1/queues/${queueName}/delete-queued?` + params,
+    { method: "POST" }
+  );
+  return;
 };
 
-const deleteQueuedItems = async (queueName: string) => {
-  const response = await fetch(`/api/v1/queues/${queueName}/delete-queued`, {
-    method: "POST",
-  });
+const deleteProcessedItems = async (queueName: string, source: string) => {
+  const params = new URLSearchParams({ source: source });
+  const response = await fetch(
+    `/api/v1/queues/${queueName}/delete-processed?` + params,
+    { method: "POST" }
+  );
   return;
 };
 
-const deleteProcessedItems = async (queueName: string) => {
-  const response = await fetch(`/api/v1/queues/${queueName}/delete-processed`, {
-    method: "POST",
-  });
-  return;
+const applyQueueChanges = (queues, { changed, removed }) => {
+  const byName = new Map((queues || []).map((queue) => [queue.name, queue]));
+
+  removed.forEach((name) => byName.delete(name));
+  changed.forEach((queue) => byName.set(queue.name, queue));
+
+  return Array.from(byName.values());
 };
 
 export const useQueues = () => {
   const { data, mutate, error } = useSWR("queues", fetchQueues);
+  const [live, setLive] = useState(false);
+  const singleSource = data?.sources.length === 1;
+
+  // Queue stats are pushed by the server while the event stream is open,
+  // so there is no need to poll for them. A stream only covers one source,
+  // so stats of several sources are polled instead
+  useEffect(() => {
+    if (!singleSource) {
+      return;
+    }
+
+    const events = new EventSource("/api/v1/queues/events");
+
+    events.addEventListener("snapshot", (event) => {
+      setLive(true);
+      mutate((list) => ({ ...list, queues: JSON.parse(event.data) }), false);
+    });
+
+    events.addEventListener("queues", (event) => {
+      const changes = JSON.parse(event.data);
+      mutate(
+        (list) => ({ ...list, queues: applyQueueChanges(list.queues, changes) }),
+        false
+      );
+    });
+
+    events.onerror = () => setLive(false);
+
+    return () => {
+      events.close();
+      setLive(false);
+    };
+  }, [singleSource]);
 
   const loading = !error && !data;
 
-  const onDeleteQueued = async (queueName: string) => {
-    await deleteQueuedItems(queueName);
+  const onDeleteQueued = async (queueName: string, source: string) => {
+    await deleteQueuedItems(queueName, source);
     mutate();
   };
 
-  const onDeleteProcessed = async (queueName: string) => {
-    await deleteProcessedItems(queueName);
+  const onDeleteProcessed = async (queueName: string, source: string) => {
+    await deleteProcessedItems(queueName, source);
     mutate();
   };
 
   return {
-    queues: data,
+    queues: data?.queues,
+    sources: data?.sources,
+    sourceErrors: data?.errors,
     mutate,
     error,
     loading,
+    live,
     onDeleteQueued,
     onDeleteProcessed,
   };
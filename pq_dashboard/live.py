@@ -0,0 +1,302 @@
+"""
+This module contains the live queue statistics broadcasters, which hold one
+LISTEN connection per source and server process and push changes to every
+subscriber
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set
+
+import psycopg2
+from psycopg2 import sql
+
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager, get_connection
+from pq_dashboard.data.counters import counters_installed, get_counter_stats
+from pq_dashboard.data.queues import get_queue_stats
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.schema.queue import Queue
+from pq_dashboard.sources import get_source
+from pq_dashboard.watch import get_watch_interval
+
+logger = logging.getLogger(__name__)
+
+
+def get_channel(queue_name: str) -> str:
+    """The channel pq notifies on when an item is put in a queue"""
+    if len(queue_name) > 63:
+        return "pq_" + hashlib.md5(queue_name.encode("utf-8")).hexdigest()
+
+    return queue_name
+
+
+def get_deltas(previous: Dict[str, Queue], current: Dict[str, Queue]) -> dict:
+    """Work out which queues changed between two snapshots, and by how much"""
+    changed = []
+    deltas = {}
+
+    for name, queue in current.items():
+        before = previous.get(name, Queue(name=name, total=0))
+        if queue != before:
+            changed.append(queue.dict())
+            deltas[name] = {
+                "queued": queue.queued - before.queued,
+                "processed": queue.processed - before.processed,
+                "total": queue.total - before.total,
+            }
+
+    removed = [name for name in previous if name not in current]
+
+    return {"changed": changed, "removed": removed, "deltas": deltas}
+
+
+class QueueEventBroadcaster:
+    """
+    Pushes the queue statistics of one source to subscribers when pq
+    notifies of new items.
+
+    Notifications are coalesced for `LIVE_DEBOUNCE` seconds before the stats
+    are fetched once and the deltas fanned out, so a burst of enqueues costs
+    a single query however many viewers there are. Stats are read from the
+    counters when they are installed. Otherwise they are counted from the
+    queue table, and notifications are coalesced for longer when counting
+    gets slow, so that it keeps the database busy at most `LIVE_MAX_LOAD`
+    of the time. pq only notifies on insert, so the stats are also
+    refreshed every `LIVE_REFRESH_INTERVAL` seconds to pick up dequeues,
+    deletes and brand new queues.
+
+    The broadcaster runs while it has subscribers, and stops with the last.
+    """
+
+    def __init__(self, source: Optional[str] = None):
+        self.source = source
+        # Moving average of the seconds counting stats takes, while the
+        # counters are not installed
+        self.duration: Optional[float] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._snapshot: Dict[str, Queue] = {}
+        self._connection = None
+        self._channels: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._first_refresh: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def snapshot_event(self) -> dict:
+        return {
+            "event": "snapshot",
+            "data": [queue.dict() for queue in self._snapshot.values()],
+        }
+
+    async def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber, whose first event is a full snapshot"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._first_refresh = asyncio.get_running_loop().create_future()
+            self._task = asyncio.ensure_future(self._run())
+
+        # Let the first refresh fill in the snapshot
+        await asyncio.shield(self._first_refresh)
+
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=100)
+        subscriber.put_nowait(self.snapshot_event())
+        self._subscribers.add(subscriber)
+
+        return subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue):
+        self._subscribers.discard(subscriber)
+
+        if not self._subscribers and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Disconnect every subscriber and stop listening"""
+        self._subscribers.clear()
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _publish(self, event: dict):
+        for subscriber in self._subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow subscriber gets a fresh snapshot instead of a backlog
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(self.snapshot_event())
+
+    def _on_notify(self):
+        """Reader callback for the LISTEN connection"""
+        try:
+            self._connection.poll()
+        except psycopg2.Error:
+            logger.warning("Lost LISTEN connection, reconnecting", exc_info=True)
+            self._close()
+        else:
+            self._connection.notifies.clear()
+
+        self._wakeup.set()
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._connection.fileno())
+            except (psycopg2.Error, ValueError):
+                pass
+            self._connection.close()
+            self._connection = None
+            self._channels = set()
+
+    @property
+    def debounce(self) -> float:
+        """Seconds notifications are coalesced for before stats are fetched"""
+        if self.duration is None:
+            return settings.LIVE_DEBOUNCE
+
+        return get_watch_interval(
+            self.duration, settings.LIVE_DEBOUNCE, settings.LIVE_MAX_LOAD
+        )
+
+    def _fetch_stats(self) -> List[Queue]:
+        with cursor_manager(self.source) as cursor:
+            if counters_installed(cursor):
+                self.duration = None
+                return get_counter_stats(cursor)
+
+            started = time.perf_counter()
+            stats = get_queue_stats(cursor)
+            duration = time.perf_counter() - started
+
+        self.duration = (
+            duration if self.duration is None else (self.duration + duration) / 2
+        )
+
+        return stats
+
+    def _connect(self):
+        connection = get_connection(self.source)
+        connection.autocommit = True
+        return connection
+
+    def _listen(self, channels: Set[str]):
+        with self._connection.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+
+    async def _refresh(self):
+        if self._connection is None:
+            self._connection = await run_blocking(self._connect)
+            asyncio.get_running_loop().add_reader(
+                self._connection.fileno(), self._on_notify
+            )
+
+        stats = await run_blocking(self._fetch_stats)
+        current = {queue.name: queue for queue in stats}
+
+        new_channels = {get_channel(name) for name in current} - self._channels
+        if new_channels:
+            # Stop polling the connection while another thread uses it
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(self._connection.fileno())
+            try:
+                await run_blocking(self._listen, new_channels)
+            finally:
+                loop.add_reader(self._connection.fileno(), self._on_notify)
+            self._channels |= new_channels
+
+        changes = get_deltas(self._snapshot, current)
+        self._snapshot = current
+
+        if changes["changed"] or changes["removed"]:
+            self._publish({"event": "queues", "data": changes})
+
+    async def _run(self):
+        try:
+            while True:
+                self._wakeup.clear()
+
+                try:
+                    await self._refresh()
+                except Exception:
+                    logger.warning("Unable to refresh queue stats", exc_info=True)
+                    self._close()
+
+                if not self._first_refresh.done():
+                    self._first_refresh.set_result(None)
+
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=settings.LIVE_REFRESH_INTERVAL
+                    )
+                    # Coalesce the rest of the burst into one refresh
+                    await asyncio.sleep(self.debounce)
+                except asyncio.TimeoutError:
+                    pass
+
+                if not self._subscribers:
+                    break
+        finally:
+            if not self._first_refresh.done():
+                self._first_refresh.set_result(None)
+            self._close()
+
+
+_broadcasters: Dict[str, QueueEventBroadcaster] = {}
+
+
+def get_broadcaster(source: Optional[str] = None) -> QueueEventBroadcaster:
+    """Get the broadcaster of a source, or of the first source if no name is
+    given, shared by every subscriber to it
+
+    Raises:
+        UnknownSource: If no source has that name
+    """
+    name = get_source(source).name
+    if name not in _broadcasters:
+        _broadcasters[name] = QueueEventBroadcaster(name)
+
+    return _broadcasters[name]
+
+
+async def stop_broadcasters():
+    """Disconnect every subscriber of every source and stop listening"""
+    for broadcaster in _broadcasters.values():
+        await broadcaster.stop()
+
+
+async def stream_events(
+    request, broadcaster: QueueEventBroadcaster, subscriber: asyncio.Queue
+):
+    """Format a subscriber's events as a Server-Sent Events stream
+
+    Keepalive comments are sent while nothing changes, which is also
+    when the client is checked for having gone away.
+    """
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.get(), timeout=settings.LIVE_KEEPALIVE
+                )
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -4,14 +4,57 @@ from pathlib import Path
 
 import psycopg2
 from fastapi import Depends, FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
+from psycopg2.errors import QueryCanceled
 
+from pq_dashboard.cancellation import (
+    CancellationMiddleware,
+    ClientDisconnected,
+    client_disconnected,
+    get_statement_timeout,
+)
+from pq_dashboard.compaction import compactor
+from pq_dashboard.config import settings
+from pq_dashboard.connection import close_pool
+from pq_dashboard.executor import shutdown_executor
+from pq_dashboard.fanout import SourceTimeout
+from pq_dashboard.live import stop_broadcasters
+from pq_dashboard.metrics import collector
+from pq_dashboard.pool import PoolTimeout
+from pq_dashboard.prometheus import CONTENT_TYPE, exporter
+from pq_dashboard.replicas import ReplicationLagMiddleware
+from pq_dashboard.retention import retention
 from pq_dashboard.routers import health, items, queues
+from pq_dashboard.sources import UnknownSource
+from pq_dashboard.timing import TimingMiddleware
 
 app = FastAPI()
 
 
+@app.on_event("startup")
+async def startup():
+    if settings.METRICS_ENABLED:
+        collector.start()
+    if settings.PROMETHEUS_ENABLED:
+        exporter.start()
+    if settings.RETENTION_ENABLED:
+        retention.start()
+    if settings.USE_COUNTERS:
+        compactor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await retention.stop()
+    await compactor.stop()
+    await collector.stop()
+    await exporter.stop()
+    await stop_broadcasters()
+    shutdown_executor()
+    close_pool()
+
+
 @lru_cache(maxsize=1)
 def get_homepage_contents():
     with open(
@@ -25,6 +68,18 @@ async def home(page=Depends(get_homepage_contents)):
     return HTMLResponse(page, status_code=200)
 
 
+@app.get("/metrics")
+async def metrics():
+    """Queue metrics in the Prometheus text format, from the last collection"""
+    if not settings.PROMETHEUS_ENABLED:
+        return PlainTextResponse("Prometheus metrics are disabled", status_code=404)
+
+    if exporter.text is None:
+        return PlainTextResponse("No metrics collected yet", status_code=503)
+
+    return Response(exporter.text, media_type=CONTENT_TYPE)
+
+
 app.mount(
     "/assets",
     StaticFiles(directory=Path(__file__).parent / "frontend" / "www" / "assets"),
@@ -34,6 +89,9 @@ app.mount(
 # We prefix all API routes with `/api/v1`
 # to make things cleaner on the FE
 v1_api = FastAPI()
+v1_api.add_middleware(CancellationMiddleware)
+v1_api.add_middleware(ReplicationLagMiddleware)
+v1_api.add_middleware(TimingMiddleware)
 
 
 @v1_api.exception_handler(psycopg2.OperationalError)
@@ -47,6 +105,51 @@ async def db_exception_handler(request: Request, exc: psycopg2.OperationalError)
     )
 
 
+@v1_api.exception_handler(QueryCanceled)
+async def query_canceled_handler(request: Request, exc: QueryCanceled):
+    """Exception handler for queries cancelled by their statement timeout, or
+    because their client disconnected"""
+    if client_disconnected():
+        return JSONResponse(status_code=499, content={"message": str(exc).strip()})
+
+    return JSONResponse(
+        status_code=504,
+        content={
+            "message": "Query too expensive: it was cancelled by its statement "
+            "timeout. Narrow the search or filters",
+            "reason": "statement_timeout",
+            "timeout": get_statement_timeout(),
+        },
+    )
+
+
+@v1_api.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """Exception handler for requests abandoned by their client, which is gone"""
+    return JSONResponse(status_code=499, content={"message": str(exc)})
+
+
+@v1_api.exception_handler(PoolTimeout)
+async def pool_exception_handler(request: Request, exc: PoolTimeout):
+    """Exception handler for an exhausted connection pool"""
+    return JSONResponse(
+        status_code=503,
+        content={"message": f"No database connection available: {exc}"},
+    )
+
+
+@v1_api.exception_handler(SourceTimeout)
+async def source_timeout_handler(request: Request, exc: SourceTimeout):
+    """Exception handler for sources which all timed out"""
+    return JSONResponse(status_code=504, content={"message": str(exc)})
+
+
+@v1_api.exception_handler(UnknownSource)
+async def unknown_source_handler(request: Request, exc: UnknownSource):
+    """Exception handler for a `source` parameter naming no configured source"""
+    return JSONResponse(status_code=404, content={"message": str(exc)})
+
+
 v1_api.include_router(items.router)
 v1_api.include_router(queues.router)
 v1_api.include_router(health.router)
@@ -0,0 +1,298 @@
+"""
+This module contains the queue metrics collector, which keeps a rolling
+time series of enqueue and dequeue rates and wait times for every queue of
+every source
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from pq_dashboard.config import settings
+from pq_dashboard.data.queues import get_queue_activity
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.replicas import read_cursor_manager
+from pq_dashboard.schema.queue import (
+    MetricsPoint,
+    MetricsWindow,
+    QueueMetrics,
+    WaitPercentiles,
+)
+from pq_dashboard.sources import get_source, get_source_names
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the wait time histogram buckets
+WAIT_BUCKETS = [
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+    1800.0,
+    3600.0,
+    7200.0,
+    21600.0,
+    86400.0,
+]
+
+
+def get_percentile(
+    buckets: List[int], quantile: float, bounds: List[float] = WAIT_BUCKETS
+) -> Optional[float]:
+    """Estimate a percentile from histogram bucket counts
+
+    The value is interpolated linearly within the bucket it falls in. Values
+    above the last bound are reported as that bound.
+    """
+    total = sum(buckets)
+    if total == 0:
+        return None
+
+    target = quantile * total
+    seen = 0
+
+    for index, count in enumerate(buckets):
+        if count and seen + count >= target:
+            if index == len(bounds):
+                return bounds[-1]
+
+            lower = bounds[index - 1] if index > 0 else 0.0
+            upper = bounds[index]
+            return lower + (upper - lower) * (target - seen) / count
+
+        seen += count
+
+    return bounds[-1]
+
+
+def get_wait_percentiles(buckets: List[int]) -> WaitPercentiles:
+    return WaitPercentiles(
+        p50=get_percentile(buckets, 0.5),
+        p95=get_percentile(buckets, 0.95),
+        p99=get_percentile(buckets, 0.99),
+    )
+
+
+def get_rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds else 0.0
+
+
+def sum_buckets(points) -> List[int]:
+    return [sum(counts) for counts in zip(*(point["wait_buckets"] for point in points))]
+
+
+class MetricsCollector:
+    """
+    Collects per-queue throughput and wait times every `METRICS_INTERVAL`
+    seconds, from every source or only from the one given.
+
+    Each tick only reads the rows which changed since the previous one,
+    from watermarks kept per source: the highest ID seen, the IDs missing
+    below it, and the time and snapshot of the last tick (see
+    `get_queue_activity`). The results are kept per queue in a ring buffer
+    of `METRICS_HISTORY` ticks, from which sliding windows are rolled up.
+    """
+
+    def __init__(self, history: int = None, source: Optional[str] = None):
+        self.history = history or settings.METRICS_HISTORY
+        self.source = source
+        # The following are keyed by source name
+        self._watermarks: Dict[str, dict] = {}
+        self._series: Dict[str, Dict[str, Deque[dict]]] = {}
+        # Running totals since the collector started, by queue name
+        self._totals: Dict[str, Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get_queue_names(self, source: Optional[str] = None) -> List[str]:
+        """Names of the queues of a source with metrics, by default the first"""
+        with self._lock:
+            return list(self._series.get(get_source(source).name, {}))
+
+    def reset(self, source: Optional[str] = None):
+        """Forget the watermarks of a source, or of every source, so that the
+        next tick takes new ones"""
+        with self._lock:
+            if source is None:
+                self._watermarks.clear()
+            else:
+                self._watermarks.pop(source, None)
+
+    def tick(self):
+        """Read the activity since the last tick into the series, blocking
+
+        A source which fails is logged and starts over from new watermarks
+        on the next tick, without holding up the others.
+        """
+        for source in get_source_names(self.source):
+            try:
+                self._tick_source(source)
+            except Exception:
+                logger.warning(
+                    "Unable to collect queue metrics of %s", source, exc_info=True
+                )
+                self.reset(source)
+
+    def _tick_source(self, source: str):
+        watermarks = self._watermarks.get(source)
+
+        with read_cursor_manager(source) as cursor:
+            activity, new_watermarks = get_queue_activity(
+                cursor, watermarks, WAIT_BUCKETS
+            )
+
+        with self._lock:
+            if watermarks is not None and source in self._watermarks:
+                interval = (new_watermarks["at"] - watermarks["at"]).total_seconds()
+                idle = {
+                    "enqueued": 0,
+                    "dequeued": 0,
+                    "wait_buckets": [0] * (len(WAIT_BUCKETS) + 1),
+                    "wait_sum": 0.0,
+                }
+                source_totals = self._totals.setdefault(source, {})
+                source_series = self._series.setdefault(source, {})
+
+                for name, counts in activity.items():
+                    totals = source_totals.setdefault(
+                        name,
+                        {
+                            "enqueued": 0,
+                            "dequeued": 0,
+                            "wait_buckets": [0] * (len(WAIT_BUCKETS) + 1),
+                            "wait_sum": 0.0,
+                        },
+                    )
+                    totals["enqueued"] += counts["enqueued"]
+                    totals["dequeued"] += counts["dequeued"]
+                    totals["wait_buckets"] = [
+                        total + count
+                        for total, count in zip(
+                            totals["wait_buckets"], counts["wait_buckets"]
+                        )
+                    ]
+                    totals["wait_sum"] += counts["wait_sum"]
+
+                for name in set(source_series) | set(activity):
+                    series = source_series.setdefault(name, deque(maxlen=self.history))
+                    series.append(
+                        {
+                            "at": new_watermarks["at"],
+                            "interval": interval,
+                            **activity.get(name, idle),
+                        }
+                    )
+
+            self._watermarks[source] = new_watermarks
+
+    def get_totals(self) -> Dict[str, Dict[str, dict]]:
+        """Running enqueue, dequeue and wait time totals of every queue, by
+        source name then queue name"""
+        with self._lock:
+            return {
+                source: {
+                    name: {**totals, "wait_buckets": list(totals["wait_buckets"])}
+                    for name, totals in source_totals.items()
+                }
+                for source, source_totals in self._totals.items()
+            }
+
+    def _get_points(self, name: str, source: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            series = self._series.get(get_source(source).name, {})
+            return list(series.get(name, ()))
+
+    def get_window(
+        self, name: str, seconds: float, source: Optional[str] = None
+    ) -> MetricsWindow:
+        """Roll up the ticks of a queue covering the last `seconds` seconds
+
+        Args:
+            source (str, optional): Source of the queue. Defaults to the first
+        """
+        points = self._get_points(name, source)
+        if points:
+            start = points[-1]["at"].timestamp() - seconds
+            points = [point for point in points if point["at"].timestamp() > start]
+
+        elapsed = sum(point["interval"] for point in points)
+        enqueued = sum(point["enqueued"] for point in points)
+        dequeued = sum(point["dequeued"] for point in points)
+
+        return MetricsWindow(
+            seconds=seconds,
+            enqueued=enqueued,
+            dequeued=dequeued,
+            enqueue_rate=get_rate(enqueued, elapsed),
+            dequeue_rate=get_rate(dequeued, elapsed),
+            wait=get_wait_percentiles(sum_buckets(points)),
+        )
+
+    def get_metrics(self, name: str, source: Optional[str] = None) -> QueueMetrics:
+        """Sliding windows and time series of a queue's metrics
+
+        Args:
+            source (str, optional): Source of the queue. Defaults to the first
+        """
+        series = [
+            MetricsPoint(
+                at=point["at"],
+                interval=point["interval"],
+                enqueued=point["enqueued"],
+                dequeued=point["dequeued"],
+                enqueue_rate=get_rate(point["enqueued"], point["interval"]),
+                dequeue_rate=get_rate(point["dequeued"], point["interval"]),
+                wait=get_wait_percentiles(point["wait_buckets"]),
+            )
+            for point in self._get_points(name, source)
+        ]
+
+        return QueueMetrics(
+            name=name,
+            interval=settings.METRICS_INTERVAL,
+            windows=[
+                self.get_window(name, seconds, source)
+                for seconds in settings.METRICS_WINDOWS
+            ],
+            series=series,
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await run_blocking(self.tick)
+            except Exception:
+                logger.warning("Unable to collect queue metrics", exc_info=True)
+                self.reset()
+            await asyncio.sleep(settings.METRICS_INTERVAL)
+
+    def start(self):
+        """Collect metrics in the background of the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop collecting metrics in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+collector = MetricsCollector()
@@ -0,0 +1,251 @@
+"""This module contains a small thread-safe connection pool for psycopg2"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the pool timeout"""
+
+
+class ConnectionPool:
+    """
+    Pool of psycopg2 connections shared by the API and the CLI.
+
+    Connections are handed out most-recently-used first, so that surplus
+    connections sit idle long enough to be reaped by `idle_timeout`.
+    Connections older than `max_lifetime` are closed rather than reused,
+    and when `check_on_checkout` is set every connection is probed with
+    a trivial query before being handed out.
+    """
+
+    def __init__(
+        self,
+        connect: Callable,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 3600.0,
+        check_on_checkout: bool = True,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                f"Invalid pool size: min_size={min_size}, max_size={max_size}"
+            )
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.check_on_checkout = check_on_checkout
+
+        self._condition = threading.Condition()
+        # Idle connections as (connection, returned_at), most recent last
+        self._idle: List[Tuple[object, float]] = []
+        # Creation time of every open connection, keyed by id(connection)
+        self._created_at: Dict[int, float] = {}
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "failed_checks": 0,
+            "timeouts": 0,
+        }
+
+        with self._condition:
+            for _ in range(min_size):
+                self._idle.append((self._open(), time.monotonic()))
+
+    @property
+    def size(self) -> int:
+        """Number of connections currently open, idle or in use"""
+        return len(self._created_at)
+
+    def _open(self):
+        """Open a new connection. Must be called with the lock held."""
+        connection = self.connect()
+        self._created_at[id(connection)] = time.monotonic()
+        self._counters["connections_opened"] += 1
+        return connection
+
+    def _discard(self, connection):
+        """Close a connection and forget about it. Must be called with the lock held."""
+        self._created_at.pop(id(connection), None)
+        self._counters["connections_closed"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._condition.notify()
+
+    def _expired(self, connection, now: float) -> bool:
+        created_at = self._created_at.get(id(connection), now)
+        return self.max_lifetime > 0 and now - created_at > self.max_lifetime
+
+    def _healthy(self, connection) -> bool:
+        """Probe a connection. Called without the lock, as it is a round trip."""
+        if connection.closed:
+            return False
+
+        if not self.check_on_checkout:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle(self, now: float):
+        """Close idle connections past their idle timeout, down to `min_size`"""
+        if self.idle_timeout <= 0:
+            return
+
+        # Oldest idle connections are at the front of the list
+        while self._idle and self.size > self.min_size:
+            connection, returned_at = self._idle[0]
+            if now - returned_at <= self.idle_timeout:
+                break
+            self._idle.pop(0)
+            self._discard(connection)
+
+    def _reserve(self, deadline: float):
+        """
+        Wait for either an idle connection or a free slot to open a new one.
+        Returns the idle connection, or None when a slot has been reserved.
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+
+                now = time.monotonic()
+                self._reap_idle(now)
+
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                    if self._expired(connection, now):
+                        self._discard(connection)
+                        continue
+                    return connection
+
+                if self.size + self._opening < self.max_size:
+                    self._opening += 1
+                    return None
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool max size is {self.max_size})"
+                    )
+
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def getconn(self):
+        """Check a connection out of the pool, waiting up to `timeout` seconds"""
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            connection = self._reserve(deadline)
+
+            if connection is None:
+                # Connecting is slow, so it happens outside the lock
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self._condition:
+                        self._opening -= 1
+                        self._condition.notify()
+                    raise
+
+                with self._condition:
+                    self._opening -= 1
+                    self._created_at[id(connection)] = time.monotonic()
+                    self._counters["connections_opened"] += 1
+                    self._counters["checkouts"] += 1
+                return connection
+
+            if self._healthy(connection):
+                with self._condition:
+                    self._counters["checkouts"] += 1
+                return connection
+
+            with self._condition:
+                self._counters["failed_checks"] += 1
+                self._discard(connection)
+
+    def putconn(self, connection):
+        """Return a connection to the pool, rolling back any open transaction"""
+        broken = connection.closed
+        if not broken:
+            try:
+                if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception:
+                broken = True
+
+        with self._condition:
+            if id(connection) not in self._created_at:
+                return
+
+            if self._closed or broken:
+                self._discard(connection)
+                return
+
+            now = time.monotonic()
+            if self._expired(connection, now):
+                self._discard(connection)
+                return
+
+            self._idle.append((connection, now))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """ContextManager which checks a connection out and always returns it"""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts.
+        Connections currently in use are closed when they are returned."""
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._discard(connection)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Snapshot of pool occupancy and lifetime counters"""
+        with self._condition:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self.size - len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+            }
@@ -0,0 +1,329 @@
+"""
+This module contains the Prometheus exporter, which collects the queue gauges
+of every source in the background and serves every scrape from memory
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pq_dashboard.config import settings
+from pq_dashboard.data.queues import get_queue_stats, get_queued_ages
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.metrics import WAIT_BUCKETS, collector
+from pq_dashboard.replicas import read_cursor_manager
+from pq_dashboard.schema.queue import Queue
+from pq_dashboard.sources import get_source_names
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds, in seconds, of the collection duration histogram buckets
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """Format labels in the Prometheus text format, escaping their values"""
+    if not labels:
+        return ""
+
+    pairs = []
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        pairs.append(f'{key}="{value}"')
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+
+    return repr(value)
+
+
+def format_histogram(
+    name: str,
+    bounds: List[float],
+    buckets: List[int],
+    total: float,
+    labels: Dict[str, str] = None,
+) -> List[str]:
+    """Format a histogram from per-bucket counts, the last one unbounded"""
+    labels = labels or {}
+    lines = []
+    cumulative = 0
+
+    for bound, count in zip(bounds + [float("inf")], buckets):
+        cumulative += count
+        bucket_labels = {**labels, "le": format_value(float(bound))}
+        lines.append(f"{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(float(total))}")
+    lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+    return lines
+
+
+def iter_totals(totals: Dict[str, Dict[str, dict]]):
+    """Iterate the source, queue name and totals of every queue"""
+    for source, source_totals in totals.items():
+        for name, queue_totals in source_totals.items():
+            yield source, name, queue_totals
+
+
+def render_metrics(
+    stats: List[Queue],
+    ages: Dict[str, Dict[str, dict]],
+    totals: Dict[str, Dict[str, dict]],
+    collection: dict,
+) -> str:
+    """Render queue and collector metrics in the Prometheus text format
+
+    Queue metrics are labelled with their `queue` and `source`.
+
+    Args:
+        stats (List[Queue]): Queue statistics of every source
+        ages (Dict[str, Dict[str, dict]]): Oldest queued item age and overdue
+            count per source, then queue
+        totals (Dict[str, Dict[str, dict]]): Running totals from the metrics
+            collector per source, then queue
+        collection (dict): Statistics of the exporter's own collections
+    """
+    lines = []
+
+    def family(name: str, kind: str, help: str):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def sample(name: str, source: str, queue_name: str, value):
+        labels = {"queue": queue_name, "source": source}
+        lines.append(f"{name}{format_labels(labels)} {value}")
+
+    family("pq_dashboard_queue_queued", "gauge", "Items waiting in the queue")
+    for queue in stats:
+        sample("pq_dashboard_queue_queued", queue.source, queue.name, queue.queued)
+
+    family("pq_dashboard_queue_processed", "gauge", "Processed items in the queue")
+    for queue in stats:
+        sample(
+            "pq_dashboard_queue_processed", queue.source, queue.name, queue.processed
+        )
+
+    family(
+        "pq_dashboard_queue_oldest_queued_age_seconds",
+        "gauge",
+        "Seconds since the oldest queued item was enqueued",
+    )
+    for queue in stats:
+        age = ages.get(queue.source, {}).get(queue.name, {}).get("oldest_age", 0.0)
+        sample(
+            "pq_dashboard_queue_oldest_queued_age_seconds",
+            queue.source,
+            queue.name,
+            format_value(age),
+        )
+
+    family(
+        "pq_dashboard_queue_overdue",
+        "gauge",
+        "Queued items past their expected time",
+    )
+    for queue in stats:
+        overdue = ages.get(queue.source, {}).get(queue.name, {}).get("overdue", 0)
+        sample("pq_dashboard_queue_overdue", queue.source, queue.name, overdue)
+
+    if totals:
+        family(
+            "pq_dashboard_queue_enqueued_total",
+            "counter",
+            "Items enqueued since the dashboard started",
+        )
+        for source, name, queue_totals in iter_totals(totals):
+            sample(
+                "pq_dashboard_queue_enqueued_total",
+                source,
+                name,
+                queue_totals["enqueued"],
+            )
+
+        family(
+            "pq_dashboard_queue_dequeued_total",
+            "counter",
+            "Items dequeued since the dashboard started",
+        )
+        for source, name, queue_totals in iter_totals(totals):
+            sample(
+                "pq_dashboard_queue_dequeued_total",
+                source,
+                name,
+                queue_totals["dequeued"],
+            )
+
+        family(
+            "pq_dashboard_queue_wait_seconds",
+            "histogram",
+            "Seconds items waited between being enqueued and dequeued",
+        )
+        for source, name, queue_totals in iter_totals(totals):
+            lines.extend(
+                format_histogram(
+                    "pq_dashboard_queue_wait_seconds",
+                    WAIT_BUCKETS,
+                    queue_totals["wait_buckets"],
+                    queue_totals["wait_sum"],
+                    {"queue": name, "source": source},
+                )
+            )
+
+    family(
+        "pq_dashboard_collector_duration_seconds",
+        "histogram",
+        "Seconds taken to collect queue metrics from the database",
+    )
+    lines.extend(
+        format_histogram(
+            "pq_dashboard_collector_duration_seconds",
+            DURATION_BUCKETS,
+            collection["duration_buckets"],
+            collection["duration_sum"],
+        )
+    )
+
+    family(
+        "pq_dashboard_collector_errors_total",
+        "counter",
+        "Failed collections of queue metrics",
+    )
+    lines.append(f"pq_dashboard_collector_errors_total {collection['errors']}")
+
+    family(
+        "pq_dashboard_collector_last_success_timestamp_seconds",
+        "gauge",
+        "Unix time of the last successful collection",
+    )
+    lines.append(
+        "pq_dashboard_collector_last_success_timestamp_seconds "
+        f"{format_value(collection['last_success'])}"
+    )
+
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    """
+    Collects the queue metrics of every source every `PROMETHEUS_INTERVAL`
+    seconds for `/metrics`.
+
+    Scrapes are served the text rendered by the last collection, so however
+    many Prometheus replicas scrape however often, the database sees one
+    set of queries per interval.
+    """
+
+    def __init__(self):
+        self._text: Optional[str] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # The following are keyed by source name
+        self._stats: Dict[str, List[Queue]] = {}
+        self._ages: Dict[str, Dict[str, dict]] = {}
+        self._collection = {
+            "duration_buckets": [0] * (len(DURATION_BUCKETS) + 1),
+            "duration_sum": 0.0,
+            "errors": 0,
+            "last_success": 0.0,
+        }
+
+    @property
+    def text(self) -> Optional[str]:
+        """Metrics rendered by the last collection, or None before the first"""
+        return self._text
+
+    def _observe(self, duration: float):
+        index = next(
+            (i for i, bound in enumerate(DURATION_BUCKETS) if duration <= bound),
+            len(DURATION_BUCKETS),
+        )
+        self._collection["duration_buckets"][index] += 1
+        self._collection["duration_sum"] += duration
+
+    def collect(self):
+        """Collect queue metrics and render them, blocking until done
+
+        Sources which fail keep the metrics of their last collection, and
+        count as a failed collection.
+
+        Raises:
+            Exception: The error of the first source which failed, once the
+                others are rendered
+        """
+        started = time.monotonic()
+        stats = {}
+        ages = {}
+        errors = []
+        names = get_source_names()
+
+        for source in names:
+            try:
+                with read_cursor_manager(source) as cursor:
+                    stats[source] = get_queue_stats(cursor)
+                    ages[source] = get_queued_ages(cursor)
+            except Exception as err:
+                errors.append(err)
+
+        with self._lock:
+            self._observe(time.monotonic() - started)
+            if errors:
+                self._collection["errors"] += 1
+            else:
+                self._collection["last_success"] = time.time()
+            self._stats = {
+                name: stats[name] if name in stats else self._stats.get(name, [])
+                for name in names
+            }
+            self._ages = {
+                name: ages[name] if name in ages else self._ages.get(name, {})
+                for name in names
+            }
+            self._render()
+
+        if errors:
+            raise errors[0]
+
+    def _render(self):
+        self._text = render_metrics(
+            [queue for stats in self._stats.values() for queue in stats],
+            self._ages,
+            collector.get_totals(),
+            self._collection,
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await run_blocking(self.collect)
+            except Exception:
+                logger.warning("Unable to collect Prometheus metrics", exc_info=True)
+            await asyncio.sleep(settings.PROMETHEUS_INTERVAL)
+
+    def start(self):
+        """Collect metrics in the background of the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop collecting metrics in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+exporter = PrometheusExporter()
@@ -0,0 +1,156 @@
+"""
+This module contains the routing of dashboard reads to read replicas, which
+falls back to the primary while a replica lags too far behind or is down
+"""
+import logging
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from pq_dashboard.cache import TTLCache
+from pq_dashboard.cancellation import cancellable
+from pq_dashboard.config import settings
+from pq_dashboard.connection import get_pool
+from pq_dashboard.data.replication import get_replication_lag
+from pq_dashboard.sources import get_source
+from pq_dashboard.timing import phase
+
+logger = logging.getLogger(__name__)
+
+_lags = TTLCache(ttl=settings.REPLICA_LAG_INTERVAL)
+
+# Where the current request read from: (replica, lag) by source name
+_reads: ContextVar[Optional[Dict[str, Tuple[bool, float]]]] = ContextVar(
+    "reads", default=None
+)
+
+
+def get_replica_lag(source: Optional[str] = None) -> Optional[float]:
+    """Get the replication lag of a source's replica, checking it at most
+    every `REPLICA_LAG_INTERVAL` seconds
+
+    Args:
+        source (str, optional): Name of the source. Defaults to the first source
+
+    Returns:
+        Optional[float]: The lag in seconds, infinite if the replica cannot
+            be reached, or None if the source has no replica
+    """
+    source = get_source(source)
+    if not source.replica_dsn:
+        return None
+
+    lag = _lags.get(source.name)
+    if lag is not None:
+        return lag
+
+    try:
+        with get_pool(source.name, replica=True).connection() as connection:
+            with connection.cursor() as cursor:
+                lag = get_replication_lag(cursor)
+    except Exception:
+        logger.warning("Unable to check the replica of %s", source.name, exc_info=True)
+        lag = math.inf
+
+    _lags.set(source.name, lag)
+
+    return lag
+
+
+def use_replica(source: Optional[str] = None) -> Tuple[bool, float]:
+    """Decide whether to read from a source's replica, and record the choice
+    for the response's `X-Replication-Lag` header if it has one
+
+    Returns:
+        Tuple[bool, float]: Whether to read from the replica, and how many
+            seconds behind the data read will be
+    """
+    name = get_source(source).name
+    lag = get_replica_lag(name)
+    if lag is None:
+        return False, 0.0
+
+    if lag > settings.REPLICA_MAX_LAG:
+        replica, lag = False, 0.0
+    else:
+        replica = True
+
+    reads = _reads.get()
+    if reads is not None:
+        reads[name] = (replica, lag)
+
+    return replica, lag
+
+
+def get_read_cursor(source: Optional[str] = None):
+    """FastAPI DI function for getting a cursor for read-only queries, to the
+    source's replica unless it lags more than `REPLICA_MAX_LAG` seconds
+
+    In routes, the source is picked with the `source` query parameter.
+    """
+    replica, _ = use_replica(source)
+    pool = get_pool(source, replica=replica)
+    with phase("pool"):
+        connection = pool.getconn()
+
+    try:
+        with cancellable(connection):
+            cursor = connection.cursor()
+
+            yield cursor
+
+            connection.commit()
+            cursor.close()
+    finally:
+        pool.putconn(connection)
+
+
+@contextmanager
+def read_cursor_manager(source: Optional[str] = None):
+    """Standalone ContextManager variation of get_read_cursor"""
+    yield from get_read_cursor(source)
+
+
+def format_replication_lag(reads: Dict[str, Tuple[bool, float]]) -> str:
+    """Format where each source was read from as an `X-Replication-Lag` header"""
+    return ", ".join(
+        f"{source};from={'replica' if replica else 'primary'};lag={lag:.3f}"
+        for source, (replica, lag) in reads.items()
+    )
+
+
+class ReplicationLagMiddleware:
+    """
+    ASGI middleware reporting, in an `X-Replication-Lag` header, whether each
+    source a request read was read from its primary or its replica, and how
+    many seconds behind the primary the data is.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        reads: Dict[str, Tuple[bool, float]] = {}
+        token = _reads.set(reads)
+
+        async def send_with_lag(message):
+            if message["type"] == "http.response.start" and reads:
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (
+                        b"x-replication-lag",
+                        format_replication_lag(reads).encode("latin-1"),
+                    )
+                ]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_lag)
+        finally:
+            _reads.reset(token)
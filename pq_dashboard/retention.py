@@ -0,0 +1,206 @@
+"""
+This module contains the retention runner, which periodically deletes
+processed items past their queue's maximum age or count
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pq_dashboard.config import RetentionPolicy, settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.data.items import clear_count_cache
+from pq_dashboard.data.queues import (
+    delete_processed_items,
+    get_queue_stats,
+    trim_processed_items,
+)
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.sources import get_source, get_source_names
+
+logger = logging.getLogger(__name__)
+
+
+def get_lock_name(source: Optional[str] = None) -> str:
+    """Name of the advisory lock held by whichever process is applying
+    retention to a source's queue table, by default the first source's"""
+    return f"pq_dashboard_retention:{get_source(source).queue_table}"
+
+
+def get_policies(queue_names) -> Dict[str, RetentionPolicy]:
+    """Get the retention policy of each queue which has one
+
+    Args:
+        queue_names: Names of the queues with processed items
+
+    Returns:
+        Dict[str, RetentionPolicy]: Policies, keyed by queue name
+    """
+    default = RetentionPolicy(
+        max_age=settings.RETENTION_MAX_AGE, max_count=settings.RETENTION_MAX_COUNT
+    )
+
+    policies = {}
+
+    for name in queue_names:
+        policy = settings.RETENTION_POLICIES.get(name, default)
+        if policy.max_age is not None or policy.max_count is not None:
+            policies[name] = policy
+
+    return policies
+
+
+def apply_policy(cursor, queue_name: str, policy: RetentionPolicy) -> int:
+    """Delete the processed items of a queue falling outside its policy
+
+    Returns:
+        int: Number of items deleted
+    """
+    deleted = 0
+
+    if policy.max_age is not None:
+        deleted += delete_processed_items(cursor, queue_name, older_than=policy.max_age)
+
+    if policy.max_count is not None:
+        deleted += trim_processed_items(cursor, queue_name, policy.max_count)
+
+    return deleted
+
+
+class RetentionRunner:
+    """
+    Applies retention policies to the queues of every source on a schedule.
+
+    Each run takes a session-level advisory lock on each source first, so
+    that when several dashboards share a queue table only one of them
+    deletes at a time. The others skip the source, which is recorded in the
+    last run's statistics.
+    """
+
+    def __init__(self):
+        self._last_run: Optional[dict] = None
+        self._runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> dict:
+        """Configuration and statistics of the last run"""
+        return {
+            "enabled": settings.RETENTION_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "interval": settings.RETENTION_INTERVAL,
+            "runs": self._runs,
+            "last_run": self._last_run,
+        }
+
+    def _lock(self, cursor, source: str) -> bool:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(hashtext(%s))", (get_lock_name(source),)
+        )
+        acquired = cursor.fetchone()[0]
+        cursor.connection.commit()
+        return acquired
+
+    def _unlock(self, cursor, source: str):
+        try:
+            cursor.connection.rollback()
+            cursor.execute(
+                "SELECT pg_advisory_unlock(hashtext(%s))", (get_lock_name(source),)
+            )
+            cursor.connection.commit()
+        except Exception:
+            # Closing the connection is the only other way to release the lock
+            logger.warning("Unable to release retention lock", exc_info=True)
+            cursor.connection.close()
+
+    def _run_source(self, source: str) -> dict:
+        run = {"acquired_lock": False, "deleted": {}, "error": None}
+
+        try:
+            with cursor_manager(source) as cursor:
+                run["acquired_lock"] = self._lock(cursor, source)
+
+                if run["acquired_lock"]:
+                    try:
+                        queue_names = [
+                            queue.name
+                            for queue in get_queue_stats(cursor)
+                            if queue.processed > 0
+                        ]
+                        cursor.connection.commit()
+
+                        for name, policy in get_policies(queue_names).items():
+                            run["deleted"][name] = apply_policy(cursor, name, policy)
+                    finally:
+                        self._unlock(cursor, source)
+        except Exception as err:
+            logger.exception("Retention run of %s failed", source)
+            run["error"] = str(err)
+
+        return run
+
+    def run_once(self, source: Optional[str] = None) -> dict:
+        """Apply every retention policy once, blocking until done
+
+        Args:
+            source (str, optional): Only apply them to this source. Defaults
+                to every source
+
+        Returns:
+            dict: Statistics of the run, with whether the lock was acquired,
+                the items deleted by queue and the error of each source
+        """
+        started = time.monotonic()
+        run = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "duration": None,
+            "sources": {},
+        }
+
+        for name in get_source_names(source):
+            run["sources"][name] = self._run_source(name)
+
+        if any(
+            any(source_run["deleted"].values())
+            for source_run in run["sources"].values()
+        ):
+            clear_count_cache()
+
+        run["finished_at"] = datetime.now(timezone.utc).isoformat()
+        run["duration"] = time.monotonic() - started
+
+        self._runs += 1
+        self._last_run = run
+
+        return run
+
+    async def _run(self):
+        while True:
+            await run_blocking(self.run_once)
+            await asyncio.sleep(settings.RETENTION_INTERVAL)
+
+    def start(self):
+        """Apply retention in the background of the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop applying retention in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def run_forever(self, source: Optional[str] = None):
+        """Apply retention on a schedule in the current thread, for the CLI.
+        Yields the statistics of every run."""
+        while True:
+            yield self.run_once(source)
+            time.sleep(settings.RETENTION_INTERVAL)
+
+
+retention = RetentionRunner()
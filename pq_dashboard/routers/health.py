@@ -1,24 +1,57 @@
 """This module defines the FastAPI healthcheck router"""
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException
 
 from pq_dashboard.config import settings
-from pq_dashboard.connection import get_connection
+from pq_dashboard.connection import get_pool
+from pq_dashboard.fanout import get_source_errors, query_sources
+from pq_dashboard.retention import retention
+from pq_dashboard.sources import redact_dsn
+from pq_dashboard.timing import TimedRoute, histograms
+
+router = APIRouter(prefix="/health", tags=["health"], route_class=TimedRoute)
 
-router = APIRouter(prefix="/health", tags=["health"])
+
+def check(cursor):
+    cursor.execute("SELECT 1")
 
 
 @router.get("/check")
 async def health_check():
-    """Health check endpoint"""
-    connection = None
+    """Health check endpoint
+
+    Every source is checked concurrently. The dashboard is alive while any
+    source can be queried, and the sources which cannot are listed in
+    `errors`.
+    """
     try:
-        connection = get_connection()
-        return {"still": "alive"}
+        _, errors = await query_sources(check)
     except Exception:
         raise HTTPException(status_code=500, detail="Cannot connect to database")
-    finally:
-        if connection:
-            connection.close()
+
+    if errors:
+        return {"still": "alive", "errors": get_source_errors(errors)}
+
+    return {"still": "alive"}
+
+
+@router.get("/pool")
+async def pool(source: Optional[str] = None):
+    """Get connection pool statistics of a source, by default the first"""
+    return get_pool(source).stats()
+
+
+@router.get("/retention")
+async def retention_stats():
+    """Get retention configuration and the statistics of its last run"""
+    return retention.stats()
+
+
+@router.get("/timings")
+async def timings():
+    """Get request phase timing histograms, in seconds"""
+    return histograms.stats()
 
 
 @router.get("/config")
@@ -27,4 +60,8 @@ async def config():
     data = settings.dict()
     data.pop("PGPASSWORD", None)
 
+    for source in data["SOURCES"]:
+        source["dsn"] = redact_dsn(source["dsn"])
+        source["replica_dsn"] = redact_dsn(source["replica_dsn"])
+
     return data
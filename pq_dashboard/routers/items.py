@@ -1,29 +1,60 @@
 """This module contains the FastAPI router used for manipulating queue items"""
+from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
+from pq_dashboard.conditional import get_etag, matches, not_modified, set_etag
 from pq_dashboard.connection import get_cursor
+from pq_dashboard.data.changes import get_change_marker
+from pq_dashboard.data.export import ExportFormat, export_items
 from pq_dashboard.data.items import (
+    clear_count_cache,
+    decode_page_token,
     delete_item,
-    get_item_counts,
-    get_items,
+    delete_items,
+    encode_page_token,
+    get_item,
+    get_item_page,
+    get_selection_filters,
     requeue_item,
+    requeue_items,
+    sort_items,
 )
-from pq_dashboard.schema.item import ItemPage
+from pq_dashboard.data.search import SearchMode, get_search_indexes
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.fanout import get_source_errors, query_sources
+from pq_dashboard.replicas import get_read_cursor
+from pq_dashboard.schema.item import (
+    BulkResult,
+    Item,
+    ItemPage,
+    ItemSelection,
+    ItemState,
+)
+from pq_dashboard.serialization import FastJSONResponse, get_item_page_content
+from pq_dashboard.sources import get_sources
+from pq_dashboard.timing import TimedRoute, phase
 
-router = APIRouter(prefix="/items", tags=["items"])
+router = APIRouter(prefix="/items", tags=["items"], route_class=TimedRoute)
 
 
-@router.get("/")
+@router.get("/", response_model=ItemPage)
 async def items(
-    cursor=Depends(get_cursor),
+    request: Request,
     limit: int = 10,
     offset: int = 0,
     queue: Optional[str] = None,
     exclude_processed: Optional[bool] = None,
     search: Optional[str] = None,
+    search_mode: SearchMode = SearchMode.auto,
     order_by: Optional[str] = None,
+    after: Optional[str] = None,
+    state: Optional[ItemState] = None,
+    enqueued_after: Optional[datetime] = None,
+    enqueued_before: Optional[datetime] = None,
+    source: Optional[str] = None,
 ):
     """Retrieve a list of items from the queue specified by the given parameters
 
@@ -34,31 +65,227 @@ async def items(
         exclude_processed: Filter out processed items when True
         order_by: Order results by
         search: Filter only for items matching term
+        search_mode: How `search` is matched. `text` is a substring match,
+            `contains` a JSON containment match, `path` a JSON path predicate.
+            `auto` is a `text` match, whichever indexes exist
+        state: Only items which are `queued` or `processed`
+        enqueued_after: Only items enqueued at or after this time
+        enqueued_before: Only items enqueued before this time
+        after: Keyset page token from a previous page's `next_after`. Pages
+            fetched this way stay fast however deep they are, unlike `offset`
+        source: Only items of this source. Default is None (all sources)
+
+    Sources are queried concurrently, and their items merged in order.
+    Those which fail or time out are listed in `errors`. Page tokens only
+    point into one source, so pages spanning several have no `next_after`.
+
+    Pages carry an ETag. Requests whose `If-None-Match` holds it get a `304`
+    without the page being fetched again, if nothing was written to the
+    database since.
     """
-    records = get_items(
-        cursor,
-        limit=limit,
-        offset=offset,
-        queue_name=queue,
-        exclude_processed=exclude_processed,
-        search=search,
-        order_by=order_by,
+    sources = None if source is None else [source]
+    spans_sources = source is None and len(get_sources()) > 1
+
+    if after is not None:
+        if spans_sources:
+            raise HTTPException(
+                status_code=400,
+                detail="Page tokens only apply to one source, pick it with `source`",
+            )
+        try:
+            decode_page_token(order_by, after)
+        except ValueError as err:
+            raise HTTPException(status_code=400, detail=str(err))
+
+    markers, marker_errors = await query_sources(
+        get_change_marker, sources=sources, read_only=True
     )
-    totals = get_item_counts(cursor, queue_name=queue, search=search)
+    etag = get_etag(markers, request)
+    if not marker_errors and matches(request, etag):
+        return not_modified(etag)
+
+    try:
+        pages, errors = await query_sources(
+            get_item_page,
+            sources=sources,
+            read_only=True,
+            # Merging pages needs every source's items up to the end of the page
+            limit=limit + offset if spans_sources else limit,
+            offset=0 if spans_sources else offset,
+            queue_name=queue,
+            exclude_processed=exclude_processed,
+            search=search,
+            search_mode=search_mode,
+            order_by=order_by,
+            after=after,
+            state=state,
+            enqueued_after=enqueued_after,
+            enqueued_before=enqueued_before,
+        )
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
 
-    if exclude_processed:
-        total = totals["queued"]
+    if spans_sources:
+        records = sort_items(
+            [record for records, _, _ in pages.values() for record in records],
+            order_by,
+        )[offset : offset + limit]
     else:
-        total = totals["total"]
+        records = [record for records, _, _ in pages.values() for record in records]
+
+    total = sum(total for _, total, _ in pages.values())
+    total_exact = all(total_exact for _, _, total_exact in pages.values())
+
+    next_after = None
+    if len(records) == limit and limit > 0 and not spans_sources:
+        next_after = encode_page_token(order_by, records[-1])
+
+    # Pages are encoded directly rather than validated into an ItemPage and
+    # passed through jsonable_encoder, which dominates large pages
+    with phase("serialize"):
+        response = FastJSONResponse(
+            get_item_page_content(
+                records,
+                limit=limit,
+                offset=offset if after is None else 0,
+                total=total,
+                total_exact=total_exact,
+                next_after=next_after,
+                errors=get_source_errors(errors),
+            )
+        )
+
+    if not marker_errors and not errors:
+        set_etag(response, etag)
+    return response
+
+
+@router.get("/search-indexes")
+async def search_indexes(cursor=Depends(get_read_cursor)):
+    """Report which search indexes exist on the queue table"""
+    return await run_blocking(get_search_indexes, cursor)
+
+
+def stream_export(connection, format: ExportFormat, filters: dict):
+    """Export items on the request's connection
+
+    The connection of a dependency is only released once the response has
+    been sent, so it is held for as long as the stream anyway, and an
+    export never takes a second one from the pool.
+    """
+    yield from export_items(connection, format, **filters)
+
+
+@router.get("/export")
+async def export(
+    cursor=Depends(get_read_cursor),
+    format: ExportFormat = ExportFormat.ndjson,
+    queue: Optional[str] = None,
+    exclude_processed: Optional[bool] = None,
+    search: Optional[str] = None,
+    search_mode: SearchMode = SearchMode.auto,
+    state: Optional[ItemState] = None,
+    enqueued_after: Optional[datetime] = None,
+    enqueued_before: Optional[datetime] = None,
+    source: Optional[str] = None,
+):
+    """Stream every matching item as NDJSON or CSV, in ID order
+
+    Takes the same filters as the items list, for one source. Items are read through a
+    server-side cursor and streamed as they are decoded, so exports of any
+    size use constant memory.
+    """
+    try:
+        filters = await run_blocking(
+            get_selection_filters,
+            cursor,
+            queue_name=queue,
+            search=search,
+            search_mode=search_mode,
+            state=ItemState.queued if exclude_processed else state,
+            enqueued_after=enqueued_after,
+            enqueued_before=enqueued_before,
+            allow_all=True,
+        )
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+    media_type = "text/csv" if format == ExportFormat.csv else "application/x-ndjson"
+
+    return StreamingResponse(
+        stream_export(cursor.connection, format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{format.value}"'},
+    )
+
+
+async def select_items(cursor, selection: ItemSelection) -> dict:
+    """Resolve a bulk selection into filters, rejecting empty or invalid ones"""
+    try:
+        return await run_blocking(
+            get_selection_filters,
+            cursor,
+            ids=selection.ids,
+            queue_name=selection.queue,
+            search=selection.search,
+            search_mode=selection.search_mode,
+            state=selection.state,
+            enqueued_after=selection.enqueued_after,
+            enqueued_before=selection.enqueued_before,
+        )
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+@router.post("/bulk/requeue", response_model=BulkResult)
+async def bulk_requeue(selection: ItemSelection, cursor=Depends(get_cursor)):
+    """Requeue every selected item, by ID list or by filter"""
+    filters = await select_items(cursor, selection)
+    affected = await run_blocking(requeue_items, cursor, **filters)
+    clear_count_cache()
+
+    return BulkResult(affected=affected)
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete(selection: ItemSelection, cursor=Depends(get_cursor)):
+    """Delete every selected item, by ID list or by filter"""
+    filters = await select_items(cursor, selection)
+    affected = await run_blocking(delete_items, cursor, **filters)
+    clear_count_cache()
+
+    return BulkResult(affected=affected)
+
+
+@router.get("/{item_id}", response_model=Item)
+async def item(item_id: int, cursor=Depends(get_read_cursor)):
+    """Retrieve a single item, with its full payload"""
+    record = await run_blocking(get_item, cursor, item_id)
+
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+
+    return record
+
+
+@router.get("/{item_id}/payload")
+async def payload(item_id: int, cursor=Depends(get_read_cursor)):
+    """Retrieve the full, decoded payload of a single item"""
+    record = await run_blocking(get_item, cursor, item_id)
+
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
 
-    return ItemPage(records=records, limit=limit, offset=offset, total=total)
+    return record.data
 
 
 @router.delete("/{item_id}")
 async def delete(item_id: int, cursor=Depends(get_cursor)):
-    delete_item(cursor, item_id)
+    await run_blocking(delete_item, cursor, item_id)
+    clear_count_cache()
 
 
 @router.post("/{item_id}/requeue")
 async def requeue(item_id: int, cursor=Depends(get_cursor)):
-    requeue_item(cursor, item_id)
+    await run_blocking(requeue_item, cursor, item_id)
+    clear_count_cache()
@@ -1,33 +1,134 @@
 """This module contains the FastAPI router used for manipulating queues"""
-from fastapi import APIRouter, Depends, Response, status
+from datetime import timedelta
+from typing import Optional
 
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from pq_dashboard.conditional import get_etag, matches, not_modified, set_etag
 from pq_dashboard.connection import get_cursor
+from pq_dashboard.data.changes import get_change_marker
+from pq_dashboard.data.items import clear_count_cache
 from pq_dashboard.data.queues import (
     delete_processed_items,
     delete_queued_items,
     get_queue_stats,
 )
+from pq_dashboard.executor import run_blocking
+from pq_dashboard.fanout import get_source_errors, query_sources
+from pq_dashboard.live import get_broadcaster, stream_events
+from pq_dashboard.metrics import collector
+from pq_dashboard.schema.item import BulkResult
+from pq_dashboard.schema.queue import QueueList, QueueMetrics
+from pq_dashboard.sources import get_sources
+from pq_dashboard.timing import TimedRoute
+
+router = APIRouter(prefix="/queues", tags=["queues"], route_class=TimedRoute)
+
+
+@router.get("/", response_model=QueueList)
+async def queues(request: Request, response: Response):
+    """Retrieve the queue statistics of every source
+
+    Sources are queried concurrently. Those which fail or time out are
+    listed in `errors`, alongside the statistics of the others.
+
+    Statistics carry an ETag. Requests whose `If-None-Match` holds it get a
+    `304` without the statistics being computed again, if nothing was
+    written to any source since. Statistics missing a source carry none.
+    """
+    markers, marker_errors = await query_sources(get_change_marker, read_only=True)
+    etag = get_etag(markers, request)
+    if not marker_errors and matches(request, etag):
+        return not_modified(etag)
+
+    stats, errors = await query_sources(get_queue_stats, read_only=True)
+    if not marker_errors and not errors:
+        set_etag(response, etag)
+
+    return QueueList(
+        queues=[queue for source_stats in stats.values() for queue in source_stats],
+        sources=[source.name for source in get_sources()],
+        errors=get_source_errors(errors),
+    )
+
+
+@router.get("/events")
+async def events(request: Request, source: Optional[str] = None):
+    """Stream the queue statistics of a source as Server-Sent Events
+
+    The first `snapshot` event lists every queue. Each following `queues`
+    event lists the queues which changed, with their deltas, and the queues
+    which were removed. All viewers of a source share one database
+    listener. Defaults to the first source.
+    """
+    broadcaster = get_broadcaster(source)
+    subscriber = await broadcaster.subscribe()
+
+    return StreamingResponse(
+        stream_events(request, broadcaster, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{queue_name}/metrics", response_model=QueueMetrics)
+async def metrics(queue_name: str, source: Optional[str] = None):
+    """Retrieve the throughput and wait times of a queue
 
-router = APIRouter(prefix="/queues", tags=["queues"])
+    Rates are in items per second, and wait times (from enqueue to dequeue)
+    in seconds, over each configured sliding window and for every collection
+    interval in the retained history. Metrics are collected in the
+    background from every source, so this does not query the database.
+    """
+    return collector.get_metrics(queue_name, source)
 
 
-@router.get("/")
-async def queues(cursor=Depends(get_cursor)):
-    """Retrieve queue statistics"""
-    return get_queue_stats(cursor)
+@router.post("/{queue_name}/delete-queued", response_model=BulkResult)
+async def delete_queued(
+    queue_name: str,
+    older_than: Optional[timedelta] = None,
+    batch_size: Optional[int] = Query(None, ge=1),
+    cursor=Depends(get_cursor),
+):
+    """Delete all items from the queue with the given name
 
+    Items are deleted in batches of `batch_size`, each in its own
+    transaction. With `older_than` (seconds, or an ISO 8601 duration), only
+    items enqueued at least that long ago are deleted.
+    """
+    affected = await run_blocking(
+        delete_queued_items,
+        cursor,
+        queue_name,
+        older_than=older_than,
+        batch_size=batch_size,
+    )
+    clear_count_cache()
 
-@router.post("/{queue_name}/delete-queued")
-async def delete_queued(queue_name: str, cursor=Depends(get_cursor)):
-    """Delete all items from the queue with the given name"""
-    delete_queued_items(cursor, queue_name)
+    return BulkResult(affected=affected)
 
-    return Response(status_code=status.HTTP_200_OK)
 
+@router.post("/{queue_name}/delete-processed", response_model=BulkResult)
+async def delete_processed(
+    queue_name: str,
+    older_than: Optional[timedelta] = None,
+    batch_size: Optional[int] = Query(None, ge=1),
+    cursor=Depends(get_cursor),
+):
+    """Delete all processed items from the queue with the given name
 
-@router.post("/{queue_name}/delete-processed")
-async def delete_processed(queue_name: str, cursor=Depends(get_cursor)):
-    """Delete all processed items from the queue with the given name"""
-    delete_processed_items(cursor, queue_name)
+    Items are deleted in batches of `batch_size`, each in its own
+    transaction. With `older_than` (seconds, or an ISO 8601 duration), only
+    items dequeued at least that long ago are deleted.
+    """
+    affected = await run_blocking(
+        delete_processed_items,
+        cursor,
+        queue_name,
+        older_than=older_than,
+        batch_size=batch_size,
+    )
+    clear_count_cache()
 
-    return Response(status_code=status.HTTP_200_OK)
+    return BulkResult(affected=affected)
@@ -1,12 +1,25 @@
 """This module contains pydantic models for working with Items"""
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional, Union
 
 from pydantic import BaseModel
 
+from pq_dashboard.data.search import SearchMode
+from pq_dashboard.schema.queue import SourceError
+
+
+class ItemState(str, Enum):
+    """Whether an item is still queued or has been processed"""
+
+    queued = "queued"
+    processed = "processed"
+
 
 class Item(BaseModel):
-    """Pydantic model for a pq queue item"""
+    """Pydantic model for a pq queue item. In lists, payloads too large to
+    send in full have no `data`, but their `size`, and a truncated `preview`
+    of their JSON if they are objects or arrays."""
 
     id: int
     enqueued_at: datetime
@@ -14,7 +27,11 @@ class Item(BaseModel):
     expected_at: Optional[datetime]
     schedule_at: Optional[datetime]
     q_name: str
-    data: Union[dict, list, str]
+    data: Union[dict, list, str, None]
+    size: Optional[int] = None
+    preview: Optional[str] = None
+    truncated: bool = False
+    source: Optional[str] = None
 
 
 class ItemPage(BaseModel):
@@ -22,5 +39,27 @@ class ItemPage(BaseModel):
 
     records: List[Item]
     total: int
+    total_exact: bool = True
     limit: int
     offset: int
+    next_after: Optional[str] = None
+    errors: List[SourceError] = []
+
+
+class ItemSelection(BaseModel):
+    """Pydantic model selecting items for a bulk action, by ID or by filter.
+    Filters are combined, and have the same meaning as on the items list."""
+
+    ids: Optional[List[int]] = None
+    queue: Optional[str] = None
+    search: Optional[str] = None
+    search_mode: SearchMode = SearchMode.auto
+    state: Optional[ItemState] = None
+    enqueued_after: Optional[datetime] = None
+    enqueued_before: Optional[datetime] = None
+
+
+class BulkResult(BaseModel):
+    """Pydantic model for the outcome of a bulk action"""
+
+    affected: int
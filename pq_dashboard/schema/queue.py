@@ -1,4 +1,7 @@
 """This module contains pydantic models for working with Queues"""
+from datetime import datetime
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -7,3 +10,59 @@ class Queue(BaseModel):
     total: int
     queued: int = Field(0)
     processed: int = Field(0)
+    source: Optional[str] = None
+
+
+class SourceError(BaseModel):
+    """A source which could not be queried, and why"""
+
+    source: str
+    message: str
+
+
+class QueueList(BaseModel):
+    """Statistics of the queues of every source which could be queried"""
+
+    queues: List[Queue]
+    sources: List[str]
+    errors: List[SourceError] = []
+
+
+class WaitPercentiles(BaseModel):
+    """Percentiles of the seconds items waited between enqueue and dequeue"""
+
+    p50: Optional[float]
+    p95: Optional[float]
+    p99: Optional[float]
+
+
+class MetricsPoint(BaseModel):
+    """Activity of a queue during one collection interval"""
+
+    at: datetime
+    interval: float
+    enqueued: int
+    dequeued: int
+    enqueue_rate: float
+    dequeue_rate: float
+    wait: WaitPercentiles
+
+
+class MetricsWindow(BaseModel):
+    """Activity of a queue rolled up over a sliding window"""
+
+    seconds: float
+    enqueued: int
+    dequeued: int
+    enqueue_rate: float
+    dequeue_rate: float
+    wait: WaitPercentiles
+
+
+class QueueMetrics(BaseModel):
+    """Sliding windows and time series of a queue's throughput and wait times"""
+
+    name: str
+    interval: float
+    windows: List[MetricsWindow]
+    series: List[MetricsPoint]
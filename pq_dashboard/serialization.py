@@ -0,0 +1,69 @@
+"""
+This module contains the fast JSON encoding of large API responses, which
+uses orjson when it is installed and the standard library otherwise
+"""
+import json
+from typing import List, Optional
+
+from fastapi.responses import JSONResponse
+
+from pq_dashboard.data.export import json_default
+from pq_dashboard.schema.item import Item
+from pq_dashboard.schema.queue import SourceError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """Encode content as compact UTF-8 JSON
+
+    Values JSON cannot hold, which unpickled payloads may contain, are
+    encoded the same way as in exports. Content orjson cannot encode, such
+    as integers wider than 64 bits, is encoded by the standard library.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                content, default=json_default, option=orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(
+        content, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoding plain data with `dumps`
+
+    Its content is not validated or passed through `jsonable_encoder`, so it
+    must already be built from dicts, lists and scalars.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def get_item_page_content(
+    records: List[Item],
+    total: int,
+    total_exact: bool,
+    limit: int,
+    offset: int,
+    next_after: Optional[str],
+    errors: List[SourceError],
+) -> dict:
+    """Build the content of an `ItemPage` from items straight from the database"""
+    return {
+        "records": [dict(record) for record in records],
+        "total": total,
+        "total_exact": total_exact,
+        "limit": limit,
+        "offset": offset,
+        "next_after": next_after,
+        "errors": [dict(error) for error in errors],
+    }
@@ -0,0 +1,107 @@
+"""
+This module contains the sources monitored by the dashboard, each a queue
+table in a database, and helpers for finding out which one a cursor reads
+"""
+from typing import List, Optional
+
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+from pq_dashboard.config import Source, settings
+
+DEFAULT_SOURCE = "default"
+
+
+class UnknownSource(KeyError):
+    """Raised when a source name is not configured"""
+
+    def __str__(self):
+        return f"Unknown source: {self.args[0]}"
+
+
+def get_sources() -> List[Source]:
+    """Get the configured sources, or the single source built from the
+    database and queue table settings if none are"""
+    if settings.SOURCES:
+        return settings.SOURCES
+
+    replica_dsn = None
+    if settings.REPLICA_HOST:
+        replica_dsn = make_dsn(
+            host=settings.REPLICA_HOST,
+            port=settings.REPLICA_PORT or settings.PGPORT,
+            dbname=settings.DATABASE,
+            user=settings.PGUSER,
+            password=settings.PGPASSWORD,
+        )
+
+    return [
+        Source(
+            name=DEFAULT_SOURCE,
+            dsn="",
+            queue_table=settings.QUEUE_TABLE,
+            counters_table=settings.COUNTERS_TABLE,
+            replica_dsn=replica_dsn,
+        )
+    ]
+
+
+def get_source(name: Optional[str] = None) -> Source:
+    """Get a source by name, or the first source if no name is given
+
+    Raises:
+        UnknownSource: If no source has that name
+    """
+    sources = get_sources()
+
+    if name is None:
+        return sources[0]
+
+    for source in sources:
+        if source.name == name:
+            return source
+
+    raise UnknownSource(name)
+
+
+def get_source_names(name: Optional[str] = None) -> List[str]:
+    """Names of every source, or only of the named source if a name is given,
+    for background work which covers every source unless told otherwise
+
+    Raises:
+        UnknownSource: If no source has that name
+    """
+    if name is not None:
+        return [get_source(name).name]
+
+    return [source.name for source in get_sources()]
+
+
+def get_cursor_source(cursor) -> Source:
+    """Get the source whose database a cursor is connected to
+
+    Connections made by `get_connection` know their source. Any other
+    connection is taken to be to the first source.
+    """
+    return get_source(getattr(cursor.connection, "source_name", None))
+
+
+def get_queue_table(cursor) -> str:
+    """Name of the queue table of the source a cursor is connected to"""
+    return get_cursor_source(cursor).queue_table
+
+
+def redact_dsn(dsn: str) -> str:
+    """Mask the password of a DSN, so that it can be shown"""
+    if not dsn:
+        return dsn
+
+    try:
+        params = parse_dsn(dsn)
+    except psycopg2.ProgrammingError:
+        return "<invalid>"
+
+    if "password" in params:
+        params["password"] = "***"
+
+    return make_dsn(**params)
@@ -0,0 +1,297 @@
+"""
+This module contains request timing instrumentation: per-phase timings of
+each API request, reported as Server-Timing headers and aggregated into
+histograms, and a log of slow statements
+"""
+import asyncio
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi.routing import APIRoute
+from psycopg2.extras import DictCursor
+
+from pq_dashboard.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the phase duration histogram buckets
+TIMING_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+
+class RequestTimings(dict):
+    """Phase durations of a request, in seconds, and the number of statements
+    it ran, which the threads running its blocking work add to concurrently"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.queries = 0
+        # perf_counter() when the endpoint returned
+        self.endpoint_finished: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self)
+
+
+# Timings of the current request. Unset outside of API requests.
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar("timings", default=None)
+
+
+def record(name: str, duration: float):
+    """Add time spent in a phase to the current request's timings"""
+    timings = _timings.get()
+    if timings is not None:
+        with timings.lock:
+            timings[name] = timings.get(name, 0.0) + duration
+
+
+@contextmanager
+def phase(name: str):
+    """ContextManager timing a phase of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+@contextmanager
+def endpoint_phase():
+    """ContextManager timing the endpoint of the current request, and noting
+    when it returned so that serialization is timed from there"""
+    with phase("endpoint"):
+        yield
+
+    timings = _timings.get()
+    if timings is not None:
+        timings.endpoint_finished = time.perf_counter()
+
+
+def timed(name: str):
+    """Decorator timing every call to a function as a phase"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def normalize_sql(query) -> str:
+    """Collapse a statement's whitespace, for logging"""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+
+    return re.sub(r"\s+", " ", str(query)).strip()[:1000]
+
+
+def get_params_shape(params) -> str:
+    """Describe the types of a statement's parameters, without their values"""
+    if params is None:
+        return "()"
+
+    def shape(value) -> str:
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {shape(v)}" for key, v in params.items()) + "}"
+
+    return "(" + ", ".join(shape(value) for value in params) + ")"
+
+
+class TimedCursor(DictCursor):
+    """DictCursor timing every statement as part of the `db` phase, and
+    logging those slower than `SLOW_QUERY_THRESHOLD` seconds"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duration = time.perf_counter() - started
+            record("db", duration)
+
+            timings = _timings.get()
+            if timings is not None:
+                with timings.lock:
+                    timings.queries += 1
+
+            threshold = settings.SLOW_QUERY_THRESHOLD
+            if threshold and duration > threshold:
+                logger.warning(
+                    "Slow query (%.1fms): %s params: %s",
+                    duration * 1000,
+                    normalize_sql(query),
+                    get_params_shape(vars),
+                )
+
+
+class TimingHistograms:
+    """Thread-safe histograms of phase durations across requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: Dict[str, dict] = {}
+
+    def observe(self, name: str, duration: float):
+        index = next(
+            (i for i, bound in enumerate(TIMING_BUCKETS) if duration <= bound),
+            len(TIMING_BUCKETS),
+        )
+
+        with self._lock:
+            histogram = self._phases.setdefault(
+                name,
+                {
+                    "count": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * (len(TIMING_BUCKETS) + 1),
+                },
+            )
+            histogram["count"] += 1
+            histogram["sum"] += duration
+            histogram["max"] = max(histogram["max"], duration)
+            histogram["buckets"][index] += 1
+
+    def clear(self):
+        with self._lock:
+            self._phases.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        """Count, total, mean, max and estimated percentiles of every phase, in seconds"""
+        from pq_dashboard.metrics import get_percentile
+
+        with self._lock:
+            phases = {
+                name: dict(h, buckets=list(h["buckets"]))
+                for name, h in self._phases.items()
+            }
+
+        return {
+            name: {
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "mean": histogram["sum"] / histogram["count"],
+                "max": histogram["max"],
+                "p50": get_percentile(histogram["buckets"], 0.5, TIMING_BUCKETS),
+                "p95": get_percentile(histogram["buckets"], 0.95, TIMING_BUCKETS),
+                "p99": get_percentile(histogram["buckets"], 0.99, TIMING_BUCKETS),
+            }
+            for name, histogram in sorted(phases.items())
+        }
+
+
+histograms = TimingHistograms()
+
+
+def format_server_timing(timings: Dict[str, float], queries: int) -> str:
+    """Format phase timings as a Server-Timing header value, in milliseconds"""
+    entries = []
+    for name, duration in timings.items():
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if name == "db":
+            entry += f';desc="{queries} queries"'
+        entries.append(entry)
+
+    return ", ".join(entries)
+
+
+class TimedRoute(APIRoute):
+    """
+    Route timing its endpoint apart from the rest of its handler. What
+    follows the endpoint, mostly response validation and serialization, is
+    timed as `serialize`.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # Routes are created again from the same endpoint when their router
+        # is included in an app, which must not time them twice
+        if getattr(endpoint, "timed", False):
+            timed_endpoint = endpoint
+
+        elif asyncio.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kwargs):
+                with endpoint_phase():
+                    return await endpoint(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kwargs):
+                with endpoint_phase():
+                    return endpoint(*args, **kwargs)
+
+        timed_endpoint.timed = True
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+
+            timings = _timings.get()
+            if timings is not None and timings.endpoint_finished is not None:
+                record("serialize", time.perf_counter() - timings.endpoint_finished)
+
+            return response
+
+        return timed_handler
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware collecting the phase timings of each request, adding them
+    to the response as a Server-Timing header and to the timing histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        timings_token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - started
+                durations = timings.snapshot()
+                header = format_server_timing(
+                    {**durations, "total": total}, timings.queries
+                )
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+
+                for name, duration in durations.items():
+                    histograms.observe(name, duration)
+                histograms.observe("total", total)
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _timings.reset(timings_token)
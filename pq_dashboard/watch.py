@@ -0,0 +1,127 @@
+"""
+This module contains the live queue statistics of `pq-dashboard stats --watch`,
+polled over a single connection, less often when polling gets expensive
+"""
+import time
+from typing import Dict, List, Optional
+
+from pq_dashboard.config import settings
+from pq_dashboard.data.queues import get_queue_activity, get_queue_stats
+from pq_dashboard.metrics import WAIT_BUCKETS, get_rate
+
+# Columns the watched queues can be sorted by, and whether descending
+WATCH_SORTS = {
+    "name": False,
+    "queued": True,
+    "processed": True,
+    "total": True,
+    "enqueue_rate": True,
+    "dequeue_rate": True,
+}
+
+
+def get_watch_interval(
+    duration: float, interval: float = None, max_load: float = None
+) -> float:
+    """Seconds until the next poll, so that polls taking `duration` seconds
+    keep the database busy at most `max_load` of the time
+
+    Args:
+        duration (float): Seconds the polls take
+        interval (float, optional): Shortest interval. Defaults to WATCH_INTERVAL
+        max_load (float, optional): Defaults to WATCH_MAX_LOAD
+    """
+    interval = settings.WATCH_INTERVAL if interval is None else interval
+    max_load = max_load or settings.WATCH_MAX_LOAD
+
+    return max(interval, duration / max_load - duration)
+
+
+def sort_queues(queues: List[dict], sort_by: str = "name") -> List[dict]:
+    """Sort watched queues by a column, highest first but for names. Rates
+    unknown until the second poll sort as zero"""
+    return sorted(
+        queues,
+        key=lambda queue: (queue[sort_by] or 0, queue["name"]),
+        reverse=WATCH_SORTS[sort_by],
+    )
+
+
+class StatsWatcher:
+    """
+    Polls queue statistics over one connection, and the enqueues and
+    dequeues since the previous poll, from the same watermarks as the
+    metrics collector, so that rates cost as little as the stats.
+
+    The interval between polls grows when they get slower, from the time
+    they took on average, and shrinks back when they get faster.
+    """
+
+    def __init__(self, connection, interval: float = None, max_load: float = None):
+        self.connection = connection
+        self.min_interval = settings.WATCH_INTERVAL if interval is None else interval
+        self.max_load = max_load
+        self.interval = self.min_interval
+        # Moving average of the seconds polls take
+        self.duration: Optional[float] = None
+        self._watermarks: Optional[dict] = None
+        self._previous: Dict[str, dict] = {}
+
+    def poll(self) -> List[dict]:
+        """Poll queue statistics, blocking
+
+        Returns:
+            List[dict]: Each queue's `name`, `queued`, `processed` and `total`
+                counts, the change in the `queued` and `processed` counts
+                and the `enqueue_rate` and `dequeue_rate` since the previous
+                poll, or None for the first poll of a queue
+        """
+        watermarks = self._watermarks
+        started = time.perf_counter()
+
+        with self.connection.cursor() as cursor:
+            queues = get_queue_stats(cursor)
+            activity, self._watermarks = get_queue_activity(
+                cursor, watermarks, WAIT_BUCKETS
+            )
+
+        duration = time.perf_counter() - started
+        self.duration = (
+            duration if self.duration is None else (self.duration + duration) / 2
+        )
+        self.interval = get_watch_interval(
+            self.duration, self.min_interval, self.max_load
+        )
+
+        elapsed = None
+        if watermarks is not None:
+            elapsed = (self._watermarks["at"] - watermarks["at"]).total_seconds()
+
+        results = []
+        for queue in queues:
+            result = {
+                "name": queue.name,
+                "queued": queue.queued,
+                "processed": queue.processed,
+                "total": queue.total,
+                "queued_delta": None,
+                "processed_delta": None,
+                "enqueue_rate": None,
+                "dequeue_rate": None,
+            }
+
+            previous = self._previous.get(queue.name)
+            if previous is not None:
+                result["queued_delta"] = queue.queued - previous["queued"]
+                result["processed_delta"] = queue.processed - previous["processed"]
+
+            if elapsed is not None:
+                counts = activity.get(queue.name, {"enqueued": 0, "dequeued": 0})
+                result["enqueue_rate"] = get_rate(counts["enqueued"], elapsed)
+                result["dequeue_rate"] = get_rate(counts["dequeued"], elapsed)
+
+            results.append(result)
+
+        self._previous = {queue["name"]: queue for queue in results}
+
+        return results
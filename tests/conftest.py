@@ -3,8 +3,12 @@ Root-level conftest: Creates or obtains a postgres instance and makes sure
 PQ has been initialized against it 
 """
 import os
+import socket
+import threading
+import time
 
 import pytest
+import uvicorn
 from fastapi.testclient import TestClient
 from pq import PQ
 from pytest_postgresql import factories
@@ -32,6 +36,33 @@ def test_client():
     yield TestClient(app)
 
 
+@pytest.fixture(scope="session")
+def live_server(test_config):
+    """Fixture of the app served by uvicorn on a background thread, for
+    tests which need real concurrent HTTP requests"""
+    from pq_dashboard.main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error")
+    )
+    server.install_signal_handlers = lambda: None
+
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    yield f"http://127.0.0.1:{port}"
+
+    server.should_exit = True
+    thread.join()
+
+
 @pytest.fixture(scope="session", autouse=True)
 def test_config():
     """Patch the configuration object for testing"""
@@ -0,0 +1,145 @@
+"""This module contains tests for statement timeouts and query cancellation"""
+import asyncio
+import threading
+import time
+
+from pq_dashboard.cancellation import RequestQueries
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.data.items import get_item_page
+from pq_dashboard.data.queues import get_queue_stats
+
+
+def slow(func, seconds: float):
+    """Wrap a data function to sleep on the database before running"""
+
+    def slow_func(cursor, *args, **kwargs):
+        cursor.execute("SELECT pg_sleep(%s)", (seconds,))
+        return func(cursor, *args, **kwargs)
+
+    return slow_func
+
+
+def test_statement_timeout(test_client, test_pq, monkeypatch):
+    """Test that queries over their endpoint's budget are reported as too expensive"""
+    # Given: An items endpoint with a short budget, and a slow item page query
+    monkeypatch.setitem(settings.STATEMENT_TIMEOUTS, "items", 0.2)
+    monkeypatch.setattr(
+        "pq_dashboard.routers.items.get_item_page", slow(get_item_page, 5)
+    )
+
+    # When: Items are listed
+    start = time.monotonic()
+    response = test_client.get("/api/v1/items/", params={"search": "item"})
+    elapsed = time.monotonic() - start
+
+    # Then: The query is cancelled once over budget, with a structured error
+    assert response.status_code == 504
+    assert elapsed < 2
+
+    data = response.json()
+
+    assert data["reason"] == "statement_timeout"
+    assert data["timeout"] == 0.2
+    assert data["message"].startswith("Query too expensive")
+
+
+def test_statement_timeout_per_endpoint(test_client, test_pq, monkeypatch):
+    """Test that an endpoint's budget does not apply to the others, nor outside requests"""
+    # Given: An items endpoint with a short budget, and queue stats slower than it
+    monkeypatch.setitem(settings.STATEMENT_TIMEOUTS, "items", 0.2)
+    monkeypatch.setattr(
+        "pq_dashboard.routers.queues.get_queue_stats", slow(get_queue_stats, 0.4)
+    )
+    test_client.get("/api/v1/items/")
+
+    # When: Queue stats are retrieved
+    response = test_client.get("/api/v1/queues/")
+
+    # Then: They use the default budget
+    assert response.status_code == 200
+
+    # And: Pooled connections used outside of requests have no timeout
+    with cursor_manager() as cursor:
+        cursor.execute("SHOW statement_timeout")
+        assert cursor.fetchone()[0] == "0"
+
+
+def test_disconnect_cancels_queries(test_pq, monkeypatch):
+    """Test that the queries of a request are cancelled when its client disconnects"""
+    from pq_dashboard.main import v1_api
+
+    # Given: A slow item page query
+    monkeypatch.setattr(
+        "pq_dashboard.routers.items.get_item_page", slow(get_item_page, 5)
+    )
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/items/",
+        "root_path": "",
+        "raw_path": b"/items/",
+        "query_string": b"source=default",
+        "headers": [],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def request():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b""}
+
+            await asyncio.sleep(0.3)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        await v1_api(scope, receive, send)
+
+    # When: The client disconnects while the query runs
+    start = time.monotonic()
+    asyncio.run(request())
+    elapsed = time.monotonic() - start
+
+    # Then: The query was cancelled rather than run to completion
+    assert elapsed < 2
+    assert messages[0]["status"] == 499
+
+
+def test_disconnect_holds_connections():
+    """Test that a connection is only released once its cancel was sent"""
+    cancelled = []
+    cancelling = threading.Event()
+
+    class SlowCancelConnection:
+        def cancel(self):
+            cancelling.set()
+            time.sleep(0.2)
+            cancelled.append(time.monotonic())
+
+    # Given: A request running a query on a connection
+    queries = RequestQueries({})
+    connection = SlowCancelConnection()
+    queries.add(connection)
+
+    # When: The request's thread releases it while its query is being cancelled
+    disconnect = threading.Thread(target=queries.disconnect)
+    disconnect.start()
+    cancelling.wait()
+
+    queries.discard(connection)
+    released = time.monotonic()
+    disconnect.join()
+
+    # Then: It was only released, e.g. back to the pool, after the cancel
+    assert released >= cancelled[0]
@@ -0,0 +1,63 @@
+"""This module contains load tests for concurrent API requests"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from pq_dashboard.data.items import get_items_and_counts
+
+SLOW_QUERY_SECONDS = 1.0
+
+
+def slow_get_items_and_counts(cursor, **kwargs):
+    """A get_items_and_counts which first runs a deliberately slow query"""
+    cursor.execute("SELECT pg_sleep(%s)", (SLOW_QUERY_SECONDS,))
+    return get_items_and_counts(cursor, **kwargs)
+
+
+def test_slow_query_does_not_block_other_requests(live_server, test_pq, monkeypatch):
+    """Test that other endpoints keep responding while a slow query runs"""
+    # Given: A slow items query
+    monkeypatch.setattr(
+        "pq_dashboard.data.items.get_items_and_counts", slow_get_items_and_counts
+    )
+    test_pq["one"].put("item 1")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        slow_request = pool.submit(requests.get, f"{live_server}/api/v1/items/")
+        time.sleep(0.2)
+
+        # When: Queue stats are requested while it is running
+        start = time.monotonic()
+        response = requests.get(f"{live_server}/api/v1/queues/")
+        elapsed = time.monotonic() - start
+
+        # Then: They are returned without waiting for the slow query
+        assert response.status_code == 200
+        assert elapsed < SLOW_QUERY_SECONDS / 2
+        assert slow_request.result().status_code == 200
+
+
+def test_concurrent_slow_queries_overlap(live_server, test_pq, monkeypatch):
+    """Test that concurrent slow requests run in parallel rather than serially"""
+    # Given: A slow items query
+    monkeypatch.setattr(
+        "pq_dashboard.data.items.get_items_and_counts", slow_get_items_and_counts
+    )
+    test_pq["one"].put("item 1")
+    concurrency = 4
+
+    # When: Several requests are made at once
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(
+            pool.map(
+                lambda _: requests.get(f"{live_server}/api/v1/items/"),
+                range(concurrency),
+            )
+        )
+    elapsed = time.monotonic() - start
+
+    # Then: They all succeed in much less time than running them one by one
+    assert all(response.status_code == 200 for response in responses)
+    assert elapsed < SLOW_QUERY_SECONDS * concurrency / 2
@@ -0,0 +1,181 @@
+"""This module contains tests for the trigger-maintained queue counters"""
+import pytest
+
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager, get_connection
+from pq_dashboard.data.counters import (
+    compact_counters,
+    install_counters,
+    reconcile_counters,
+    uninstall_counters,
+)
+from pq_dashboard.data.queues import get_queue_stats
+
+
+@pytest.fixture(scope="function")
+def counters(test_pq, monkeypatch):
+    """Fixture installing the counters table and reading stats from it"""
+    with cursor_manager() as cursor:
+        install_counters(cursor)
+
+    monkeypatch.setattr(settings, "USE_COUNTERS", True)
+
+    yield
+
+    with cursor_manager() as cursor:
+        uninstall_counters(cursor)
+
+
+def test_counters_track_inserts_and_dequeues(test_client, test_pq, counters):
+    """Test that counters follow items being added and processed"""
+    # Given: Items added to and taken from queues
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    test_pq["two"].put("item 3")
+    _ = test_pq["one"].get()
+
+    # When: Queue stats are retrieved
+    response = test_client.get("/api/v1/queues/")
+
+    # Then: They reflect every change
+    results = {x["name"]: x for x in response.json()["queues"]}
+
+    assert results == {
+        "one": {
+            "name": "one",
+            "queued": 1,
+            "processed": 1,
+            "total": 2,
+            "source": "default",
+        },
+        "two": {
+            "name": "two",
+            "queued": 1,
+            "processed": 0,
+            "total": 1,
+            "source": "default",
+        },
+    }
+
+
+def test_counters_concurrent_dequeues(test_pq, counters):
+    """Test that dequeuing from the same queue concurrently does not block"""
+    # Given: Two items of a queue, and a worker which dequeued one without
+    # committing yet
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+
+    dequeue = (
+        "UPDATE queue SET dequeued_at = current_timestamp WHERE id = ("
+        "SELECT id FROM queue WHERE q_name = 'one' AND dequeued_at IS NULL "
+        "ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1) RETURNING id"
+    )
+    first, second = get_connection(), get_connection()
+
+    try:
+        with first.cursor() as cursor:
+            cursor.execute(dequeue)
+
+        # When: Another worker dequeues the other item, without waiting
+        with second.cursor() as cursor:
+            cursor.execute("SET lock_timeout = '1s'")
+            cursor.execute(dequeue)
+            dequeued = cursor.fetchone()
+
+        first.commit()
+        second.commit()
+    finally:
+        first.close()
+        second.close()
+
+    # Then: It got its item, and both dequeues are counted
+    with cursor_manager() as cursor:
+        stats = get_queue_stats(cursor)
+
+    assert dequeued is not None
+    assert [(queue.queued, queue.processed) for queue in stats] == [(0, 2)]
+
+
+def test_compact_counters(test_pq, counters):
+    """Test that compacting folds the deltas without changing the counts"""
+    # Given: Changes recorded as deltas
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    _ = test_pq["one"].get()
+
+    # When: They are compacted
+    with cursor_manager() as cursor:
+        compacted = compact_counters(cursor)
+
+        cursor.execute("SELECT COUNT(*) FROM queue_counters_deltas")
+        deltas = cursor.fetchone()[0]
+        stats = get_queue_stats(cursor)
+
+    # Then: They are folded into the counters, which are unchanged
+    assert compacted == 1
+    assert deltas == 0
+    assert [(queue.queued, queue.processed) for queue in stats] == [(1, 1)]
+
+
+def test_counters_track_deletes(test_client, test_pq, counters):
+    """Test that counters follow items being deleted"""
+    # Given: A queue with processed and queued items
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    test_pq["one"].put("item 3")
+    _ = test_pq["one"].get()
+
+    # When: Processed items are deleted, then the queue is emptied
+    test_client.post("/api/v1/queues/one/delete-processed")
+    after_cleanup = test_client.get("/api/v1/queues/").json()["queues"]
+
+    test_client.post("/api/v1/queues/one/delete-queued")
+    after_cancel = test_client.get("/api/v1/queues/").json()["queues"]
+
+    # Then: The counts drop accordingly, and empty queues disappear
+    assert after_cleanup == [
+        {"name": "one", "queued": 2, "processed": 0, "total": 2, "source": "default"}
+    ]
+    assert after_cancel == []
+
+
+def test_counters_counts_existing_items(test_client, test_pq):
+    """Test that installing the counters counts items already in the queue"""
+    # Given: Items added before the counters are installed
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+
+    # When: The counters are installed
+    with cursor_manager() as cursor:
+        install_counters(cursor)
+
+    try:
+        with cursor_manager() as cursor:
+            cursor.execute("SELECT q_name, queued, processed FROM queue_counters")
+            rows = [tuple(row) for row in cursor.fetchall()]
+    finally:
+        with cursor_manager() as cursor:
+            uninstall_counters(cursor)
+
+    # Then: They are counted
+    assert rows == [("one", 2, 0)]
+
+
+def test_reconcile_counters(test_client, test_pq, counters):
+    """Test that reconciling repairs drifted counters"""
+    # Given: Counters which have drifted from the queue table
+    test_pq["one"].put("item 1")
+
+    with cursor_manager() as cursor:
+        cursor.execute("UPDATE queue_counters SET queued = 42")
+
+    # When: They are reconciled
+    with cursor_manager() as cursor:
+        reconcile_counters(cursor)
+
+    # Then: They are correct again
+    response = test_client.get("/api/v1/queues/")
+
+    assert response.json()["queues"] == [
+        {"name": "one", "queued": 1, "processed": 0, "total": 1, "source": "default"}
+    ]
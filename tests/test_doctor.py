@@ -0,0 +1,150 @@
+"""This module contains tests for the index advisor of `pq-dashboard doctor`"""
+from pq_dashboard.config import CountStrategy, settings
+from pq_dashboard.connection import get_connection, get_pool
+from pq_dashboard.data.doctor import create_indexes, diagnose
+from pq_dashboard.data.search import drop_search_indexes
+from pq_dashboard.timing import TimedCursor, normalize_sql
+
+
+def test_diagnose(test_pq):
+    """Test that the dashboard's queries are explained, and indexes recommended"""
+    # Given: Items in two queues
+    for i in range(20):
+        test_pq["one"].put({"number": i})
+    test_pq["two"].put({"number": 0})
+
+    # When: The dashboard's queries are diagnosed
+    with get_pool().connection() as connection:
+        shapes, indexes = diagnose(connection)
+
+    # Then: Each is explained, and the small queue table is scanned
+    names = [shape["name"] for shape in shapes]
+
+    assert "queue stats" in names
+    assert "queue page" in names
+    assert all(shape["statements"] for shape in shapes)
+    assert all(
+        statement["cost"] > 0 and statement["time"] is None
+        for shape in shapes
+        for statement in shape["statements"]
+    )
+    assert any(statement["seq_scans"] for statement in shapes[0]["statements"])
+
+    # And: Indexes serving per-queue queries and searches are recommended
+    recommended = {index["name"] for index in indexes}
+
+    assert "queue_q_name_dequeued_at_idx" in recommended
+    assert "queue_processed_dequeued_at_idx" in recommended
+    assert "queue_data_trgm_idx" in recommended
+    assert "queue_data_jsonb_idx" in recommended
+    assert all(
+        index["definition"].startswith("CREATE INDEX CONCURRENTLY") for index in indexes
+    )
+
+    # And: Unfiltered exact counts, which no index serves, come with a note
+    page = shapes[names.index("item page")]
+
+    assert page["index"] is None
+    assert "PQ_DASH_COUNT_STRATEGY" in page["note"]
+
+
+def test_diagnose_explains_only(test_pq, monkeypatch):
+    """Test that the dashboard's queries are only explained, not run"""
+    # Given: Items, and every statement sent to Postgres being recorded
+    test_pq["one"].put({"number": 1})
+    executed = []
+    execute = TimedCursor.execute
+
+    def recording_execute(self, query, vars=None):
+        executed.append(normalize_sql(self.mogrify(query, vars)))
+        return execute(self, query, vars)
+
+    monkeypatch.setattr(TimedCursor, "execute", recording_execute)
+
+    # When: The dashboard's queries are diagnosed, without a queue
+    with get_pool().connection() as connection:
+        shapes, _ = diagnose(connection)
+
+    # Then: Counts and searches only ran under EXPLAIN
+    costly = [
+        statement
+        for statement in executed
+        if "COUNT(" in statement or "ILIKE" in statement
+    ]
+
+    assert costly
+    assert all(statement.startswith("EXPLAIN (FORMAT JSON)") for statement in costly)
+
+    # And: The per-queue shapes were explained with the queue of the items
+    page = [shape for shape in shapes if shape["name"] == "queue page"][0]
+
+    assert "'one'" in page["statements"][0]["sql"]
+
+
+def test_diagnose_orderings(test_pq, monkeypatch):
+    """Test that sorted pages are diagnosed when counts are not exact"""
+    # Given: Counts which are cached rather than counted with each page
+    monkeypatch.setattr(settings, "COUNT_STRATEGY", CountStrategy.cached)
+    test_pq["one"].put({"number": 1})
+
+    # When: The dashboard's queries are diagnosed, for a given queue
+    with get_pool().connection() as connection:
+        shapes, indexes = diagnose(connection, queue_name="one")
+
+    # Then: Composite indexes matching the orderings are recommended,
+    # partial ones for queued items only
+    definitions = {index["name"]: index["definition"] for index in indexes}
+
+    assert "queue_enqueued_at_id_idx" in definitions
+    assert "queue_q_name_id_idx" in definitions
+    assert definitions["queue_queued_schedule_at_id_idx"].endswith(
+        "(schedule_at, id) WHERE dequeued_at IS NULL"
+    )
+    assert definitions["queue_queued_q_name_enqueued_at_id_idx"].endswith(
+        "(q_name, enqueued_at, id) WHERE dequeued_at IS NULL"
+    )
+
+
+def test_create_indexes(test_pq):
+    """Test that recommended indexes are created, and then no longer recommended"""
+    # Given: Recommended indexes
+    test_pq["one"].put({"number": 1})
+
+    with get_pool().connection() as connection:
+        _, indexes = diagnose(connection)
+
+    # When: They are created, but for the trigram index, which needs pg_trgm
+    indexes = [index for index in indexes if index["kind"] != "trigram"]
+
+    connection = get_connection()
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        created = create_indexes(cursor, indexes)
+
+    with get_pool().connection() as pooled:
+        _, remaining = diagnose(pooled)
+
+    with connection.cursor() as cursor:
+        drop_search_indexes(cursor)
+    connection.close()
+
+    # Then: They exist, so none are recommended anymore
+    assert sorted(created) == sorted(index["name"] for index in indexes)
+    assert [index["kind"] for index in remaining] == ["trigram"]
+
+
+def test_diagnose_analyze(test_pq):
+    """Test that analyzed queries report their execution times"""
+    # Given: An item
+    test_pq["one"].put({"number": 1})
+
+    # When: The dashboard's queries are diagnosed with EXPLAIN ANALYZE
+    with get_pool().connection() as connection:
+        shapes, _ = diagnose(connection, analyze=True)
+
+    # Then: Every statement was timed
+    assert all(
+        statement["time"] is not None
+        for shape in shapes
+        for statement in shape["statements"]
+    )
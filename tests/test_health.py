@@ -20,4 +20,67 @@ def test_get_config(test_client):
         "PGUSER": "postgres",
         "QUEUE_TABLE": "queue",
         "PGPORT": 6543,
+        "SOURCES": [],
+        "SOURCE_TIMEOUT": 10.0,
+        "REPLICA_HOST": None,
+        "REPLICA_PORT": None,
+        "REPLICA_MAX_LAG": 30.0,
+        "REPLICA_LAG_INTERVAL": 5.0,
+        "STATEMENT_TIMEOUT": 30.0,
+        "STATEMENT_TIMEOUTS": {"items": 5.0, "export": 0.0},
+        "POOL_MIN_SIZE": 1,
+        "POOL_MAX_SIZE": 10,
+        "POOL_TIMEOUT": 30.0,
+        "POOL_IDLE_TIMEOUT": 300.0,
+        "POOL_MAX_LIFETIME": 3600.0,
+        "POOL_CHECK_ON_CHECKOUT": True,
+        "DB_WORKERS": 10,
+        "COUNT_STRATEGY": "exact",
+        "COUNT_CACHE_TTL": 10.0,
+        "COUNT_EXACT_THRESHOLD": 10000,
+        "USE_COUNTERS": False,
+        "COUNTERS_TABLE": None,
+        "COUNTERS_COMPACT_INTERVAL": 60.0,
+        "LIVE_DEBOUNCE": 0.5,
+        "LIVE_REFRESH_INTERVAL": 5.0,
+        "LIVE_KEEPALIVE": 15.0,
+        "LIVE_MAX_LOAD": 0.05,
+        "METRICS_ENABLED": False,
+        "METRICS_INTERVAL": 10.0,
+        "METRICS_LOOKBACK": 60.0,
+        "METRICS_HISTORY": 360,
+        "METRICS_WINDOWS": [60, 300, 900],
+        "PROMETHEUS_ENABLED": False,
+        "PROMETHEUS_INTERVAL": 15.0,
+        "PREVIEW_SIZE": 2048,
+        "EXPORT_FETCH_SIZE": 1000,
+        "IMPORT_CHUNK_SIZE": 10000,
+        "BULK_BATCH_SIZE": 5000,
+        "BULK_SLEEP": 0.0,
+        "WATCH_INTERVAL": 1.0,
+        "WATCH_MAX_LOAD": 0.05,
+        "RETENTION_ENABLED": False,
+        "RETENTION_INTERVAL": 300.0,
+        "RETENTION_MAX_AGE": None,
+        "RETENTION_MAX_COUNT": None,
+        "RETENTION_POLICIES": {},
+        "SLOW_QUERY_THRESHOLD": 0.5,
     }
+
+
+def test_get_pool_stats(test_client):
+    """Test that connection pool statistics are reported"""
+    # Given: The health check has used a pooled connection
+    test_client.get("/api/v1/health/check")
+
+    # When: The pool stats are retrieved
+    response = test_client.get("/api/v1/health/pool")
+
+    # Then: The pool holds an idle connection
+    assert response.status_code == 200
+
+    data = response.json()
+
+    assert data["max_size"] == 10
+    assert data["size"] >= 1
+    assert data["in_use"] == 0
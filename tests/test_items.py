@@ -1,4 +1,8 @@
 """This module contains tests for the Items endpoints"""
+import csv
+import io
+import json
+import pickle
 
 
 def test_get_items(test_client, test_pq):
@@ -41,6 +45,46 @@ def test_get_items_filtered_by_queue(test_client, test_pq):
     assert data["offset"] == 0
 
 
+def test_get_items_not_modified(test_client, test_pq):
+    """Test that unchanged item pages are answered with a 304"""
+    # Given: A page of items with an ETag
+    test_pq["one"].put("item 1")
+    response = test_client.get("/api/v1/items/?queue=one")
+    etag = response.headers["etag"]
+
+    assert response.headers["cache-control"] == "no-cache"
+
+    # When: It is fetched again with that ETag
+    unchanged = test_client.get(
+        "/api/v1/items/?queue=one", headers={"If-None-Match": etag}
+    )
+    other_page = test_client.get(
+        "/api/v1/items/?queue=two", headers={"If-None-Match": etag}
+    )
+
+    # Then: Only the same page is not sent again
+    assert unchanged.status_code == 304
+    assert other_page.status_code == 200
+
+    # When: An item is put, then deleted through the API
+    test_pq["one"].put("item 2")
+    after_put = test_client.get(
+        "/api/v1/items/?queue=one", headers={"If-None-Match": etag}
+    )
+    etag = after_put.headers["etag"]
+
+    test_client.delete(f"/api/v1/items/{after_put.json()['records'][0]['id']}")
+    after_delete = test_client.get(
+        "/api/v1/items/?queue=one", headers={"If-None-Match": etag}
+    )
+
+    # Then: Both changes are seen at once
+    assert after_put.status_code == 200
+    assert after_put.json()["total"] == 2
+    assert after_delete.status_code == 200
+    assert after_delete.json()["total"] == 1
+
+
 def test_delete_item(test_client, test_pq):
     """Test deleting an item from a queue"""
     # Given: An item
@@ -121,3 +165,570 @@ def test_get_items_search(test_client, test_pq):
 
     assert response.status_code == 200
     assert len(response.json()["records"]) == 1
+
+
+def test_get_items_keyset_pagination(test_client, test_pq):
+    """Test paging through items with `after` tokens"""
+    # Given: 5 items in a queue
+    for i in range(5):
+        test_pq["one"].put(f"item {i}")
+
+    # When: They are paged through 2 at a time
+    seen = []
+    response = test_client.get("/api/v1/items/?limit=2")
+    while True:
+        data = response.json()
+        seen.extend(record["data"] for record in data["records"])
+
+        if data["next_after"] is None:
+            break
+
+        response = test_client.get(f"/api/v1/items/?limit=2&after={data['next_after']}")
+        assert response.status_code == 200
+
+    # Then: Every item is seen exactly once, in order
+    assert seen == [f"item {i}" for i in range(5)]
+
+
+def test_get_items_keyset_pagination_nullable_column(test_client, test_pq):
+    """Test keyset paging over a column containing NULLs, in both directions"""
+    # Given: 4 items, 2 of which have been dequeued
+    for i in range(4):
+        test_pq["one"].put(f"item {i}")
+    test_pq["one"].get()
+    test_pq["one"].get()
+
+    for order_by in ("dequeuedAt_ASC", "dequeuedAt_DESC", "scheduledAt_DESC"):
+        expected = [
+            record["id"]
+            for record in test_client.get(
+                f"/api/v1/items/?limit=10&order_by={order_by}"
+            ).json()["records"]
+        ]
+
+        # When: They are paged through one at a time
+        seen = []
+        url = f"/api/v1/items/?limit=1&order_by={order_by}"
+        response = test_client.get(url)
+        while True:
+            data = response.json()
+            seen.extend(record["id"] for record in data["records"])
+
+            if data["next_after"] is None:
+                break
+
+            response = test_client.get(f"{url}&after={data['next_after']}")
+
+        # Then: The same items are seen as with one big page
+        assert seen == expected
+
+
+def test_get_items_invalid_page_token(test_client, test_pq):
+    """Test that a malformed or mismatched `after` token is rejected"""
+    # Given: A valid token for one ordering
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    token = test_client.get("/api/v1/items/?limit=1").json()["next_after"]
+
+    # When: It is used with another ordering, or mangled
+    mismatched = test_client.get(f"/api/v1/items/?after={token}&order_by=queue_ASC")
+    mangled = test_client.get("/api/v1/items/?after=not-a-token")
+
+    # Then: Both are rejected
+    assert mismatched.status_code == 400
+    assert mangled.status_code == 400
+
+
+def test_get_items_no_queued_items(test_client, test_pq):
+    """Test totals when every matching item has been processed"""
+    # Given: A queue whose only item has been processed
+    test_pq["one"].put("item 1")
+    _ = test_pq["one"].get()
+
+    # When: Queued items are retrieved
+    response = test_client.get("/api/v1/items/?queue=one&exclude_processed=true")
+
+    # Then: There are none
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+
+def test_get_items_cached_counts(test_client, test_pq, monkeypatch):
+    """Test that cached totals are reused and flagged as approximate"""
+    from pq_dashboard.config import settings
+    from pq_dashboard.data.items import clear_count_cache
+
+    # Given: The cached counting strategy and an item
+    monkeypatch.setattr(settings, "COUNT_STRATEGY", "cached")
+    clear_count_cache()
+    test_pq["one"].put("item 1")
+
+    # When: Items are fetched, then another item is added outside the dashboard
+    first = test_client.get("/api/v1/items/?queue=one").json()
+    test_pq["one"].put("item 2")
+    second = test_client.get("/api/v1/items/?queue=one").json()
+
+    # Then: The second total is the cached one, and says so
+    assert (first["total"], first["total_exact"]) == (1, True)
+    assert (second["total"], second["total_exact"]) == (1, False)
+    assert len(second["records"]) == 2
+
+    clear_count_cache()
+
+
+def test_get_items_estimated_counts(test_client, test_pq, monkeypatch):
+    """Test that estimated totals come from the planner on large tables"""
+    from pq_dashboard.config import settings
+
+    # Given: The estimated counting strategy, with every table "large"
+    monkeypatch.setattr(settings, "COUNT_STRATEGY", "estimated")
+    monkeypatch.setattr(settings, "COUNT_EXACT_THRESHOLD", 0)
+    test_pq["one"].put("item 1")
+
+    # When: Items are fetched
+    response = test_client.get("/api/v1/items/?queue=one")
+
+    # Then: The total is flagged as approximate
+    assert response.status_code == 200
+    assert response.json()["total_exact"] is False
+    assert len(response.json()["records"]) == 1
+
+
+def test_get_items_estimated_counts_small_table(test_client, test_pq, monkeypatch):
+    """Test that small tables are counted exactly under the estimated strategy"""
+    from pq_dashboard.config import settings
+
+    # Given: The estimated counting strategy and a small table
+    monkeypatch.setattr(settings, "COUNT_STRATEGY", "estimated")
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+
+    # When: Items are fetched
+    response = test_client.get("/api/v1/items/?queue=one")
+
+    # Then: The total is exact
+    assert (response.json()["total"], response.json()["total_exact"]) == (2, True)
+
+
+def test_get_items_search_contains(test_client, test_pq):
+    """Test filtering items by JSON containment"""
+    # Given: Items with different payloads
+    test_pq["one"].put({"task": "send", "args": {"to": "alice"}})
+    test_pq["one"].put({"task": "send", "args": {"to": "bob"}})
+    test_pq["one"].put({"task": "receive", "args": {"to": "alice"}})
+
+    # When: Items containing a document are retrieved
+    response = test_client.get(
+        '/api/v1/items/?search_mode=contains&search={"task": "send", "args": {"to": "alice"}}'
+    )
+
+    # Then: Only the matching item is returned
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+    assert response.json()["records"][0]["data"]["args"] == {"to": "alice"}
+
+
+def test_get_items_search_path(test_client, test_pq):
+    """Test filtering items by a JSON path predicate"""
+    # Given: Items with different priorities
+    test_pq["one"].put({"priority": 1})
+    test_pq["one"].put({"priority": 5})
+    test_pq["one"].put({"priority": 9})
+
+    # When: Items matching a predicate are retrieved
+    response = test_client.get("/api/v1/items/?search_mode=path&search=$.priority > 3")
+
+    # Then: Only the matching items are returned
+    assert response.status_code == 200
+    assert response.json()["total"] == 2
+
+
+def test_get_items_search_invalid_terms(test_client, test_pq):
+    """Test that invalid JSON and JSON path terms are rejected"""
+    test_pq["one"].put({"priority": 1})
+
+    contains = test_client.get("/api/v1/items/?search_mode=contains&search={nope")
+    path = test_client.get("/api/v1/items/?search_mode=path&search=$.[[")
+
+    assert contains.status_code == 400
+    assert path.status_code == 400
+
+
+def test_get_items_search_auto_ignores_jsonb_index(test_client, test_pq):
+    """Test that auto searches match the same items whichever indexes exist"""
+    from pq_dashboard.connection import get_connection
+    from pq_dashboard.data.search import create_search_indexes, drop_search_indexes
+
+    # Given: An item whose payload text does not contain the JSON term verbatim
+    test_pq["one"].put({"task": "send", "retries": 3})
+    url = '/api/v1/items/?search={"retries":3}'
+
+    # When: It is searched for without and with a jsonb index
+    without_index = test_client.get(url).json()["total"]
+
+    connection = get_connection()
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        create_search_indexes(cursor, trigram=False, jsonb=True)
+
+    indexes = test_client.get("/api/v1/items/search-indexes").json()
+    with_index = test_client.get(url).json()["total"]
+    contains = test_client.get(url + "&search_mode=contains").json()["total"]
+
+    with connection.cursor() as cursor:
+        drop_search_indexes(cursor)
+    connection.close()
+
+    # Then: Auto searches match the text either way, and only an explicit
+    # containment search finds it
+    assert indexes == {"trigram": False, "jsonb": True}
+    assert without_index == 0
+    assert with_index == 0
+    assert contains == 1
+
+
+def test_bulk_requeue_by_ids(test_client, test_pq):
+    """Test requeueing a list of items"""
+    # Given: 3 items
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    test_pq["one"].put("item 3")
+    ids = [
+        record["id"] for record in test_client.get("/api/v1/items/").json()["records"]
+    ]
+
+    # When: 2 of them are requeued
+    response = test_client.post("/api/v1/items/bulk/requeue", json={"ids": ids[:2]})
+
+    # Then: There are 2 new copies of them
+    assert response.status_code == 200
+    assert response.json() == {"affected": 2}
+
+    data = test_client.get("/api/v1/items/?queue=one").json()
+    assert data["total"] == 5
+    assert [record["data"] for record in data["records"][3:]] == ["item 1", "item 2"]
+
+
+def test_bulk_requeue_by_filter(test_client, test_pq):
+    """Test requeueing processed items from one queue"""
+    # Given: Processed and queued items in 2 queues
+    test_pq["one/pickle"].put({1, 2})
+    test_pq["one"].put("item 2")
+    test_pq["two"].put("item 3")
+    _ = test_pq["one"].get()
+    _ = test_pq["two"].get()
+
+    # When: Processed items in one queue are requeued
+    response = test_client.post(
+        "/api/v1/items/bulk/requeue", json={"queue": "one", "state": "processed"}
+    )
+
+    # Then: Only that item was requeued, and its payload survived
+    assert response.json() == {"affected": 1}
+
+    data = test_client.get("/api/v1/items/?queue=one&state=queued").json()
+    assert data["total"] == 2
+    assert data["records"][-1]["data"] == [1, 2]
+
+
+def test_bulk_delete_by_filter(test_client, test_pq, monkeypatch):
+    """Test deleting matching items in several batches"""
+    from pq_dashboard.config import settings
+
+    # Given: Items matching a search, and one which doesn't
+    monkeypatch.setattr(settings, "BULK_BATCH_SIZE", 2)
+    for i in range(5):
+        test_pq["one"].put({"task": "failed", "n": i})
+    test_pq["one"].put({"task": "ok"})
+
+    # When: The matching items are deleted
+    response = test_client.post(
+        "/api/v1/items/bulk/delete", json={"search": "failed", "search_mode": "text"}
+    )
+
+    # Then: Only those were deleted
+    assert response.json() == {"affected": 5}
+
+    data = test_client.get("/api/v1/items/").json()
+    assert [record["data"] for record in data["records"]] == [{"task": "ok"}]
+
+
+def test_bulk_actions_require_a_selection(test_client, test_pq):
+    """Test that bulk actions refuse to act on every item"""
+    test_pq["one"].put("item 1")
+
+    response = test_client.post("/api/v1/items/bulk/delete", json={})
+
+    assert response.status_code == 400
+    assert test_client.get("/api/v1/items/").json()["total"] == 1
+
+
+def test_get_items_by_state_and_time(test_client, test_pq):
+    """Test filtering items by state and enqueue time"""
+    # Given: A processed item, then queued items after a cutoff
+    test_pq["one"].put("item 1")
+    _ = test_pq["one"].get()
+    cutoff = test_client.get("/api/v1/items/").json()["records"][0]["enqueued_at"]
+    test_pq["one"].put("item 2")
+    test_pq["one"].put("item 3")
+
+    # When: Items are filtered by state and time
+    processed = test_client.get("/api/v1/items/?state=processed").json()
+    later = test_client.get(
+        "/api/v1/items/", params={"enqueued_after": cutoff, "state": "queued"}
+    ).json()
+    earlier = test_client.get(
+        "/api/v1/items/", params={"enqueued_before": cutoff}
+    ).json()
+
+    # Then: Each filter selects the right items
+    assert [r["data"] for r in processed["records"]] == ["item 1"]
+    assert processed["total"] == 1
+    assert [r["data"] for r in later["records"]] == ["item 2", "item 3"]
+    assert later["total"] == 2
+    assert earlier["total"] == 0
+
+
+def test_large_payloads_are_previewed(test_client, test_pq):
+    """Test that lists only carry a preview of large payloads"""
+    from pq_dashboard.config import settings
+
+    # Given: A small and a large item
+    test_pq["one"].put({"small": True})
+    test_pq["one"].put({"large": "x" * (settings.PREVIEW_SIZE * 2)})
+
+    # When: Items are listed
+    response = test_client.get("/api/v1/items/")
+
+    # Then: The small payload is sent in full, and the large as a preview
+    small, large = response.json()["records"]
+
+    assert small["data"] == {"small": True}
+    assert small["truncated"] is False
+    assert small["size"] == len('{"small": true}')
+
+    assert large["data"] is None
+    assert large["truncated"] is True
+    assert large["size"] > settings.PREVIEW_SIZE * 2
+    assert len(large["preview"]) == settings.PREVIEW_SIZE
+    assert large["preview"].startswith('{"large": "xxx')
+
+
+def test_large_pickled_payloads_are_not_previewed(test_client, test_pq):
+    """Test that lists only carry the size of large payloads which are not
+    JSON objects or arrays"""
+    from pq_dashboard.config import settings
+    from pq_dashboard.connection import cursor_manager
+    from pq_dashboard.data.items import get_items
+
+    # Given: A large pickled item, and a large string item
+    test_pq["one/pickle"].put({"large": "x" * (settings.PREVIEW_SIZE * 2)})
+    test_pq["one"].put("x" * (settings.PREVIEW_SIZE * 2))
+
+    # When: Items are listed, with and without their counts
+    response = test_client.get("/api/v1/items/")
+    with cursor_manager() as cursor:
+        items = get_items(cursor)
+
+    # Then: Neither payload is sent, nor previewed, but their size is
+    for record in response.json()["records"] + [item.dict() for item in items]:
+        assert record["data"] is None
+        assert record["preview"] is None
+        assert record["truncated"] is True
+        assert record["size"] > settings.PREVIEW_SIZE * 2
+
+
+def test_scalar_payloads_are_listed_as_strings(test_client, test_pq):
+    """Test that numeric payloads, even wider than 64 bits, list as strings"""
+    # Given: Items with numeric payloads, and a payload holding a wide integer
+    test_pq["one"].put(2**64)
+    test_pq["one"].put(1.5)
+    test_pq["one/pickle"].put(2**70)
+    test_pq["two"].put({"wide": 2**64})
+
+    # When: Items are listed
+    response = test_client.get("/api/v1/items/")
+
+    # Then: The page is sent, with numeric payloads as strings
+    assert response.status_code == 200
+    assert [record["data"] for record in response.json()["records"]] == [
+        str(2**64),
+        "1.5",
+        str(2**70),
+        {"wide": 2**64},
+    ]
+
+
+def test_item_pages_match_validated_pages(test_client, test_pq):
+    """Test that the fast page encoding matches validated ItemPage models"""
+    from fastapi.encoders import jsonable_encoder
+
+    from pq_dashboard.config import settings
+    from pq_dashboard.connection import cursor_manager
+    from pq_dashboard.data.items import get_items
+    from pq_dashboard.schema.item import Item, ItemPage
+
+    # Given: JSON, pickled, large and processed items
+    test_pq["one"].put({"nested": {"list": [1, 2.5, None, "three"]}})
+    test_pq["one/pickle"].put({"pickled": ["a", "b"]})
+    test_pq["two"].put({"large": "x" * (settings.PREVIEW_SIZE * 2)})
+    test_pq["two"].put("processed")
+    _ = test_pq["two"].get()
+
+    # When: They are listed
+    response = test_client.get("/api/v1/items/")
+
+    # Then: The page is what validating and encoding models would give
+    with cursor_manager() as cursor:
+        records = [Item(**dict(item)) for item in get_items(cursor, limit=10)]
+
+    expected = jsonable_encoder(ItemPage(records=records, total=4, limit=10, offset=0))
+
+    assert response.json() == expected
+
+
+def test_items_and_counts_match_separate_queries(test_pq):
+    """Test that fetching a page and its counts in one statement changes neither"""
+    from pq_dashboard.connection import cursor_manager
+    from pq_dashboard.data.items import (
+        encode_page_token,
+        get_item_counts,
+        get_items,
+        get_items_and_counts,
+    )
+
+    # Given: Queued and processed items in two queues
+    for number in range(6):
+        test_pq["one" if number % 2 else "two"].put({"number": number})
+    _ = test_pq["one"].get()
+    _ = test_pq["two"].get()
+
+    with cursor_manager() as cursor:
+        first = get_items(cursor, limit=2, order_by="dequeuedAt_ASC")
+        after = encode_page_token("dequeuedAt_ASC", first[-1])
+
+        pages = [
+            {},
+            {"limit": 2, "offset": 1, "order_by": "enqueuedAt_DESC"},
+            {"limit": 3, "order_by": "queue_ASC", "queue_name": "one"},
+            {"order_by": "dequeuedAt_ASC", "after": after, "limit": 2},
+            {"state": "processed"},
+            {"exclude_processed": True, "search": "number"},
+            {"search": "missing"},
+            {"offset": 100},
+        ]
+
+        for page in pages:
+            # When: A page is fetched with its counts, and separately
+            records, counts = get_items_and_counts(cursor, **page)
+
+            count_filters = {
+                key: value
+                for key, value in page.items()
+                if key in ("queue_name", "search")
+            }
+
+            # Then: Both give the same items and counts
+            assert records == get_items(cursor, **page), page
+            assert counts == get_item_counts(cursor, **count_filters), page
+
+
+def test_get_item(test_client, test_pq):
+    """Test that a single item is fetched with its full, decoded payload"""
+    # Given: A large pickled item
+    test_pq["one/pickle"].put({"large": "x" * 10000})
+    item_id = test_client.get("/api/v1/items/").json()["records"][0]["id"]
+
+    # When: The item and its payload are fetched
+    item = test_client.get(f"/api/v1/items/{item_id}").json()
+    payload = test_client.get(f"/api/v1/items/{item_id}/payload").json()
+
+    # Then: Both have the full payload
+    assert item["id"] == item_id
+    assert item["truncated"] is False
+    assert item["data"] == {"large": "x" * 10000}
+    assert payload == {"large": "x" * 10000}
+
+
+def test_get_missing_item(test_client, test_pq):
+    """Test that fetching a non-existent item is a 404"""
+    assert test_client.get("/api/v1/items/12345").status_code == 404
+    assert test_client.get("/api/v1/items/12345/payload").status_code == 404
+
+
+def test_export_ndjson(test_client, test_pq, monkeypatch):
+    """Test that items are exported as NDJSON, with decoded payloads"""
+    from pq_dashboard.config import settings
+
+    # Given: JSON and pickled items, read a few rows at a time
+    monkeypatch.setattr(settings, "EXPORT_FETCH_SIZE", 2)
+    for i in range(3):
+        test_pq["one"].put({"n": i})
+    test_pq["two/pickle"].put({1, 2})
+
+    # When: Items are exported
+    response = test_client.get("/api/v1/items/export")
+
+    # Then: Every item is exported, one per line
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [(r["q_name"], r["encoding"], r["data"]) for r in records] == [
+        ("one", "json", {"n": 0}),
+        ("one", "json", {"n": 1}),
+        ("one", "json", {"n": 2}),
+        ("two", "pickle", [1, 2]),
+    ]
+    assert records[0]["raw"] is None
+    assert pickle.loads(records[3]["raw"].encode("latin-1")) == {1, 2}
+
+
+def test_export_single_connection(test_client, test_pq, monkeypatch):
+    """Test that an export streams over its request's pooled connection only"""
+    from pq_dashboard.connection import get_pool
+    from pq_dashboard.routers import items
+
+    # Given: Items, and the connections in use recorded while streaming
+    test_pq["one"].put({"n": 1})
+    in_use = []
+    export_items = items.export_items
+
+    def recording_export_items(*args, **kwargs):
+        in_use.append(get_pool().stats()["in_use"])
+        yield from export_items(*args, **kwargs)
+
+    monkeypatch.setattr(items, "export_items", recording_export_items)
+
+    # When: Items are exported
+    response = test_client.get("/api/v1/items/export")
+
+    # Then: A single connection was taken from the pool, and given back
+    assert response.status_code == 200
+    assert in_use == [1]
+    assert get_pool().stats()["in_use"] == 0
+
+
+def test_export_csv_with_filters(test_client, test_pq):
+    """Test that exports take the same filters as the items list"""
+    # Given: Queued and processed items in 2 queues
+    test_pq["one"].put({"n": 1})
+    test_pq["one"].put({"n": 2})
+    test_pq["two"].put({"n": 3})
+    _ = test_pq["one"].get()
+
+    # When: Queued items of one queue are exported as CSV
+    response = test_client.get(
+        "/api/v1/items/export?format=csv&queue=one&exclude_processed=true"
+    )
+
+    # Then: Only that item is exported
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert len(rows) == 1
+    assert rows[0]["q_name"] == "one"
+    assert rows[0]["dequeued_at"] == ""
+    assert json.loads(rows[0]["data"]) == {"n": 2}
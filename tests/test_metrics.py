@@ -0,0 +1,138 @@
+"""This module contains tests for queue throughput and wait time metrics"""
+import pytest
+
+from pq_dashboard.connection import cursor_manager, get_connection
+from pq_dashboard.data.queues import get_queue_activity
+from pq_dashboard.metrics import WAIT_BUCKETS, collector, get_percentile
+
+
+@pytest.fixture
+def metrics(test_pq):
+    """Per-function fixture of the metrics collector, with fresh watermarks"""
+    collector.reset()
+    collector._series.clear()
+    collector.tick()
+
+    yield collector
+
+    collector.reset()
+    collector._series.clear()
+
+
+def test_get_percentile():
+    """Test that percentiles are interpolated within histogram buckets"""
+    buckets = [0] * (len(WAIT_BUCKETS) + 1)
+    # 1 < wait <= 2.5 for every item
+    buckets[WAIT_BUCKETS.index(2.5)] = 10
+
+    assert get_percentile(buckets, 0.5) == pytest.approx(1.75)
+    assert get_percentile(buckets, 1.0) == pytest.approx(2.5)
+    assert get_percentile([0] * len(buckets), 0.5) is None
+
+
+def test_queue_metrics(test_client, test_pq, metrics):
+    """Test that enqueues, dequeues and wait times are counted once"""
+    # Given: Items enqueued and some dequeued since the last tick
+    for i in range(4):
+        test_pq["one"].put(f"item {i}")
+    test_pq["two"].put("item")
+    _ = test_pq["one"].get()
+    _ = test_pq["one"].get()
+
+    with cursor_manager() as cursor:
+        cursor.execute(
+            "UPDATE queue SET enqueued_at = dequeued_at - interval '3 seconds' "
+            "WHERE dequeued_at IS NOT NULL"
+        )
+
+    # When: Metrics are collected twice
+    metrics.tick()
+    _ = test_pq["one"].get()
+    metrics.tick()
+
+    response = test_client.get("/api/v1/queues/one/metrics")
+
+    # Then: Each tick counted only what happened since the previous one
+    data = response.json()
+    first, second = data["series"]
+
+    assert (first["enqueued"], first["dequeued"]) == (4, 2)
+    assert 2.5 < first["wait"]["p50"] <= 5.0
+    assert (second["enqueued"], second["dequeued"]) == (0, 1)
+    assert second["wait"]["p50"] < 1.0
+
+    # And: Windows roll the ticks up
+    window = data["windows"][0]
+
+    assert window["seconds"] == 60
+    assert (window["enqueued"], window["dequeued"]) == (4, 3)
+    assert window["enqueue_rate"] > 0
+
+    # And: Idle queues report nothing
+    two = test_client.get("/api/v1/queues/two/metrics").json()
+
+    assert [point["dequeued"] for point in two["series"]] == [0, 0]
+    assert two["windows"][0]["wait"]["p50"] is None
+
+
+def test_queue_activity_old_items(test_pq):
+    """Test that items queued long before the watermarks count once dequeued"""
+    # Given: An item queued before the watermarks were taken, and newer items
+    test_pq["one"].put("old item")
+
+    with cursor_manager() as cursor:
+        _, watermarks = get_queue_activity(cursor, None, WAIT_BUCKETS)
+
+    for i in range(3):
+        test_pq["two"].put(f"item {i}")
+
+    # When: The old item is dequeued, and activity read since the watermarks
+    _ = test_pq["one"].get()
+
+    with cursor_manager() as cursor:
+        activity, new_watermarks = get_queue_activity(cursor, watermarks, WAIT_BUCKETS)
+
+    # Then: Its dequeue is counted, and the new items' enqueues
+    assert activity["one"]["enqueued"] == 0
+    assert activity["one"]["dequeued"] == 1
+    assert activity["two"]["enqueued"] == 3
+    assert activity["two"]["dequeued"] == 0
+    assert new_watermarks["last_id"] == watermarks["last_id"] + 3
+
+
+def test_queue_activity_late_commits(test_pq):
+    """Test that items committed after the watermarks were read are counted once"""
+    # Given: A transaction which dequeued an item and enqueued another, and
+    # a newer item committed first
+    test_pq["one"].put("item 1")
+    worker = get_connection()
+
+    with worker.cursor() as cursor:
+        cursor.execute(
+            "UPDATE queue SET dequeued_at = current_timestamp "
+            "WHERE q_name = 'one' AND dequeued_at IS NULL"
+        )
+        cursor.execute("INSERT INTO queue (q_name, data) VALUES ('one', '\"item 2\"')")
+
+    try:
+        with cursor_manager() as cursor:
+            _, watermarks = get_queue_activity(cursor, None, WAIT_BUCKETS)
+
+        test_pq["one"].put("item 3")
+
+        with cursor_manager() as cursor:
+            first, watermarks = get_queue_activity(cursor, watermarks, WAIT_BUCKETS)
+
+        # When: The transaction commits after the watermarks passed it
+        worker.commit()
+    finally:
+        worker.close()
+
+    with cursor_manager() as cursor:
+        second, watermarks = get_queue_activity(cursor, watermarks, WAIT_BUCKETS)
+        third, _ = get_queue_activity(cursor, watermarks, WAIT_BUCKETS)
+
+    # Then: Its enqueue and dequeue are counted by the next read only
+    assert (first["one"]["enqueued"], first["one"]["dequeued"]) == (1, 0)
+    assert (second["one"]["enqueued"], second["one"]["dequeued"]) == (1, 1)
+    assert third == {}
@@ -0,0 +1,95 @@
+"""This module contains tests for the connection pool"""
+import threading
+
+import pytest
+
+from pq_dashboard.connection import get_connection
+from pq_dashboard.pool import ConnectionPool, PoolTimeout
+
+
+def test_connections_are_reused(test_config):
+    """Test that a returned connection is handed out again"""
+    # Given: A pool
+    pool = ConnectionPool(get_connection, min_size=0, max_size=2)
+
+    # When: A connection is checked out and returned twice
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    # Then: Only one connection was ever opened
+    assert first is second
+    assert pool.stats()["connections_opened"] == 1
+
+    pool.close()
+
+
+def test_pool_timeout(test_config):
+    """Test that checkouts beyond max size time out"""
+    # Given: A pool with all of its connections checked out
+    pool = ConnectionPool(get_connection, min_size=0, max_size=1, timeout=0.1)
+    connection = pool.getconn()
+
+    # When/Then: Another checkout times out
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    assert pool.stats()["timeouts"] == 1
+
+    pool.putconn(connection)
+    pool.close()
+
+
+def test_waiting_checkout_gets_returned_connection(test_config):
+    """Test that a waiting checkout is woken up when a connection is returned"""
+    # Given: A pool with all of its connections checked out
+    pool = ConnectionPool(get_connection, min_size=0, max_size=1, timeout=5)
+    connection = pool.getconn()
+    checked_out = []
+
+    waiter = threading.Thread(target=lambda: checked_out.append(pool.getconn()))
+    waiter.start()
+
+    # When: The connection is returned
+    pool.putconn(connection)
+    waiter.join(timeout=5)
+
+    # Then: The waiting thread received it
+    assert checked_out == [connection]
+
+    pool.putconn(connection)
+    pool.close()
+
+
+def test_broken_connections_are_replaced(test_config):
+    """Test that closed connections are discarded on checkout"""
+    # Given: A pool holding a connection which has since been closed
+    pool = ConnectionPool(get_connection, min_size=1, max_size=1)
+    with pool.connection() as connection:
+        pass
+    connection.close()
+
+    # When: A connection is checked out
+    with pool.connection() as replacement:
+        # Then: It is a new, working connection
+        assert replacement is not connection
+        assert not replacement.closed
+
+    pool.close()
+
+
+def test_max_lifetime(test_config):
+    """Test that connections past their max lifetime are not reused"""
+    # Given: A pool whose connections expire immediately
+    pool = ConnectionPool(get_connection, min_size=0, max_size=1, max_lifetime=1e-9)
+
+    # When: A connection is checked out and returned
+    with pool.connection() as connection:
+        pass
+
+    # Then: It has been closed
+    assert connection.closed
+    assert pool.stats()["size"] == 0
+
+    pool.close()
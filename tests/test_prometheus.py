@@ -0,0 +1,72 @@
+"""This module contains tests for the Prometheus metrics endpoint"""
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.prometheus import exporter, format_labels
+
+
+def get_samples(text):
+    """Parse the samples of a Prometheus text format page"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_format_labels():
+    """Test that label values are escaped"""
+    assert format_labels({"queue": 'a"b\\c\nd'}) == '{queue="a\\"b\\\\c\\nd"}'
+
+
+def test_metrics_disabled(test_client):
+    """Test that metrics are not served unless enabled"""
+    # Given: The default settings
+    # When: Metrics are scraped
+    response = test_client.get("/metrics")
+
+    # Then: They are not found
+    assert response.status_code == 404
+
+
+def test_metrics(test_client, test_pq, monkeypatch):
+    """Test that scrapes are served from the last collection"""
+    # Given: Prometheus metrics enabled, and queued, overdue and processed items
+    monkeypatch.setattr(settings, "PROMETHEUS_ENABLED", True)
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+    test_pq["two"].put("item 3")
+    _ = test_pq["one"].get()
+
+    with cursor_manager() as cursor:
+        cursor.execute(
+            "UPDATE queue SET enqueued_at = now() - interval '1 minute', "
+            "expected_at = now() - interval '1 second' WHERE q_name = 'two'"
+        )
+
+    # When: Metrics are collected, then scraped
+    exporter.collect()
+    response = test_client.get("/metrics")
+
+    # Then: Every queue has its gauges
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    samples = get_samples(response.text)
+
+    assert samples['pq_dashboard_queue_queued{queue="one",source="default"}'] == 1
+    assert samples['pq_dashboard_queue_processed{queue="one",source="default"}'] == 1
+    assert samples['pq_dashboard_queue_overdue{queue="one",source="default"}'] == 0
+    assert samples['pq_dashboard_queue_overdue{queue="two",source="default"}'] == 1
+    assert (
+        samples[
+            'pq_dashboard_queue_oldest_queued_age_seconds{queue="two",source="default"}'
+        ]
+        >= 60
+    )
+    assert samples['pq_dashboard_collector_duration_seconds_bucket{le="+Inf"}'] >= 1
+
+    # And: Further scrapes don't query the database
+    test_pq["one"].put("item 4")
+
+    assert test_client.get("/metrics").text == response.text
@@ -1,4 +1,9 @@
 """This module contains tests for the Queue endpoints"""
+import json
+
+import requests
+
+from pq_dashboard.connection import cursor_manager
 
 
 def test_get_queue_statistics(test_client, test_pq):
@@ -16,12 +21,30 @@ def test_get_queue_statistics(test_client, test_pq):
     # Then: The queue stats are correct
     assert response.status_code == 200
 
-    results = {x["name"]: x for x in response.json()}
+    results = {x["name"]: x for x in response.json()["queues"]}
 
     assert results == {
-        "one": {"name": "one", "queued": 1, "processed": 0, "total": 1},
-        "two": {"name": "two", "queued": 1, "processed": 0, "total": 1},
-        "three": {"name": "three", "queued": 0, "processed": 1, "total": 1},
+        "one": {
+            "name": "one",
+            "queued": 1,
+            "processed": 0,
+            "total": 1,
+            "source": "default",
+        },
+        "two": {
+            "name": "two",
+            "queued": 1,
+            "processed": 0,
+            "total": 1,
+            "source": "default",
+        },
+        "three": {
+            "name": "three",
+            "queued": 0,
+            "processed": 1,
+            "total": 1,
+            "source": "default",
+        },
     }
 
 
@@ -42,7 +65,9 @@ def test_deleted_queued(test_client, test_pq):
     # Then: Only the processed item remains
     response = test_client.get("/api/v1/queues/")
 
-    assert response.json() == [{"name": "one", "queued": 0, "processed": 1, "total": 1}]
+    assert response.json()["queues"] == [
+        {"name": "one", "queued": 0, "processed": 1, "total": 1, "source": "default"}
+    ]
 
 
 def test_delete_processed(test_client, test_pq):
@@ -62,4 +87,175 @@ def test_delete_processed(test_client, test_pq):
     # Then: Only the queued items remain
     response = test_client.get("/api/v1/queues/")
 
-    assert response.json() == [{"name": "one", "queued": 2, "processed": 0, "total": 2}]
+    assert response.json()["queues"] == [
+        {"name": "one", "queued": 2, "processed": 0, "total": 2, "source": "default"}
+    ]
+
+
+def read_event(lines):
+    """Read the next Server-Sent Event from an iterator of lines"""
+    event = {}
+    for line in lines:
+        if line.startswith("event: "):
+            event["event"] = line[len("event: ") :]
+        elif line.startswith("data: "):
+            event["data"] = json.loads(line[len("data: ") :])
+        elif line == "" and event:
+            return event
+
+
+def test_queue_events(live_server, test_pq, monkeypatch):
+    """Test that queue changes are pushed to event stream subscribers"""
+    from pq_dashboard.config import settings
+
+    monkeypatch.setattr(settings, "LIVE_DEBOUNCE", 0.05)
+
+    # Given: A queue, and two subscribers to the event stream
+    test_pq["one"].put("item 1")
+
+    streams = [
+        requests.get(f"{live_server}/api/v1/queues/events", stream=True, timeout=5)
+        for _ in range(2)
+    ]
+    lines = [stream.iter_lines(decode_unicode=True) for stream in streams]
+    snapshots = [read_event(stream_lines) for stream_lines in lines]
+
+    # When: An item is added to the queue
+    test_pq["one"].put("item 2")
+    updates = [read_event(stream_lines) for stream_lines in lines]
+
+    for stream in streams:
+        stream.close()
+
+    # Then: Both got a snapshot, then the change, from one shared listener
+    for snapshot, update in zip(snapshots, updates):
+        assert snapshot == {
+            "event": "snapshot",
+            "data": [
+                {
+                    "name": "one",
+                    "queued": 1,
+                    "processed": 0,
+                    "total": 1,
+                    "source": "default",
+                }
+            ],
+        }
+        assert update == {
+            "event": "queues",
+            "data": {
+                "changed": [
+                    {
+                        "name": "one",
+                        "queued": 2,
+                        "processed": 0,
+                        "total": 2,
+                        "source": "default",
+                    }
+                ],
+                "removed": [],
+                "deltas": {"one": {"queued": 1, "processed": 0, "total": 1}},
+            },
+        }
+
+
+def test_queue_events_debounce(test_pq, monkeypatch):
+    """Test that live stats are fetched less often when counting them is slow,
+    unless the counters are installed"""
+    from pq_dashboard.config import settings
+    from pq_dashboard.connection import cursor_manager
+    from pq_dashboard.data.counters import install_counters, uninstall_counters
+    from pq_dashboard.live import QueueEventBroadcaster
+
+    # Given: A broadcaster whose counting took a second
+    broadcaster = QueueEventBroadcaster()
+    broadcaster.duration = 1.0
+
+    # Then: It coalesces notifications for long enough to bound the load
+    assert broadcaster.debounce == 1.0 / settings.LIVE_MAX_LOAD - 1.0
+
+    # When: The counters are installed, and stats fetched
+    test_pq["one"].put("item 1")
+    with cursor_manager() as cursor:
+        install_counters(cursor)
+    try:
+        stats = broadcaster._fetch_stats()
+    finally:
+        with cursor_manager() as cursor:
+            uninstall_counters(cursor)
+
+    # Then: They are read from the counters, and coalesced as configured
+    assert [(queue.name, queue.queued) for queue in stats] == [("one", 1)]
+    assert broadcaster.debounce == settings.LIVE_DEBOUNCE
+
+
+def test_delete_processed_in_batches(test_client, test_pq, monkeypatch):
+    """Test that processed items are deleted in batches, and counted"""
+    from pq_dashboard.config import settings
+
+    # Given: 5 processed items and 1 queued item
+    monkeypatch.setattr(settings, "BULK_BATCH_SIZE", 2)
+    for i in range(6):
+        test_pq["one"].put(f"item {i}")
+    for _ in range(5):
+        _ = test_pq["one"].get()
+
+    # When: Processed items are deleted
+    response = test_client.post("/api/v1/queues/one/delete-processed")
+
+    # Then: Every processed item was deleted across the batches
+    assert response.json() == {"affected": 5}
+
+    response = test_client.get("/api/v1/queues/")
+
+    assert response.json()["queues"] == [
+        {"name": "one", "queued": 1, "processed": 0, "total": 1, "source": "default"}
+    ]
+
+
+def test_delete_older_than(test_client, test_pq):
+    """Test that only items older than a cutoff are deleted"""
+    # Given: 2 queued items, one enqueued an hour ago
+    test_pq["one"].put("item 1")
+    test_pq["one"].put("item 2")
+
+    with cursor_manager() as cursor:
+        cursor.execute(
+            "UPDATE queue SET enqueued_at = now() - interval '1 hour' "
+            "WHERE id = (SELECT min(id) FROM queue)"
+        )
+
+    # When: Queued items older than 10 minutes are deleted
+    response = test_client.post("/api/v1/queues/one/delete-queued?older_than=600")
+
+    # Then: Only the old item was deleted
+    assert response.json() == {"affected": 1}
+
+    response = test_client.get("/api/v1/items/")
+
+    assert [record["data"] for record in response.json()["records"]] == ["item 2"]
+
+
+def test_get_queue_statistics_not_modified(test_client, test_pq):
+    """Test that unchanged queue stats are answered with a 304"""
+    # Given: Queue stats with an ETag
+    test_pq["one"].put("item 1")
+    response = test_client.get("/api/v1/queues/")
+    etag = response.headers["etag"]
+
+    # When: They are fetched again with that ETag
+    response = test_client.get("/api/v1/queues/", headers={"If-None-Match": etag})
+
+    # Then: They are not sent again
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    # When: An item is dequeued
+    _ = test_pq["one"].get()
+
+    response = test_client.get("/api/v1/queues/", headers={"If-None-Match": etag})
+
+    # Then: The new stats are sent at once
+    assert response.status_code == 200
+    assert response.json()["queues"][0]["processed"] == 1
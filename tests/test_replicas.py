@@ -0,0 +1,97 @@
+"""This module contains tests for routing reads to a read replica"""
+import pytest
+
+from pq_dashboard import replicas
+from pq_dashboard.config import settings
+from pq_dashboard.connection import close_pool, get_pool
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Per-function fixture configuring a replica, by default the test
+    database itself, which is never lagging as it is not replicating"""
+
+    def set_replica(host="localhost", port=6543):
+        monkeypatch.setattr(settings, "REPLICA_HOST", host)
+        monkeypatch.setattr(settings, "REPLICA_PORT", port)
+        replicas._lags.clear()
+
+    yield set_replica
+
+    close_pool()
+    replicas._lags.clear()
+
+
+def test_reads_use_replica(test_client, test_pq, replica):
+    """Test that reads are sent to a replica which is keeping up"""
+    # Given: A replica
+    test_pq["one"].put("item 1")
+    replica()
+
+    # When: Queue stats and items are read
+    queues = test_client.get("/api/v1/queues/")
+    items = test_client.get("/api/v1/items/")
+
+    # Then: They were read from the replica, and say how far behind it is
+    for response in (queues, items):
+        assert response.status_code == 200
+        assert response.headers["x-replication-lag"] == "default;from=replica;lag=0.000"
+
+    assert get_pool(replica=True).stats()["size"] >= 1
+
+
+def test_lagging_replica_falls_back_to_primary(
+    test_client, test_pq, replica, monkeypatch
+):
+    """Test that reads go to the primary while the replica lags too far behind"""
+    # Given: A replica lagging behind by more than the maximum lag
+    replica()
+    monkeypatch.setattr(
+        replicas, "get_replication_lag", lambda cursor: settings.REPLICA_MAX_LAG + 1
+    )
+
+    # When: Queue stats are read
+    response = test_client.get("/api/v1/queues/")
+
+    # Then: They were read from the primary
+    assert response.status_code == 200
+    assert response.headers["x-replication-lag"] == "default;from=primary;lag=0.000"
+
+
+def test_unreachable_replica_falls_back_to_primary(test_client, test_pq, replica):
+    """Test that reads go to the primary while the replica is down"""
+    # Given: A replica which cannot be connected to
+    replica(host="127.0.0.1", port=1)
+    test_pq["one"].put("item 1")
+
+    # When: Items are read
+    response = test_client.get("/api/v1/items/")
+
+    # Then: They were read from the primary
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+    assert response.headers["x-replication-lag"] == "default;from=primary;lag=0.000"
+
+
+def test_writes_use_primary(test_client, test_pq, replica):
+    """Test that writes are not routed to the replica"""
+    # Given: A replica, and an item
+    replica(host="127.0.0.1", port=1)
+    test_pq["one"].put("item 1")
+    item_id = test_client.get("/api/v1/items/").json()["records"][0]["id"]
+
+    # When: The item is deleted
+    response = test_client.delete(f"/api/v1/items/{item_id}")
+
+    # Then: The primary was written to, without checking on the replica
+    assert response.status_code == 200
+    assert "x-replication-lag" not in response.headers
+    assert test_client.get("/api/v1/items/").json()["total"] == 0
+
+
+def test_no_replica(test_client, test_pq):
+    """Test that responses only report replication lag when there is a replica"""
+    response = test_client.get("/api/v1/queues/")
+
+    assert response.status_code == 200
+    assert "x-replication-lag" not in response.headers
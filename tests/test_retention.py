@@ -0,0 +1,105 @@
+"""This module contains tests for applying retention policies"""
+from datetime import timedelta
+
+import pytest
+
+from pq_dashboard.config import RetentionPolicy, settings
+from pq_dashboard.connection import get_connection
+from pq_dashboard.retention import get_lock_name, retention
+
+
+@pytest.fixture
+def policies(monkeypatch):
+    """Per-function fixture setting retention policies"""
+
+    def set_policies(**kwargs):
+        for key, value in kwargs.items():
+            monkeypatch.setattr(settings, key, value)
+
+    return set_policies
+
+
+def process(queue, count):
+    """Put and take `count` items, leaving them processed"""
+    for i in range(count):
+        queue.put(f"item {i}")
+    for _ in range(count):
+        _ = queue.get()
+
+
+def test_retain_max_count(test_client, test_pq, policies):
+    """Test that only the newest processed items of a queue are kept"""
+    # Given: A queue with 5 processed items and 1 queued item, allowed 2
+    process(test_pq["one"], 5)
+    test_pq["one"].put("queued")
+    policies(RETENTION_POLICIES={"one": RetentionPolicy(max_count=2)})
+
+    # When: Retention is applied
+    run = retention.run_once()
+
+    # Then: The 3 oldest processed items were deleted
+    assert run["sources"]["default"]["error"] is None
+    assert run["sources"]["default"]["deleted"] == {"one": 3}
+
+    response = test_client.get("/api/v1/items/?queue=one")
+    assert [record["data"] for record in response.json()["records"]] == [
+        "item 3",
+        "item 4",
+        "queued",
+    ]
+
+
+def test_retain_max_age(test_client, test_pq, policies):
+    """Test that processed items past the default max age are deleted"""
+    # Given: Processed items in 2 queues, one of which was processed long ago
+    process(test_pq["one"], 2)
+    process(test_pq["two"], 1)
+
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE queue SET dequeued_at = now() - interval '2 days' WHERE q_name = 'one'"
+        )
+    connection.commit()
+    connection.close()
+
+    policies(RETENTION_MAX_AGE=timedelta(days=1))
+
+    # When: Retention is applied
+    run = retention.run_once()
+
+    # Then: Only the old items were deleted
+    assert run["sources"]["default"]["deleted"] == {"one": 2, "two": 0}
+
+    response = test_client.get("/api/v1/queues/")
+    assert response.json()["queues"] == [
+        {"name": "two", "queued": 0, "processed": 1, "total": 1, "source": "default"}
+    ]
+
+
+def test_retain_skips_when_locked(test_client, test_pq, policies):
+    """Test that retention is only applied by one process at a time"""
+    # Given: Another process holding the retention lock
+    process(test_pq["one"], 2)
+    policies(RETENTION_MAX_COUNT=0)
+
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (get_lock_name(),))
+
+    # When: Retention is applied
+    try:
+        run = retention.run_once()
+    finally:
+        connection.close()
+
+    # Then: The run was skipped
+    assert run["sources"]["default"]["acquired_lock"] is False
+    assert run["sources"]["default"]["deleted"] == {}
+
+    # And: It is reported on the health router
+    response = test_client.get("/api/v1/health/retention")
+    assert response.json()["last_run"]["sources"]["default"]["acquired_lock"] is False
+
+    # And: It runs once the lock is released
+    assert retention.run_once()["sources"]["default"]["deleted"] == {"one": 2}
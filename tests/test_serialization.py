@@ -0,0 +1,37 @@
+"""This module contains tests for the fast JSON encoding of responses"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from pq_dashboard import serialization
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps(monkeypatch, use_orjson):
+    """Test that both encoders handle the values unpickled payloads may hold"""
+    # Given: The encoder under test
+    if not use_orjson:
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    # When: Values JSON cannot hold as is are encoded
+    content = serialization.dumps(
+        {
+            "at": datetime(2021, 8, 1, 12, 30, 15, 250, tzinfo=timezone.utc),
+            "tags": ("a", "b"),
+            "counts": {1: "one"},
+            "text": "café",
+            "wide": 2**64,
+        }
+    )
+
+    # Then: They are encoded as exports encode them
+    assert json.loads(content) == {
+        "at": "2021-08-01T12:30:15.000250+00:00",
+        "tags": ["a", "b"],
+        "counts": {"1": "one"},
+        "text": "café",
+        "wide": 2**64,
+    }
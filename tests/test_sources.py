@@ -0,0 +1,276 @@
+"""This module contains tests for monitoring several sources at once"""
+import time
+
+import psycopg2
+import pytest
+import requests
+from pq import PQ
+
+from pq_dashboard.config import Source, settings
+from pq_dashboard.connection import close_pool, get_connection
+from pq_dashboard.data.queues import get_queue_stats
+
+DSN = "host=localhost port=6543 user=postgres password=postgres dbname=postgres"
+
+
+@pytest.fixture
+def sources(test_pq, monkeypatch):
+    """Per-function fixture of two sources in the test database, each with a
+    queue table, and a third source whose database is unreachable"""
+    connection = get_connection()
+    other_pq = PQ(connection, table="queue_other")
+    other_pq.create()
+
+    monkeypatch.setattr(
+        settings,
+        "SOURCES",
+        [
+            Source(name="main", dsn=DSN, queue_table="queue"),
+            Source(name="other", dsn=DSN, queue_table="queue_other"),
+            Source(name="down", dsn="host=127.0.0.1 port=1 dbname=postgres"),
+        ],
+    )
+
+    yield test_pq, other_pq
+
+    close_pool()
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE queue_other")
+    connection.commit()
+    connection.close()
+
+
+def test_queue_stats_span_sources(test_client, sources):
+    """Test that queue stats of every source are merged, despite a source being down"""
+    # Given: Items in the queue tables of two sources
+    main_pq, other_pq = sources
+    main_pq["one"].put("item 1")
+    other_pq["one"].put("item 2")
+    other_pq["two"].put("item 3")
+
+    # When: The queue stats are retrieved
+    response = test_client.get("/api/v1/queues/")
+
+    # Then: Both sources' queues are listed, and the unreachable source's error
+    assert response.status_code == 200
+
+    data = response.json()
+
+    assert data["sources"] == ["main", "other", "down"]
+    assert sorted(data["queues"], key=lambda queue: queue["name"]) == [
+        {"name": "one", "queued": 1, "processed": 0, "total": 1, "source": "main"},
+        {"name": "one", "queued": 1, "processed": 0, "total": 1, "source": "other"},
+        {"name": "two", "queued": 1, "processed": 0, "total": 1, "source": "other"},
+    ]
+    assert [error["source"] for error in data["errors"]] == ["down"]
+
+    # And: Partial statistics carry no ETag
+    assert "etag" not in response.headers
+
+
+def test_items_span_sources(test_client, sources):
+    """Test that items of every source are merged in order"""
+    # Given: Items put alternately in two sources
+    main_pq, other_pq = sources
+    main_pq["one"].put("item 1")
+    other_pq["one"].put("item 2")
+    main_pq["one"].put("item 3")
+
+    # When: Items are listed across sources, then from one source
+    merged = test_client.get("/api/v1/items/", params={"limit": 2, "offset": 1})
+    single = test_client.get("/api/v1/items/", params={"source": "other"})
+
+    # Then: Pages are sliced from the merged items, ordered by enqueue time
+    assert merged.status_code == 200
+
+    data = merged.json()
+
+    assert [(record["data"], record["source"]) for record in data["records"]] == [
+        ("item 2", "other"),
+        ("item 3", "main"),
+    ]
+    assert data["total"] == 3
+    assert data["next_after"] is None
+    assert [error["source"] for error in data["errors"]] == ["down"]
+
+    assert single.status_code == 200
+    assert [record["data"] for record in single.json()["records"]] == ["item 2"]
+    assert single.json()["errors"] == []
+
+
+def test_page_tokens_need_a_source(test_client, sources):
+    """Test that keyset pages are only served within one source"""
+    # When: A page token is used across sources
+    response = test_client.get("/api/v1/items/", params={"after": "token"})
+
+    # Then: The request is rejected
+    assert response.status_code == 400
+
+
+def test_unknown_source(test_client, sources):
+    """Test that naming a source which is not configured is a 404"""
+    response = test_client.get("/api/v1/items/", params={"source": "missing"})
+
+    assert response.status_code == 404
+
+
+def test_queue_events_per_source(live_server, sources, monkeypatch):
+    """Test that each source's queue stats stream from its own listener"""
+    from tests.test_queues import read_event
+
+    # Given: A queue in each source, and a subscriber to the second source
+    main_pq, other_pq = sources
+    main_pq["one"].put("item 1")
+    other_pq["two"].put("item 1")
+    monkeypatch.setattr(settings, "LIVE_DEBOUNCE", 0.05)
+
+    stream = requests.get(
+        f"{live_server}/api/v1/queues/events",
+        params={"source": "other"},
+        stream=True,
+        timeout=5,
+    )
+    lines = stream.iter_lines(decode_unicode=True)
+    snapshot = read_event(lines)
+
+    # When: An item is put in the second source
+    other_pq["two"].put("item 2")
+    update = read_event(lines)
+    stream.close()
+
+    # Then: Only that source's queues are streamed, and its notifications heard
+    assert [(queue["source"], queue["name"]) for queue in snapshot["data"]] == [
+        ("other", "two")
+    ]
+    assert update["data"]["deltas"] == {
+        "two": {"queued": 1, "processed": 0, "total": 1}
+    }
+
+    # And: Unknown sources are not streamed
+    missing = requests.get(
+        f"{live_server}/api/v1/queues/events", params={"source": "missing"}
+    )
+    assert missing.status_code == 404
+
+
+def test_slow_source_times_out(test_client, sources, monkeypatch):
+    """Test that a slow source is reported rather than holding up the others"""
+    # Given: A source whose queue stats take longer than the source timeout
+    main_pq, _ = sources
+    main_pq["one"].put("item 1")
+    monkeypatch.setattr(settings, "SOURCE_TIMEOUT", 0.5)
+
+    def slow_get_queue_stats(cursor):
+        if cursor.connection.source_name == "other":
+            cursor.execute("SELECT pg_sleep(5)")
+        return get_queue_stats(cursor)
+
+    monkeypatch.setattr(
+        "pq_dashboard.routers.queues.get_queue_stats", slow_get_queue_stats
+    )
+
+    # When: The queue stats are retrieved
+    start = time.monotonic()
+    response = test_client.get("/api/v1/queues/")
+    elapsed = time.monotonic() - start
+
+    # Then: The other sources are returned once the slow one timed out
+    assert response.status_code == 200
+    assert elapsed < 2
+
+    data = response.json()
+
+    assert [queue["source"] for queue in data["queues"]] == ["main"]
+    assert sorted(error["source"] for error in data["errors"]) == ["down", "other"]
+
+
+def test_source_timeout_outlives_commits(test_pq, monkeypatch):
+    """Test that the source timeout still applies after a data function
+    commits, and is lifted once it returns"""
+    from pq_dashboard.fanout import query_source
+
+    # Given: A source timeout, and a data function which commits midway
+    monkeypatch.setattr(settings, "SOURCE_TIMEOUT", 0.2)
+
+    def commit_then_sleep(cursor):
+        cursor.execute("SELECT 1")
+        cursor.connection.commit()
+        cursor.execute("SELECT pg_sleep(2)")
+
+    def show_timeout(cursor):
+        cursor.execute("SHOW statement_timeout")
+        return cursor.fetchone()[0]
+
+    # When: It is run against the source
+    start = time.monotonic()
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        query_source("default", commit_then_sleep)
+    elapsed = time.monotonic() - start
+
+    # Then: Its queries after the commit are timed out too
+    assert elapsed < 1
+
+    # And: The source's connections are left with the default timeout
+    monkeypatch.setattr(settings, "SOURCE_TIMEOUT", 0)
+    assert query_source("default", show_timeout) == "0"
+
+
+def test_background_work_spans_sources(test_client, sources, monkeypatch):
+    """Test that metrics, Prometheus and retention cover every source, and
+    keep going past the sources which fail"""
+    from pq_dashboard.config import RetentionPolicy
+    from pq_dashboard.metrics import MetricsCollector
+    from pq_dashboard.prometheus import PrometheusExporter
+    from pq_dashboard.retention import RetentionRunner
+
+    # Given: Processed items in a queue of each reachable source
+    main_pq, other_pq = sources
+    monkeypatch.setattr(
+        settings, "RETENTION_POLICIES", {"one": RetentionPolicy(max_count=0)}
+    )
+    sampler = MetricsCollector()
+    sampler.tick()
+
+    for queue in (main_pq["one"], other_pq["one"], other_pq["one"]):
+        queue.put("item")
+        _ = queue.get()
+
+    # When: Metrics are collected, exported and retention applied
+    sampler.tick()
+    exporter = PrometheusExporter()
+    with pytest.raises(psycopg2.OperationalError):
+        exporter.collect()
+    run = RetentionRunner().run_once()
+
+    # Then: Each source's queue is counted apart
+    assert sampler.get_totals()["main"]["one"]["dequeued"] == 1
+    assert sampler.get_totals()["other"]["one"]["dequeued"] == 2
+    assert sampler.get_window("one", 60, "other").dequeued == 2
+
+    assert 'pq_dashboard_queue_processed{queue="one",source="main"} 1' in exporter.text
+    assert 'pq_dashboard_queue_processed{queue="one",source="other"} 2' in exporter.text
+    assert "pq_dashboard_collector_errors_total 1" in exporter.text
+
+    # And: Retention applied to both, and reported the unreachable source
+    assert run["sources"]["main"]["deleted"] == {"one": 1}
+    assert run["sources"]["other"]["deleted"] == {"one": 2}
+    assert run["sources"]["down"]["error"] is not None
+
+
+def test_health_check_reports_sources(test_client, sources):
+    """Test that the health check lists the sources which cannot be queried"""
+    response = test_client.get("/api/v1/health/check")
+
+    assert response.status_code == 200
+    assert response.json()["still"] == "alive"
+    assert [error["source"] for error in response.json()["errors"]] == ["down"]
+
+
+def test_config_redacts_source_passwords(test_client, sources):
+    """Test that source DSNs are shown without their passwords"""
+    response = test_client.get("/api/v1/health/config")
+
+    dsn = response.json()["SOURCES"][0]["dsn"]
+
+    assert "password=***" in dsn
+    assert "postgres password=postgres" not in dsn
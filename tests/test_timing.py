@@ -0,0 +1,183 @@
+"""This module contains tests for request timing instrumentation"""
+import logging
+
+from pq_dashboard.config import settings
+from pq_dashboard.connection import cursor_manager
+from pq_dashboard.timing import get_params_shape, histograms, normalize_sql
+
+
+def get_server_timing(header):
+    """Parse a Server-Timing header into durations keyed by name"""
+    timings = {}
+    for entry in header.split(","):
+        name, *params = entry.strip().split(";")
+        for param in params:
+            key, value = param.split("=", 1)
+            if key == "dur":
+                timings[name] = float(value)
+    return timings
+
+
+def test_normalize_sql():
+    """Test that whitespace is collapsed in logged statements"""
+    assert normalize_sql("SELECT id\n    FROM queue\n  WHERE id = %s ") == (
+        "SELECT id FROM queue WHERE id = %s"
+    )
+
+
+def test_get_params_shape():
+    """Test that parameter shapes show types but not values"""
+    assert get_params_shape(("secret", 1, [1, 2])) == "(str, int, list[2])"
+    assert get_params_shape({"name": "secret"}) == "{name: str}"
+    assert get_params_shape(None) == "()"
+
+
+def test_server_timing(test_client, test_pq):
+    """Test that API responses report the time spent in each phase"""
+    # Given: Some queued items
+    test_pq["timing"].put({"key": "value"})
+    test_pq["timing"].put({"key": "other value"})
+
+    # When: Items are listed
+    response = test_client.get("/api/v1/items/")
+
+    # Then: Server-Timing reports the phases of the request
+    assert response.status_code == 200
+
+    timings = get_server_timing(response.headers["server-timing"])
+
+    for name in (
+        "db",
+        "get_items_and_counts",
+        "decode",
+        "endpoint",
+        "serialize",
+        "total",
+    ):
+        assert name in timings
+
+    assert timings["total"] >= timings["endpoint"] >= timings["get_items_and_counts"]
+    assert 'desc="' in response.headers["server-timing"]
+
+
+def test_timing_histograms(test_client, test_pq):
+    """Test that phase timings are aggregated across requests"""
+    # Given: No timings recorded yet
+    histograms.clear()
+
+    # When: Queues are listed twice
+    test_client.get("/api/v1/queues/")
+    test_client.get("/api/v1/queues/")
+
+    response = test_client.get("/api/v1/health/timings")
+
+    # Then: Both requests are in the histograms
+    assert response.status_code == 200
+
+    data = response.json()
+
+    assert data["get_queue_stats"]["count"] == 2
+    assert data["total"]["count"] >= 2
+    assert data["total"]["max"] >= data["total"]["mean"] > 0
+    assert data["total"]["p50"] is not None
+
+
+def test_slow_query_log(test_pq, caplog, monkeypatch):
+    """Test that statements over the threshold are logged without their values"""
+    # Given: A threshold every statement exceeds
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD", 1e-9)
+
+    # When: A statement is run
+    with caplog.at_level(logging.WARNING, logger="pq_dashboard.timing"):
+        with cursor_manager() as cursor:
+            cursor.execute(
+                "SELECT id\n  FROM queue WHERE q_name = %s", ("secret queue",)
+            )
+
+    # Then: Its normalized SQL and parameter shape are logged
+    messages = [record.getMessage() for record in caplog.records]
+
+    assert any(
+        "SELECT id FROM queue WHERE q_name = %s params: (str)" in message
+        for message in messages
+    )
+    assert not any("secret queue" in message for message in messages)
+
+
+def test_serialize_timing(test_client, test_pq, monkeypatch):
+    """Test that serialization is timed apart from connection pool waits
+    within the endpoint"""
+    import time
+
+    import fastapi.routing
+
+    from pq_dashboard import replicas
+
+    # Given: Connections which take a while to get from the pool, and
+    # responses which take a while to serialize
+    get_pool = replicas.get_pool
+    serialize_response = fastapi.routing.serialize_response
+
+    class SlowPool:
+        def __init__(self, pool):
+            self.pool = pool
+
+        def getconn(self):
+            time.sleep(0.1)
+            return self.pool.getconn()
+
+        def __getattr__(self, name):
+            return getattr(self.pool, name)
+
+    async def slow_serialize_response(*args, **kwargs):
+        time.sleep(0.1)
+        return await serialize_response(*args, **kwargs)
+
+    monkeypatch.setattr(
+        replicas,
+        "get_pool",
+        lambda *args, **kwargs: SlowPool(get_pool(*args, **kwargs)),
+    )
+    monkeypatch.setattr(fastapi.routing, "serialize_response", slow_serialize_response)
+
+    # When: Queues are listed
+    response = test_client.get("/api/v1/queues/")
+
+    # Then: Pool waits are timed in the endpoint, and serialization on its own
+    timings = get_server_timing(response.headers["server-timing"])
+
+    assert timings["pool"] >= 200
+    assert timings["endpoint"] >= timings["pool"]
+    assert 100 <= timings["serialize"] < 200
+
+
+def test_record_from_threads():
+    """Test that phases recorded concurrently by several threads all count"""
+    import contextvars
+    import threading
+
+    from pq_dashboard.timing import RequestTimings, _timings, record
+
+    # Given: A request's timings
+    timings = RequestTimings()
+    token = _timings.set(timings)
+
+    # When: Threads running its blocking work record phases at once
+    def work():
+        for _ in range(10000):
+            record("db", 1.0)
+
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(work,))
+        for _ in range(4)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        _timings.reset(token)
+
+    # Then: None of them are lost
+    assert timings["db"] == 40000.0
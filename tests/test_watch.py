@@ -0,0 +1,66 @@
+"""This module contains tests for the live queue statistics of `stats --watch`"""
+import pytest
+
+from pq_dashboard.connection import get_connection
+from pq_dashboard.watch import StatsWatcher, get_watch_interval, sort_queues
+
+
+def test_get_watch_interval():
+    """Test that slow polls are spaced out to keep the database mostly idle"""
+    # Given: Polls allowed to keep the database busy 5% of the time
+    # When/Then: Fast polls run at the shortest interval
+    assert get_watch_interval(0.01, 1.0, 0.05) == 1.0
+
+    # When/Then: A poll taking 0.5s waits 9.5s, so polls take 5% of the time
+    assert get_watch_interval(0.5, 1.0, 0.05) == pytest.approx(9.5)
+
+
+def test_stats_watcher(test_pq):
+    """Test that watched queues report changes and rates since the last poll"""
+    # Given: A watcher which polled queues once
+    test_pq["one"].put("item 0")
+    test_pq["one"].put("item 1")
+
+    connection = get_connection()
+    watcher = StatsWatcher(connection, interval=0.1)
+    first = watcher.poll()
+
+    # When: Items are enqueued and dequeued, and queues polled again
+    for i in range(3):
+        test_pq["one"].put(f"item {i}")
+    test_pq["two"].put("item")
+    _ = test_pq["one"].get()
+
+    second = {queue["name"]: queue for queue in watcher.poll()}
+    connection.close()
+
+    # Then: The first poll only has counts
+    assert first == [
+        {
+            "name": "one",
+            "queued": 2,
+            "processed": 0,
+            "total": 2,
+            "queued_delta": None,
+            "processed_delta": None,
+            "enqueue_rate": None,
+            "dequeue_rate": None,
+        }
+    ]
+
+    # And: The second poll has the changes since, and rates for every queue
+    assert second["one"]["queued"] == 4
+    assert second["one"]["queued_delta"] == 2
+    assert second["one"]["processed_delta"] == 1
+    assert second["one"]["enqueue_rate"] > 0
+    assert second["one"]["dequeue_rate"] > 0
+    assert second["two"]["queued_delta"] is None
+    assert second["two"]["enqueue_rate"] > 0
+
+    # And: Polls are no more frequent than asked for
+    assert watcher.interval >= 0.1
+
+    # And: Queues sort by rate, busiest first
+    assert [
+        queue["name"] for queue in sort_queues(list(second.values()), "dequeue_rate")
+    ] == ["one", "two"]